@@ -0,0 +1,67 @@
+# Etat des comptes (index des soldes)
+class AccountState():
+
+    def __init__(self):
+        """
+        Index des soldes maintenu de façon incrémentale :
+            - received : total reçu par compte dans les blocs validés
+            - sent : total envoyé par compte dans les blocs validés
+        (le total envoyé dans les transactions en cours est tenu par le Mempool)
+
+        Le solde d'un compte se lit alors en O(1), quelle que soit la hauteur de la chaine.
+        """
+        self.received = {}
+        self.sent = {}
+
+
+    def apply_block(self, block):
+        """
+        Ajoute les transactions d'un bloc validé à l'index
+
+        :param block: <Block> bloc ajouté en haut de la chaine
+        """
+        # l'envoyeur paye le montant et les frais (les frais sont dans la récompense du mineur)
+        for transaction in block.transactions:
+            self.sent[transaction.sender] = self.sent.get(transaction.sender, 0) + transaction.cost
+            self.received[transaction.receiver] = self.received.get(transaction.receiver, 0) + transaction.amount
+
+
+    def revert_block(self, block):
+        """
+        Retire les transactions d'un bloc de l'index (bloc supprimé lors d'un remplacement de chaine)
+
+        :param block: <Block> bloc retiré du haut de la chaine
+        """
+        for transaction in block.transactions:
+            self._decrease(self.sent, transaction.sender, transaction.cost)
+            self._decrease(self.received, transaction.receiver, transaction.amount)
+
+
+    def copy(self):
+        """
+        Retourne une copie indépendante de l'index (ex: pour vérifier des blocs sans modifier l'index courant)
+        """
+        state = AccountState()
+        state.received = dict(self.received)
+        state.sent = dict(self.sent)
+        return state
+
+
+    def balance(self, account):
+        """
+        Retourne le solde validé du compte : reçu - envoyé
+
+        :param account: clé publique du compte
+        :return <number>: solde du compte
+        """
+        return self.received.get(account, 0) - self.sent.get(account, 0)
+
+
+    @staticmethod
+    def _decrease(totals, account, amount):
+        # Supprime l'entrée quand le total retombe à 0 pour ne pas garder de comptes vides
+        remaining = totals.get(account, 0) - amount
+        if remaining:
+            totals[account] = remaining
+        else:
+            totals.pop(account, None)
@@ -0,0 +1,118 @@
+import os
+import random
+import sys
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from account_state import AccountState
+from block import Block, genesis_block
+from blockchain import Blockchain, MINING_REWARD
+from difficulty import DifficultyAdjuster
+from header import BLOCK_VERSION
+from mining import ProofOfWorkEngine
+from transaction import Transaction
+from wallet import Wallet
+
+"""
+Générateurs de données synthétiques pour les benchmarks :
+    - comptes (wallets avec de vraies clés RSA)
+    - transactions signées entre ces comptes
+    - chaine de blocs valide (PoW, signatures, soldes)
+    - blockchain chargée avec cette chaine et des transactions en cours
+
+Les données dépendent uniquement de la graine (seed) et des paramètres,
+sauf les clés et signatures (RSA) qui sont aléatoires
+"""
+
+
+def make_accounts(count):
+    """
+    Crée count wallets (la génération des clés RSA prend ~50 ms par compte)
+    """
+    accounts = []
+    for _ in range(count):
+        wallet = Wallet()
+        wallet.create_keys()
+        accounts.append(wallet)
+    return accounts
+
+
+def make_transaction(sender, receiver, amount, fee=0):
+    """
+    Crée une transaction signée par le wallet sender
+    """
+    signature = sender.sign_transaction(sender.public_key, receiver.public_key, amount, fee)
+    return Transaction(sender.public_key, receiver.public_key, signature, amount, fee)
+
+
+def make_transactions(accounts, count, state=None, amount=1, rng=None, max_fee=0):
+    """
+    Crée count transactions entre des comptes tirés au hasard
+    Si state est donné, seuls les comptes qui ont encore assez de solde envoient
+
+    :param state: <AccountState> optionnel, soldes disponibles (non modifié)
+    :param max_fee: frais maximaux (tirés au hasard entre 0 et max_fee)
+    :return <list>: liste de <Transaction>
+    """
+    rng = rng or random.Random(0)
+    spent = {}
+    transactions = []
+    for _ in range(count):
+        fee = rng.randint(0, max_fee)
+        if state is None:
+            senders = accounts
+        else:
+            senders = [a for a in accounts
+                       if state.balance(a.public_key) - spent.get(a.public_key, 0) >= amount + fee]
+            if not senders:
+                break
+        sender = rng.choice(senders)
+        receiver = rng.choice(accounts)
+        spent[sender.public_key] = spent.get(sender.public_key, 0) + amount + fee
+        transactions.append(make_transaction(sender, receiver, amount, fee))
+    return transactions
+
+
+def make_chain(accounts, blocks, tx_per_block, seed=0, adjuster=None):
+    """
+    Crée une chaine valide de blocks blocs (en plus du bloc de genèse)
+    Les premiers blocs distribuent les récompenses de minage aux comptes, les suivants
+    contiennent tx_per_block transactions (dans la limite des soldes)
+    Les dates des blocs sont espacées du temps visé (la cible ne change pas d'un ajustement à l'autre)
+
+    :param adjuster: <DifficultyAdjuster> optionnel, règle d'ajustement de la cible
+    :return <list>: liste de <Block>
+    """
+    rng = random.Random(seed)
+    adjuster = adjuster or DifficultyAdjuster()
+    engine = ProofOfWorkEngine()
+    state = AccountState()
+    chain = [genesis_block()]
+    start = time() - (blocks + 1) * adjuster.interval
+    for index in range(1, blocks + 1):
+        miner = accounts[(index - 1) % len(accounts)]
+        transactions = []
+        if index > len(accounts):
+            transactions = make_transactions(accounts, tx_per_block, state, rng=rng)
+        last_hash = chain[-1].get_hash()
+        target = adjuster.next_target(chain.__getitem__, index)
+        timestamp = start + index * adjuster.interval
+        transactions.append(Transaction('Mining reward', miner.public_key, '', MINING_REWARD))
+        prefix = Blockchain.template_header(last_hash, transactions, target, timestamp)
+        proof = engine.search(prefix, target)
+        block = Block(index, last_hash, transactions, proof, timestamp, target, BLOCK_VERSION)
+        state.apply_block(block)
+        chain.append(block)
+    return chain
+
+
+def make_blockchain(chain, public_key=None, pending=(), adjuster=None):
+    """
+    Crée une blockchain (en mémoire) contenant la chaine et les transactions en cours pending
+    """
+    blockchain = Blockchain(public_key, adjuster=adjuster)
+    blockchain.switch_chain(1, chain[1:])
+    for transaction in pending:
+        blockchain.current_transactions.add(transaction)
+    return blockchain
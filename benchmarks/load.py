@@ -0,0 +1,197 @@
+import importlib.util
+import logging
+import os
+import random
+import statistics
+import sys
+import threading
+from argparse import ArgumentParser
+from time import perf_counter, sleep
+
+import requests
+from werkzeug.serving import make_server
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from blockchain import Blockchain
+from difficulty import DifficultyAdjuster
+from miner import BackgroundMiner
+from sync import ChainSynchronizer
+from wallet import Wallet
+
+from results import save_results, load_results, report, THRESHOLD
+
+"""
+Test de charge de bout en bout : plusieurs noeuds (node.py) lancés dans ce processus sur localhost
+    - chaque noeud a son wallet, ses voisins sont tous les autres noeuds
+    - des clients envoient des /create_transaction en parallèle à des noeuds tirés au hasard
+    - pendant ce temps, chaque noeud reçoit des /mine à intervalle régulier
+Mesure le débit et la latence (médiane, p95, p99) de chaque route et les erreurs,
+puis vérifie que les noeuds ont convergé vers la même chaine
+
+Usage : python benchmarks/load.py [--nodes 3] [--clients 8] [--duration 10]
+                                  [-o results.json] [-b baseline.json] [-t 0.10]
+"""
+
+
+def load_node_module(name):
+    """
+    Charge une copie indépendante de node.py (sa propre app Flask et ses propres variables globales)
+    """
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, 'node.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+# Noeud lancé dans un thread du processus courant
+class LocalNode():
+
+    def __init__(self, number, block_interval):
+        self.module = load_node_module('bench_node_{}'.format(number))
+        self.module.wallet = Wallet()
+        self.module.blockchain = Blockchain(None, adjuster=DifficultyAdjuster(interval=block_interval))
+        self.module.miner = BackgroundMiner(self.module.blockchain)
+        self.module.synchronizer = ChainSynchronizer(self.module.blockchain)
+        self.server = make_server('127.0.0.1', 0, self.module.app, threaded=True)
+        self.address = '127.0.0.1:{}'.format(self.server.server_port)
+        # adresse annoncée lors des échanges de pairs (voir peers.py)
+        self.module.blockchain.nodes.address = self.address
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+
+    def start(self):
+        self.thread.start()
+
+
+    def stop(self):
+        self.server.shutdown()
+        self.module.blockchain.nodes.stop()
+        self.module.blockchain.broadcaster.executor.shutdown(wait=False)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def summarize(name, latencies, errors, duration):
+    """
+    Résultats d'une route : débit (requêtes/s) et latences (ms)
+    """
+    results = {
+        name + '_throughput': {'value': len(latencies) / duration, 'unit': 'req/s', 'better': 'higher'},
+        name + '_errors': {'value': errors, 'unit': 'req', 'better': 'lower'}
+    }
+    if latencies:
+        for label, value in (('p50', statistics.median(latencies)), ('p95', percentile(latencies, 0.95)),
+                             ('p99', percentile(latencies, 0.99))):
+            results['{}_latency_{}'.format(name, label)] = {'value': value * 1000, 'unit': 'ms', 'better': 'lower'}
+    return results
+
+
+def run(nodes, clients, duration, mine_interval, seed):
+    rng = random.Random(seed)
+    session = requests.Session()
+    lock = threading.Lock()
+    latencies = {'create_transaction': [], 'mine': []}
+    errors = {'create_transaction': 0, 'mine': 0}
+
+    def post(route, node, json=None):
+        start = perf_counter()
+        try:
+            ok = session.post('http://{}/{}'.format(node.address, route), json=json, timeout=30).status_code < 300
+        except requests.RequestException:
+            ok = False
+        with lock:
+            if ok:
+                latencies[route].append(perf_counter() - start)
+            else:
+                errors[route] += 1
+
+    # Wallets, voisins, puis un bloc miné par noeud pour avoir un solde
+    for node in nodes:
+        session.get('http://{}/wallet'.format(node.address))
+    for node in nodes:
+        for other in nodes:
+            if other is not node:
+                session.post('http://{}/add_node'.format(node.address), json={'node': other.address})
+    for node in nodes:
+        session.post('http://{}/mine'.format(node.address))
+        sleep(0.2)
+
+    stop = threading.Event()
+
+    def client():
+        while not stop.is_set():
+            # receveur nouveau à chaque fois : deux transactions identiques seraient refusées (doublon)
+            # montant minime (strictement positif) : les récompenses de minage couvrent toutes les transactions
+            with lock:
+                node = rng.choice(nodes)
+                receiver = '{:0324x}'.format(rng.getrandbits(1296))
+            post('create_transaction', node, {'receiver': receiver, 'amount': 0.001})
+
+    def mine(node):
+        while not stop.wait(mine_interval):
+            post('mine', node)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    threads += [threading.Thread(target=mine, args=(node,)) for node in nodes]
+    start = perf_counter()
+    for thread in threads:
+        thread.start()
+    sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - start
+
+    results = {}
+    for route in latencies:
+        results.update(summarize(route, latencies[route], errors[route], elapsed))
+
+    # Convergence : un dernier bloc départage les branches, puis les noeuds se synchronisent
+    session.post('http://{}/mine'.format(nodes[0].address))
+    sleep(1)
+    for node in nodes:
+        session.post('http://{}/sync'.format(node.address))
+    tips = [session.get('http://{}/chain/info'.format(node.address)).json() for node in nodes]
+    results['height'] = {'value': max(tip['height'] for tip in tips), 'unit': 'blocks', 'better': 'higher'}
+    results['diverged_nodes'] = {'value': len(set(tip['tip'] for tip in tips)) - 1, 'unit': 'nodes',
+                                 'better': 'lower'}
+    return results
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--mine-interval', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', default=None)
+    parser.add_argument('-b', '--baseline', default=None)
+    parser.add_argument('-t', '--threshold', type=float, default=THRESHOLD)
+    args = parser.parse_args()
+
+    # Pas de log par requête
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    # temps visé entre deux blocs : celui des /mine envoyés pendant le test
+    nodes = [LocalNode(i, args.mine_interval / args.nodes) for i in range(args.nodes)]
+    for node in nodes:
+        node.start()
+    print('{} noeuds : {}'.format(len(nodes), ', '.join(node.address for node in nodes)))
+    try:
+        results = run(nodes, args.clients, args.duration, args.mine_interval, args.seed)
+    finally:
+        for node in nodes:
+            node.stop()
+
+    baseline = load_results(args.baseline) if args.baseline else None
+    regressions = report(results, baseline, args.threshold)
+    if args.output:
+        save_results(args.output, results, vars(args))
+    sys.exit(1 if regressions else 0)
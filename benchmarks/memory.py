@@ -0,0 +1,65 @@
+import os
+import sys
+import tracemalloc
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from transaction import Transaction
+
+"""
+Compare la mémoire occupée par N transactions :
+    - représentation d'origine : objet avec __dict__, clés et signature en strings hexadécimales
+      (une string par transaction, comme après décodage d'une requête JSON)
+    - représentation actuelle : __slots__, clés internées (keytable), signature en octets
+
+Usage : python benchmarks/memory.py [-n 1000000] [-a 1000]
+"""
+
+
+# Transaction telle qu'elle était stockée avant (__dict__ + strings hexadécimales)
+class DictTransaction():
+    def __init__(self, s, r, sign, am):
+        self.sender = s
+        self.receiver = r
+        self.signature = sign
+        self.amount = am
+
+
+def random_accounts(count):
+    # clés publiques RSA 1024 bits en DER = 162 octets
+    return [os.urandom(162).hex() for _ in range(count)]
+
+
+def measure(build, count, accounts):
+    """
+    Construit count transactions avec build et retourne la mémoire allouée (octets)
+    """
+    tracemalloc.start()
+    transactions = []
+    for i in range(count):
+        # copie des strings : chaque transaction reçue a ses propres strings
+        sender = ''.join(accounts[i % len(accounts)])
+        receiver = ''.join(accounts[(i * 7 + 1) % len(accounts)])
+        signature = os.urandom(128).hex()
+        transactions.append(build(sender, receiver, signature, i % 100))
+        del sender, receiver, signature
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('-n', '--count', type=int, default=1000000)
+    parser.add_argument('-a', '--accounts', type=int, default=1000)
+    args = parser.parse_args()
+
+    accounts = random_accounts(args.accounts)
+    before = measure(DictTransaction, args.count, accounts)
+    after = measure(Transaction, args.count, accounts)
+
+    print('{} transactions, {} comptes'.format(args.count, args.accounts))
+    print('__dict__ + hex : {:10.1f} Mo ({:.0f} octets/transaction)'.format(before / 1e6, before / args.count))
+    print('__slots__ + octets : {:10.1f} Mo ({:.0f} octets/transaction)'.format(after / 1e6, after / args.count))
+    print('gain : {:.1f}x'.format(before / after))
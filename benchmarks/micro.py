@@ -0,0 +1,122 @@
+import itertools
+import os
+import random
+import sys
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from block import Block
+from validation import ChainValidator
+from verification import verifier
+from wallet import Wallet
+from blockchain import MINING_REWARD
+from difficulty import DifficultyAdjuster
+from header import LEGACY_BLOCK_VERSION
+
+from generators import make_accounts, make_chain, make_transactions, make_blockchain
+from results import measure, save_results, load_results, report, THRESHOLD
+
+"""
+Microbenchmarks des fonctions critiques de la blockchain :
+    - valid_proof (en-tête binaire / ancien format), hash_block (bloc non hashé / hash déjà calculé), get_balance
+    - Wallet.verify_transaction (signature non vérifiée / déjà en cache)
+    - proof_of_work, choix des transactions du bloc (select_template), check_chain
+
+Usage : python benchmarks/micro.py [--blocks 50] [--tx-per-block 20] [--accounts 20]
+                                   [-o results.json] [-b baseline.json] [-t 0.10]
+Code de sortie 1 si un résultat est en régression par rapport à la baseline
+"""
+
+
+def copy_block(block, version=None):
+    # Copie non hashée du bloc (le hash d'un bloc est gardé après le premier calcul)
+    return Block(block.index, block.previous_hash, block.transactions, block.proof, block.timestamp, block.target,
+                 block.version if version is None else version)
+
+
+def run(chain, blockchain, accounts, repeat):
+    results = {}
+    blocks = chain[1:]
+    last = blocks[-1]
+
+    # PoW d'un bloc non hashé : en-tête de taille fixe (racine de Merkle comprise) / repr des transactions
+    unhashed = []
+    results['valid_proof'] = measure(
+        lambda: blockchain.valid_proof(unhashed.pop()), repeat, 200,
+        setup=lambda: unhashed.extend(copy_block(last) for _ in range(200)))
+    results['valid_proof_legacy'] = measure(
+        lambda: blockchain.valid_proof(unhashed.pop()), repeat, 200,
+        setup=lambda: unhashed.extend(copy_block(last, LEGACY_BLOCK_VERSION) for _ in range(200)))
+
+    copies = []
+    results['hash_block'] = measure(
+        lambda: blockchain.hash_block(copies.pop()), repeat, len(blocks),
+        setup=lambda: copies.extend(copy_block(b) for b in blocks))
+    results['hash_block_cached'] = measure(lambda: blockchain.hash_block(last), repeat, 1000)
+
+    keys = itertools.cycle([a.public_key for a in accounts])
+    results['get_balance'] = measure(lambda: blockchain.get_balance(next(keys)), repeat, 1000)
+
+    # pas de transactions si la chaine n'a que des blocs de récompenses (--blocks <= --accounts) : mesures omises
+    transactions = [t for b in blocks for t in b.transactions[:-1]][:200]
+    if transactions:
+        cycle = itertools.cycle(transactions)
+        results['verify_transaction'] = measure(
+            lambda: Wallet.verify_transaction(next(cycle)), repeat, len(transactions),
+            setup=verifier.verified.clear)
+        for t in transactions:
+            Wallet.verify_transaction(t)
+        results['verify_transaction_cached'] = measure(lambda: Wallet.verify_transaction(next(cycle)), repeat, 1000)
+    else:
+        print('verify_transaction omis : aucune transaction dans la chaine (--blocks doit dépasser --accounts)')
+
+    results['proof_of_work'] = measure(lambda: blockchain.proof_of_work(1), repeat, 10)
+
+    reward = blockchain.reward_transaction(0)
+    results['select_template'] = measure(
+        lambda: blockchain.template.select(blockchain.current_transactions, reward, blockchain.account_state.balance),
+        repeat, 20)
+
+    # Validation complète (sans checkpoint, signatures non vérifiées)
+    validator = ChainValidator(DifficultyAdjuster(), MINING_REWARD)
+    results['check_chain'] = measure(lambda: validator.validate(chain), repeat, 1, setup=verifier.verified.clear)
+    return results
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=20)
+    parser.add_argument('--blocks', type=int, default=50)
+    parser.add_argument('--tx-per-block', type=int, default=20)
+    parser.add_argument('--pending', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', default=None)
+    parser.add_argument('-b', '--baseline', default=None)
+    parser.add_argument('-t', '--threshold', type=float, default=THRESHOLD)
+    args = parser.parse_args()
+    for name in ('accounts', 'blocks', 'tx_per_block', 'repeat'):
+        if getattr(args, name) < 1:
+            parser.error('--{} doit être au moins 1'.format(name.replace('_', '-')))
+    if args.pending < 0:
+        parser.error('--pending doit être positif ou nul')
+
+    print('Génération : {} comptes, {} blocs, {} transactions par bloc'.format(
+        args.accounts, args.blocks, args.tx_per_block))
+    accounts = make_accounts(args.accounts)
+    chain = make_chain(accounts, args.blocks, args.tx_per_block, args.seed)
+    blockchain = make_blockchain(chain, accounts[0].public_key)
+    pending = make_transactions(accounts, args.pending, blockchain.account_state, rng=random.Random(args.seed),
+                                max_fee=2)
+    for transaction in pending:
+        blockchain.current_transactions.add(transaction)
+
+    results = run(chain, blockchain, accounts, args.repeat)
+    verifier.close()
+
+    baseline = load_results(args.baseline) if args.baseline else None
+    regressions = report(results, baseline, args.threshold)
+    if args.output:
+        save_results(args.output, results, vars(args))
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,82 @@
+import os
+import sys
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from codec import encode_block, decode_block
+from compact import CompactBlock, encode_block_transactions
+from mempool import Mempool
+
+from generators import make_accounts, make_chain
+from results import measure, save_results, load_results, report, THRESHOLD
+
+"""
+Benchmark du relais des blocs minés : bloc complet (/store-received-block) / bloc compact (/compact-block)
+    - octets envoyés à un noeud qui a toutes les transactions du bloc, ou seulement une partie (--known)
+    - temps d'encodage, de décodage et de reconstruction depuis les transactions en cours
+
+Usage : python benchmarks/relay.py [--tx-per-block 200] [--accounts 20] [--known 0.9]
+                                   [--repeat 5] [-o results.json] [-b baseline.json] [-t 0.10]
+Code de sortie 1 si un résultat est en régression par rapport à la baseline
+"""
+
+
+def size(value):
+    # résultat de taille (octets) au format de results.measure
+    return {'value': value, 'unit': 'bytes', 'better': 'lower'}
+
+
+def run(block, known, repeat):
+    results = {}
+    full = encode_block(block)
+    compact = CompactBlock.from_block(block)
+    data = compact.encode()
+    mined = block.transactions[:-1]
+
+    # transactions en cours du receveur : une partie des transactions du bloc
+    mempool = Mempool()
+    for transaction in mined[:int(len(mined) * known)]:
+        mempool.add(transaction)
+    _, missing = compact.reconstruct(mempool)
+    request = encode_block_transactions(block.get_hash(), [mined[position] for position in missing])
+
+    results['full_block_bytes'] = size(len(full))
+    results['compact_block_bytes'] = size(len(data))
+    results['compact_partial_bytes'] = size(len(data) + len(request))
+    results['full_encode'] = measure(lambda: encode_block(block), repeat, 20)
+    results['full_decode'] = measure(lambda: decode_block(full), repeat, 20)
+    results['compact_encode'] = measure(lambda: CompactBlock.from_block(block).encode(), repeat, 20)
+
+    complete = Mempool()
+    for transaction in mined:
+        complete.add(transaction)
+
+    def reconstruct():
+        received = CompactBlock.decode(data)
+        transactions, _ = received.reconstruct(complete)
+        received.to_block(transactions)
+    results['compact_reconstruct'] = measure(reconstruct, repeat, 20)
+    return results
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--tx-per-block', type=int, default=200)
+    parser.add_argument('--accounts', type=int, default=20)
+    parser.add_argument('--known', type=float, default=0.9)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('-o', '--output', default=None)
+    parser.add_argument('-b', '--baseline', default=None)
+    parser.add_argument('-t', '--threshold', type=float, default=THRESHOLD)
+    args = parser.parse_args()
+
+    accounts = make_accounts(args.accounts)
+    chain = make_chain(accounts, args.accounts + 1, args.tx_per_block)
+    results = run(chain[-1], args.known, args.repeat)
+
+    baseline = load_results(args.baseline) if args.baseline else None
+    regressions = report(results, baseline, args.threshold)
+    if args.output:
+        save_results(args.output, results, vars(args))
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,113 @@
+import json
+import platform
+import statistics
+import sys
+from time import perf_counter, time
+
+"""
+Mesure des temps et résultats des benchmarks au format JSON
+Comparaison avec des résultats de référence (baseline) pour détecter les régressions
+
+Format d'un résultat : {"value": 12.5, "unit": "us", "better": "lower", ...}
+    - better : lower (temps, latence) ou higher (débit)
+"""
+
+# écart relatif (par défaut) au-delà duquel un résultat est une régression
+THRESHOLD = 0.10
+
+
+def measure(function, repeat=5, number=100, setup=None):
+    """
+    Mesure le temps d'un appel de function (en microsecondes)
+    function est appelée number fois par mesure, la mesure est répétée repeat fois
+
+    :param setup: fonction optionnelle appelée avant chaque mesure (non mesurée)
+    :return <dict>: résultat (médiane des mesures, min, max, appels par seconde)
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((perf_counter() - start) / number * 1e6)
+    median = statistics.median(timings)
+    return {
+        'value': median,
+        'unit': 'us',
+        'better': 'lower',
+        'min': min(timings),
+        'max': max(timings),
+        'ops_per_second': 1e6 / median if median else None,
+        'repeat': repeat,
+        'number': number
+    }
+
+
+def environment():
+    """
+    Description de la machine (pour savoir si deux résultats sont comparables)
+    """
+    return {
+        'python': sys.version.split()[0],
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'date': time()
+    }
+
+
+def save_results(path, results, parameters=None):
+    data = {
+        'environment': environment(),
+        'parameters': parameters or {},
+        'results': results
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """
+    Compare les résultats avec la baseline
+
+    :param threshold: écart relatif toléré (0.10 = 10%)
+    :return <list>: (nom, baseline, valeur, écart relatif, régression) pour chaque résultat présent dans les deux
+    """
+    comparison = []
+    for name, result in results.items():
+        if name not in baseline or not baseline[name]['value']:
+            continue
+        before = baseline[name]['value']
+        after = result['value']
+        change = (after - before) / before
+        if result.get('better', 'lower') == 'lower':
+            regression = change > threshold
+        else:
+            regression = change < -threshold
+        comparison.append((name, before, after, change, regression))
+    return comparison
+
+
+def report(results, baseline=None, threshold=THRESHOLD):
+    """
+    Affiche les résultats (et la comparaison avec la baseline)
+
+    :return <int>: nombre de régressions
+    """
+    comparison = {c[0]: c for c in compare(results, baseline, threshold)} if baseline else {}
+    regressions = 0
+    for name, result in results.items():
+        line = '{:<32} {:>14.2f} {:<6}'.format(name, result['value'], result['unit'])
+        if name in comparison:
+            _, before, _, change, regression = comparison[name]
+            line += ' (baseline {:.2f}, {:+.1%}){}'.format(before, change, ' REGRESSION' if regression else '')
+            regressions += regression
+        print(line)
+    return regressions
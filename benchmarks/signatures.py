@@ -0,0 +1,82 @@
+import itertools
+import os
+import sys
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from mempool import transaction_size
+from transaction import Transaction
+from verification import verify_signature, get_verifier, SCHEMES
+from wallet import Wallet
+
+from results import measure, save_results, load_results, report, THRESHOLD
+
+"""
+Benchmark des types de clés (RSA 1024 bits / Ed25519) :
+    - génération des clés, signature (clé parsée gardée / re-parsée à chaque signature), vérification
+    - taille d'une transaction encodée en binaire (clés, signature), de la clé publique et de la signature
+
+Usage : python benchmarks/signatures.py [--repeat 5] [-o results.json] [-b baseline.json] [-t 0.10]
+Code de sortie 1 si un résultat est en régression par rapport à la baseline
+"""
+
+
+def size(value):
+    # résultat de taille (octets) au format de results.measure
+    return {'value': value, 'unit': 'bytes', 'better': 'lower'}
+
+
+def run(scheme, repeat):
+    results = {}
+    results[scheme + '_generate_keys'] = measure(lambda: Wallet(scheme).generate_keys(), repeat, 5)
+
+    wallet = Wallet(scheme)
+    wallet.create_keys()
+    receiver = Wallet(scheme)
+    receiver.create_keys()
+    amounts = itertools.count(1)
+    results[scheme + '_sign'] = measure(
+        lambda: wallet.sign_transaction(wallet.public_key, receiver.public_key, next(amounts)), repeat, 200)
+
+    def sign_reparsed():
+        # comportement précédent : la clé privée est re-parsée à chaque signature
+        wallet.private_key = wallet.private_key
+        wallet.sign_transaction(wallet.public_key, receiver.public_key, next(amounts))
+    results[scheme + '_sign_reparsed'] = measure(sign_reparsed, repeat, 200)
+
+    signed = []
+    for amount in range(1, 201):
+        signed.append((wallet.public_key, receiver.public_key, amount,
+                       wallet.sign_transaction(wallet.public_key, receiver.public_key, amount)))
+    cycle = itertools.cycle(signed)
+    results[scheme + '_verify'] = measure(lambda: verify_signature(*next(cycle)), repeat, len(signed))
+    get_verifier.cache_clear()
+    results[scheme + '_verify_cold_key'] = measure(
+        lambda: (get_verifier.cache_clear(), verify_signature(*next(cycle))), repeat, len(signed))
+
+    sender, receiver_key, amount, signature = signed[0]
+    transaction = Transaction(sender, receiver_key, signature, amount)
+    results[scheme + '_transaction_bytes'] = size(transaction_size(transaction))
+    results[scheme + '_public_key_bytes'] = size(len(bytes.fromhex(wallet.public_key)))
+    results[scheme + '_signature_bytes'] = size(len(bytes.fromhex(signature)))
+    return results
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('-o', '--output', default=None)
+    parser.add_argument('-b', '--baseline', default=None)
+    parser.add_argument('-t', '--threshold', type=float, default=THRESHOLD)
+    args = parser.parse_args()
+
+    results = {}
+    for scheme in SCHEMES:
+        results.update(run(scheme, args.repeat))
+
+    baseline = load_results(args.baseline) if args.baseline else None
+    regressions = report(results, baseline, args.threshold)
+    if args.output:
+        save_results(args.output, results, vars(args))
+    sys.exit(1 if regressions else 0)
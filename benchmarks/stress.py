@@ -0,0 +1,162 @@
+import os
+import random
+import sys
+import threading
+from argparse import ArgumentParser
+from collections import Counter
+from time import perf_counter, sleep
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from account_state import AccountState
+from blockchain import Blockchain
+from difficulty import DifficultyAdjuster
+from transaction import Transaction
+
+from generators import make_accounts
+
+"""
+Test de charge de la concurrence : une blockchain est utilisée en même temps par
+    - des clients qui ajoutent des transactions (dont des doublons envoyés en même temps)
+    - un mineur qui mine en continu, chaque bloc est envoyé à une deuxième blockchain
+    - des lecteurs (transactions en cours, soldes, chaine)
+
+Vérifie ensuite (après avoir miné les transactions restantes) :
+    - chaque transaction acceptée est dans la chaine autant de fois qu'elle a été acceptée (ni perdue, ni dupliquée)
+    - aucun solde négatif, l'index des soldes correspond au rejeu de la chaine
+    - la deuxième blockchain a la même chaine
+Affiche la latence des lectures pendant le minage et l'ajout de transactions
+
+Usage : python benchmarks/stress.py [--clients 8] [--readers 4] [--accounts 5] [--duration 10]
+Code de sortie 1 si une vérification échoue
+"""
+
+
+def replay(chain):
+    state = AccountState()
+    for block in chain:
+        state.apply_block(block)
+    return state
+
+
+def run(accounts, clients, readers, duration, seed, block_interval):
+    # temps visé entre deux blocs court : le mineur mine en continu
+    blockchain = Blockchain(None, adjuster=DifficultyAdjuster(interval=block_interval))
+    replica = Blockchain(None, adjuster=DifficultyAdjuster(interval=block_interval))
+
+    # Un bloc miné par compte (récompense) pour que chaque compte ait un solde
+    for account in accounts:
+        blockchain.set_public_key(account.public_key)
+        replica.add_block(blockchain.mine_block())
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    accepted = Counter()
+    recent = []
+    stats = {'submitted': 0, 'duplicates_submitted': 0, 'blocks': 0}
+    reads = []
+
+    def client(number):
+        rng = random.Random(seed + number)
+        while not stop.is_set():
+            with lock:
+                duplicate = recent and rng.random() < 0.2
+                transaction = rng.choice(recent) if duplicate else None
+            if transaction is None:
+                sender = rng.choice(accounts)
+                receiver = '{:0324x}'.format(rng.getrandbits(1296))
+                amount = rng.randint(1, 3)
+                signature = sender.sign_transaction(sender.public_key, receiver, amount)
+                transaction = Transaction(sender.public_key, receiver, signature, amount)
+            added = blockchain.store_transaction(transaction)
+            with lock:
+                stats['submitted'] += 1
+                stats['duplicates_submitted'] += bool(duplicate)
+                if added:
+                    accepted[transaction.get_id()] += 1
+                if not duplicate:
+                    recent.append(transaction)
+                    del recent[:-50]
+
+    def miner():
+        while not stop.is_set():
+            block = blockchain.mine_block()
+            if block is not None:
+                replica.add_block(block)
+                stats['blocks'] += 1
+
+    def reader(number):
+        rng = random.Random(seed - number)
+        while not stop.is_set():
+            start = perf_counter()
+            blockchain.get_transactions()
+            blockchain.get_balance(rng.choice(accounts).public_key)
+            chain, height = blockchain.snapshot()
+            [chain[h].to_dict() for h in range(max(0, height - 5), height)]
+            elapsed = perf_counter() - start
+            with lock:
+                reads.append(elapsed)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads.append(threading.Thread(target=miner))
+    for thread in threads:
+        thread.start()
+    sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    # Mine les transactions restantes
+    while len(blockchain.current_transactions):
+        replica.add_block(blockchain.mine_block())
+        stats['blocks'] += 1
+
+    # Vérifications
+    errors = []
+    chain = list(blockchain.blockchain)
+    mined = Counter(t.get_id() for block in chain for t in block.transactions[:-1])
+    lost = [i for i in accepted if mined[i] < accepted[i]]
+    duplicated = [i for i in mined if mined[i] > accepted[i]]
+    if lost:
+        errors.append('{} transactions acceptées absentes de la chaine'.format(len(lost)))
+    if duplicated:
+        errors.append('{} transactions dupliquées dans la chaine'.format(len(duplicated)))
+    state = replay(chain)
+    if state.received != blockchain.account_state.received or state.sent != blockchain.account_state.sent:
+        errors.append("l'index des soldes ne correspond pas à la chaine")
+    negative = [a for a in state.received if state.balance(a) < 0]
+    if negative:
+        errors.append('{} comptes avec un solde négatif'.format(len(negative)))
+    if [b.get_hash() for b in replica.blockchain] != [b.get_hash() for b in chain]:
+        errors.append('la deuxième blockchain a une chaine différente')
+
+    stats['accepted'] = sum(accepted.values())
+    stats['height'] = len(chain) - 1
+    reads.sort()
+    stats['reads'] = len(reads)
+    stats['read_p50'] = reads[len(reads) // 2] * 1000 if reads else 0
+    stats['read_p99'] = reads[int(len(reads) * 0.99)] * 1000 if reads else 0
+    stats['read_max'] = reads[-1] * 1000 if reads else 0
+    return stats, errors
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--accounts', type=int, default=5)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--block-interval', type=float, default=0.01)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    stats, errors = run(make_accounts(args.accounts), args.clients, args.readers, args.duration, args.seed,
+                        args.block_interval)
+    print('{submitted} transactions envoyées ({duplicates_submitted} doublons), {accepted} acceptées, '
+          '{blocks} blocs, hauteur {height}'.format(**stats))
+    print('{reads} lectures, latence p50 {read_p50:.2f} ms, p99 {read_p99:.2f} ms, max {read_max:.1f} ms'.format(**stats))
+    for error in errors:
+        print('ERREUR : ' + error)
+    print('OK' if not errors else 'ECHEC')
+    sys.exit(1 if errors else 0)
@@ -1,22 +1,164 @@
-from time import time
+from time import time as now
+import hashlib as hl
+import json
+
+from difficulty import target_to_hex, hex_to_target
+from header import LEGACY_BLOCK_VERSION, check_header_fields, header_prefix, encode_nonce
+from merkle import merkle_root, merkle_proof
+from transaction import Transaction
+import metrics
 
 
 # Block
 class Block():
+    # Pas de __dict__ : moins de mémoire par bloc
+    __slots__ = ('index', 'previous_hash', 'timestamp', 'transactions', 'proof', 'target', 'version',
+                 '_hash', '_merkle_root', '_sealed')
 
-    def __init__(self, index, previous_hash, transactions, proof, time=time()):
+    def __init__(self, index, previous_hash, transactions, proof, time=None, target=None,
+                 version=LEGACY_BLOCK_VERSION):
         """
         :param index: index du bloc dans la blockchain
         :param previous_hash: hash du bloc précédent
-        :param timestamp: date de création du bloc
         :param transactions: liste des transactions du bloc
         :param proof: nombre proof généré lors du minage
+        :param time: date de création du bloc (par défaut maintenant)
+        :param target: <int> cible du PoW (voir difficulty.py), None pour les blocs de l'ancien format
+        :param version: format du bloc (voir header.py) : PoW et hash sur le repr des transactions (1)
+                        ou sur l'en-tête binaire (2)
+        :raise ValueError: version inconnue ou champs qui ne tiennent pas dans l'en-tête
 
+        Le bloc est scellé à sa création : il ne peut plus être modifié,
+        son hash et sa racine de Merkle sont calculés une seule fois
         """
+        timestamp = time if time is not None else now()
+        check_header_fields(version, previous_hash, timestamp, proof, target)
         self.index = index
         self.previous_hash = previous_hash
-        self.timestamp = time
-        self.transactions = transactions
+        self.timestamp = timestamp
+        self.transactions = tuple(transactions)
         self.proof = proof
+        self.target = target
+        self.version = version
+        self._hash = None
+        self._merkle_root = None
+        self._sealed = True
+
+
+    def __setattr__(self, name, value):
+        if getattr(self, '_sealed', False) and not name.startswith('_'):
+            raise AttributeError('Block is sealed, {} cannot be modified'.format(name))
+        object.__setattr__(self, name, value)
+
+
+    def serialize(self):
+        """
+        Sérialisation canonique du bloc utilisée pour le hash :
+        en-tête binaire (voir header.py), JSON trié pour les blocs de l'ancien format
+        """
+        if self.version != LEGACY_BLOCK_VERSION:
+            return self.header()
+        hashable_block = {
+            'index': self.index,
+            'previous_hash': self.previous_hash,
+            'timestamp': self.timestamp,
+            'transactions': [transaction.to_ordered_dict() for transaction in self.transactions],
+            'proof': self.proof
+        }
+        # la cible n'est hashée que si le bloc en a une (le hash des anciens blocs ne change pas)
+        if self.target is not None:
+            hashable_block['target'] = target_to_hex(self.target)
+        return json.dumps(hashable_block, sort_keys=True).encode()
+
+
+    def header(self):
+        """
+        Retourne l'en-tête binaire du bloc (taille fixe, voir header.py)
+        """
+        return header_prefix(self.version, self.previous_hash, self.get_merkle_root(), self.timestamp,
+                             self.target) + encode_nonce(self.proof)
+
+
+    def get_hash(self):
+        """
+        Retourne le hash SHA256 du bloc (calculé une fois puis gardé)
+        Pour les blocs à en-tête, c'est aussi le hash du PoW (comparé à la cible)
+        """
+        if self._hash is None:
+            with metrics.hash_block_seconds.time():
+                self._hash = hl.sha256(self.serialize()).hexdigest()
+        return self._hash
+
+
+    def get_merkle_root(self):
+        """
+        Retourne la racine de Merkle des transactions du bloc (calculée une fois puis gardée)
+        """
+        if self._merkle_root is None:
+            self._merkle_root = merkle_root([transaction.get_id() for transaction in self.transactions])
+        return self._merkle_root
+
+
+    def get_merkle_proof(self, position):
+        """
+        Retourne la preuve d'inclusion (voir merkle.merkle_proof) de la transaction à la position donnée
+        """
+        return merkle_proof([transaction.get_id() for transaction in self.transactions], position)
+
+
+    def to_dict(self):
+        """
+        Converti le bloc en dictionnaire (JSON)
+        """
+        return {
+            'index': self.index,
+            'previous_hash': self.previous_hash,
+            'timestamp': self.timestamp,
+            'transactions': [transaction.to_dict() for transaction in self.transactions],
+            'proof': self.proof,
+            'target': target_to_hex(self.target) if self.target is not None else None,
+            'version': self.version
+        }
+
+
+    def to_header(self):
+        """
+        Retourne l'en-tête du bloc (sans les transactions) : utilisé pour la synchronisation
+        """
+        return {
+            'index': self.index,
+            'hash': self.get_hash(),
+            'previous_hash': self.previous_hash,
+            'timestamp': self.timestamp,
+            'proof': self.proof,
+            'target': target_to_hex(self.target) if self.target is not None else None,
+            'merkle_root': self.get_merkle_root(),
+            'version': self.version,
+            'transactions': len(self.transactions)
+        }
+
+
+    @staticmethod
+    def from_dict(data):
+        """
+        Créé un bloc à partir de sa forme dictionnaire (JSON)
+
+        :raise ValueError: champ manquant ou de mauvais type
+        """
+        try:
+            transactions = [
+                Transaction(t['sender'], t['receiver'], t['signature'], t['amount'], t.get('fee', 0))
+                for t in data['transactions']
+                ]
+            target = hex_to_target(data['target']) if data.get('target') is not None else None
+            return Block(data['index'], data['previous_hash'], transactions, data['proof'], data['timestamp'], target,
+                         data.get('version', LEGACY_BLOCK_VERSION))
+        except (KeyError, TypeError, AttributeError):
+            raise ValueError('Bloc incomplet ou invalide')
 
 
+def genesis_block():
+    """
+    Bloc de genèse (premier bloc de la chaine), identique sur tous les noeuds
+    """
+    return Block(0, '', [], 100, 0)
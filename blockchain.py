@@ -1,45 +1,217 @@
 # Imports
 from functools import reduce
-import hashlib as hl
 
-import json
-import requests
+import logging
+import os
+from time import time, perf_counter
 
-from block import Block
+from block import Block, genesis_block
 from transaction import Transaction
 from wallet import Wallet
+from verification import verifier
+from account_state import AccountState
+from chain_index import ChainIndex, StoredChainIndex, HISTORY_PAGE_SIZE
+from mining import ProofOfWorkEngine, check_block_proof
+from difficulty import DifficultyAdjuster, block_work, chain_work
+from header import BLOCK_VERSION, HEADER_BLOCK_VERSION, header_prefix, check_version
+from merkle import merkle_root
+from template import BlockTemplateBuilder, check_block_size
+from storage import StoredChain
+from mempool import Mempool
+from broadcast import Broadcaster
+from peers import PeerManager
+from validation import ChainValidator, check_linkage, check_block_balances, check_block_duplicates, replay_balances, \
+    check_block_work, check_amounts
+from codec import encode_block, encode_transactions, CONTENT_TYPE
+from compact import CompactBlock, PartialBlocks, encode_block_transactions
+from snapshot import StateSnapshot, PrunedChain, chain_base, SNAPSHOT_INTERVAL
+from rwlock import RWLock
+import metrics
 
 # recompense pour le mineur
 MINING_REWARD = 10
+# nombre maximal de transactions d'un lot (/transactions/batch, /transactions/relay)
+MAX_BATCH_TRANSACTIONS = 1000
 
-# nombre de 0 au début pour que le bloc soit valide
-MINING_DIFFICULTY = '00'
-MINING_DIFFICULTY_LENGTH = 2
+logger = logging.getLogger(__name__)
 
 
 
 class Blockchain:
-    def __init__(self, public_key):
-        # Chaine de bloc
-        # Bloc de genèse (premier bloc de la chaine)
-        self.blockchain = [Block(0, '', [], 100, 0)]
-        # Transactions en cours (non validées)
-        self.current_transactions = []
+    def __init__(self, public_key, mining_workers=1, store=None, mempool=None, adjuster=None, template=None,
+                 snapshot_interval=SNAPSHOT_INTERVAL, peers=None):
+        """
+        :param public_key: clé publique du noeud
+        :param mining_workers: nombre de processus de minage
+        :param store: <BlockStore> optionnel, la chaine et les transactions en cours sont alors persistées
+        :param mempool: <Mempool> optionnel (taille maximale, politique d'éviction)
+        :param adjuster: <DifficultyAdjuster> optionnel (temps visé entre deux blocs, fenêtre d'ajustement)
+        :param template: <BlockTemplateBuilder> optionnel (taille maximale des blocs minés)
+        :param snapshot_interval: nombre de blocs entre deux snapshots des soldes (0 : aucun snapshot)
+        :param peers: <PeerManager> optionnel (adresse annoncée, nombre de pairs, fan-out)
+        """
+        self.store = store
+        # Verrou lecteurs/écrivain de la chaine, de l'index des soldes et des transactions en cours :
+        # les écritures (ajout de bloc, de transaction) sont courtes, le PoW et la vérification
+        # des signatures sont faits hors du verrou
+        self.lock = RWLock()
+        # Index des soldes des blocs validés (mis à jour à chaque bloc ajouté)
+        self.account_state = AccountState()
+        # Index des transactions (id -> position) et des historiques des comptes (mis à jour à chaque bloc ajouté)
+        self.chain_index = ChainIndex()
+        # Travail cumulé des blocs de la chaine (voir difficulty.block_work), comparé à celui des autres noeuds
+        # (depuis le premier bloc stocké pour un noeud démarré depuis un snapshot)
+        self.chain_work = 0
+        # Transactions en cours (non validées), indexées par identifiant
+        self.current_transactions = mempool if mempool is not None else Mempool()
+        # Snapshots des soldes (voir snapshot.py) : dernier produit (servi aux nouveaux noeuds)
+        # et snapshot de départ si le noeud a démarré depuis un snapshot
+        self.snapshot_interval = snapshot_interval
+        self.latest_snapshot = None
+        self.base_snapshot = None
+
+        if store is None:
+            # Chaine de bloc
+            # Bloc de genèse (premier bloc de la chaine)
+            self.blockchain = [genesis_block()]
+            for block in self.blockchain:
+                self.apply_block(block)
+        else:
+            self.load(store)
 
         # On stocke la clé publique du noeud pour faciliter le fonctionnement
         self.public_key = public_key
 
-        # On utilise un set car il n'ajoute pas les nodes déjà présents dans la liste via sa méthode add()
-        self.nodes = set()
+        # Pairs connus (s'utilise comme un set), avec leur état : latence, échecs, hauteur (voir peers.py)
+        self.nodes = peers if peers is not None else PeerManager()
+        # Envoi des transactions et blocs aux noeuds (en arrière-plan, avec délai maximal et nouvelles tentatives)
+        # les envois visent les meilleurs pairs (self.nodes.select()), qui relaient ensuite aux leurs
+        self.broadcaster = Broadcaster(peers=self.nodes)
+        # Blocs compacts reçus en attente de transactions manquantes (voir compact.py)
+        self.partial_blocks = PartialBlocks()
+
+        # Cible du PoW de chaque bloc, ajustée pour garder un temps constant entre deux blocs
+        self.adjuster = adjuster if adjuster is not None else DifficultyAdjuster()
+
+        # Validation des chaines (le dernier bloc validé est sauvegardé avec la chaine)
+        checkpoint = os.path.join(store.path, 'validated.json') if store is not None else None
+        self.validator = ChainValidator(self.adjuster, MINING_REWARD, checkpoint_path=checkpoint)
+
+        # Moteur de minage (nombre de processus configurable)
+        self.pow_engine = ProofOfWorkEngine(mining_workers)
+        # Choix des transactions des blocs minés (taille limitée, frais les plus élevés d'abord)
+        self.template = template if template is not None else BlockTemplateBuilder()
+
+        # Fonctions appelées quand la chaine ou les transactions en cours changent (ex: mineur en arrière-plan)
+        self.listeners = []
+
+    def load(self, store):
+        """
+        Charge la chaine depuis le stockage (les blocs sont lus à la demande)
+        L'index des soldes sauvegardé est rechargé, l'index des transactions est sur disque (txindex.db) :
+        seuls les blocs qui suivent chacun d'eux sont rejoués
+        """
+        self.blockchain = StoredChain(store, self.hash_block)
+        bootstrap = store.load_bootstrap()
+        if bootstrap is not None:
+            self.base_snapshot = StateSnapshot.decode(bootstrap['snapshot'])
+        elif len(self.blockchain) == 0:
+            self.blockchain.append(genesis_block())
+
+        def saved_height(saved):
+            # hauteur jusqu'à laquelle l'index sauvegardé est à jour (-1 si absent ou d'une autre chaine)
+            if saved is not None and store.base <= saved['height'] < len(self.blockchain) \
+                    and store.block_hash(saved['height']) == saved['hash']:
+                return saved['height']
+            return -1
+
+        saved = store.load_state()
+        start = saved_height(saved) + 1
+        if start:
+            self.account_state.received = saved['received']
+            self.account_state.sent = saved['sent']
+        elif self.base_snapshot is not None:
+            # chaine démarrée depuis un snapshot : soldes du snapshot puis blocs suivants
+            self.account_state = self.base_snapshot.to_state()
+            start = self.base_snapshot.height + 1
+        for block in self.blockchain[start:]:
+            self.account_state.apply_block(block)
+        # travail cumulé sauvegardé avec les soldes (recalculé sur les blocs stockés s'il est absent)
+        if saved_height(saved) >= 0 and 'work' in saved:
+            self.chain_work = saved['work'] + chain_work(self.blockchain[start:])
+        else:
+            self.chain_work = chain_work(self.blockchain[store.base:])
+
+        self.chain_index = StoredChainIndex(os.path.join(store.path, 'txindex.db'))
+        start = self.chain_index.resume(store.block_hash, store.base, len(self.blockchain))
+        for block in self.blockchain[start:]:
+            self.chain_index.apply_block(block)
+
+        saved = store.load_snapshot()
+        if saved is not None:
+            snapshot = StateSnapshot.decode(saved)
+            if store.base <= snapshot.height < len(self.blockchain) \
+                    and store.block_hash(snapshot.height) == snapshot.block_hash:
+                self.latest_snapshot = snapshot
+        if self.latest_snapshot is None:
+            self.latest_snapshot = self.base_snapshot
+
+        for transaction in store.load_mempool():
+            self.current_transactions.add(transaction)
+
+
+    def save(self):
+        """
+        Sauvegarde l'index des soldes et les transactions en cours (à l'arrêt du noeud)
+        L'index des soldes est aussi sauvegardé régulièrement (checkpoint_state) : un crash ne rejoue pas la chaine
+        L'index des transactions est écrit à chaque bloc (StoredChainIndex)
+        """
+        if self.store is None:
+            return
+        with self.lock.write():
+            height = len(self.blockchain) - 1
+            self.store.save_state(height, self.store.block_hash(height), self.account_state, self.chain_work)
+            self.store.save_mempool(list(self.current_transactions))
+            self.chain_index.close()
+            self.store.close()
+
+
+    def get_encoded_block(self, height, chain=None):
+        """
+        Retourne le bloc encodé en binaire (lu tel quel dans le stockage s'il y en a un)
+
+        :param chain: chaine retournée par snapshot() (par défaut la chaine courante)
+        """
+        chain = chain if chain is not None else self.blockchain
+        if self.store is not None:
+            return chain.read_raw(height)
+        return encode_block(chain[height])
+
+
+    def snapshot(self):
+        """
+        Retourne la chaine courante et sa hauteur, pour la lire sans garder le verrou
+        Les blocs [0, hauteur[ de cette chaine ne changent pas : les blocs sont ajoutés à la fin
+        et un remplacement de chaine en mémoire crée une nouvelle liste (voir switch_chain)
+        La chaine stockée est tronquée sur place : une vue figée est retournée (StoredChain.view),
+        ses lectures lèvent IndexError si des blocs ont été remplacés depuis (le lecteur doit abandonner)
+
+        :return <tuple>: (chaine, nombre de blocs)
+        """
+        with self.lock.read():
+            if isinstance(self.blockchain, StoredChain):
+                return self.blockchain.view(), len(self.blockchain)
+            return self.blockchain, len(self.blockchain)
 
 
     # Retourne les transactions en cours (non validées)
     def get_transactions(self):
-        return self.current_transactions[:]
+        with self.lock.read():
+            return list(self.current_transactions)
 
-    # Ajoute un noeud au réseau
+    # Ajoute un noeud au réseau (ajouté à la main : gardé même s'il ne répond plus)
     def add_node(self, node):
-        self.nodes.add(node)
+        return self.nodes.add(node)
 
     # Liste tous les noeuds du réseau
     def get_nodes(self):
@@ -49,72 +221,108 @@ class Blockchain:
     def set_public_key(self, key):
         self.public_key = key
 
+    # Ajoute une fonction appelée à chaque changement ('block' ou 'transaction')
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    # Previent les listeners d'un changement de la chaine ou des transactions en cours
+    def notify(self, event):
+        for listener in self.listeners:
+            listener(event)
+
 
 
 
     def hash_block(self, block):
         """
         Retourne le hash du bloc passé en paramètre
+        Le bloc est scellé : son hash n'est calculé qu'une fois (voir Block.get_hash)
 
         :param block: <Block> Block à hasher
         :return <string>: Hash du bloc
 
         """
-        hashable_block = block.__dict__.copy()
+        return block.get_hash()
 
-        # rend les transactions hashable
-        hashable_block['transactions'] = [
-            transaction.to_ordered_dict() for transaction in hashable_block['transactions']
-            ]
 
-        # Hashage du bloc (en JSON) en SHA256 (hashlib)
-        json_hashable_block = json.dumps(hashable_block, sort_keys=True).encode()
-        result = hl.sha256(json_hashable_block).hexdigest()
-        return result
+    def valid_proof(self, block):
+        """
+        Check si le proof number du bloc est valide (hash inférieur ou égal à la cible)
 
+        :param block: <Block> bloc en cours de validation
+        :return <boolean>: Vrai si il est valide, Faux sinon.
 
-    def valid_proof(self, transactions, last_hash, proof):
         """
-        Check si le proof number est valide (MINING_DIFFICULTY=nombre de zeros)
+        # Hash (SHA256) de l'en-tête binaire du bloc (ou, pour l'ancien format, du string
+        # transactions + last hash + proof), lu comme un entier de 256 bits
+        return check_block_proof(block)
 
-        :param transactions: Les transactions du bloc en cours de validation
-        :param last_hash: Le hash du bloc précédent
-        :param proof: Le POW à tester (actuel)
-        :return <boolean>: Vrai si il est valide, Faux sinon.
 
+    def next_target(self):
+        """
+        Retourne la cible du prochain bloc (ajustée tous les adjuster.window blocs)
         """
-        # Créer le string à hasher (transactions + last hash + proof)
-        test = (str([tx.to_ordered_dict() for tx in transactions]) + str(last_hash) + str(proof)).encode()
+        with self.lock.read():
+            return self.adjuster.next_target(self.blockchain.__getitem__, len(self.blockchain))
 
-        #Hash le string (SHA256)
-        test_hash = hl.sha256(test).hexdigest()
 
-        #[0:MINING_DIFFICULTY_LENGTH] = les X premiers caractères du hash
-        if test_hash[0:MINING_DIFFICULTY_LENGTH] == MINING_DIFFICULTY:
-            return True
-        else:
-            return False
+    def block_template(self):
+        """
+        Prépare le contenu du prochain bloc à miner :
+        transactions choisies (dans la limite de taille, frais les plus élevés d'abord, couvertes par le solde
+        validé de leur envoyeur) suivies de la récompense,
+        hash du bloc précédent, cible et date (fixées avant la recherche, elles font partie de l'en-tête)
 
+        :return <tuple>: (hash du bloc précédent, transactions, cible, date)
+        """
+        with self.lock.read():
+            previous_block = self.blockchain[-1]
+            transactions = self.template.select(self.current_transactions, self.reward_transaction(0),
+                                                self.account_state.balance)
+            target = self.next_target()
+            # la date du bloc ne peut pas être antérieure à celle du bloc précédent
+            timestamp = max(time(), previous_block.timestamp)
+            previous_hash = self.hash_block(previous_block)
+        transactions.append(self.reward_transaction(sum(t.fee for t in transactions)))
+        return previous_hash, transactions, target, timestamp
+
+
+    @staticmethod
+    def template_header(previous_hash, transactions, target, timestamp):
+        """
+        Retourne l'en-tête (sans le nonce) du bloc préparé par block_template, hashé par le PoW
+        """
+        root = merkle_root([transaction.get_id() for transaction in transactions])
+        return header_prefix(BLOCK_VERSION, previous_hash, root, timestamp, target)
 
-    def proof_of_work(self):
+
+    def proof_of_work(self, workers=None, cancel=None):
         """
-        Genere un POW avec les transactions en cours, le hash du bloc précédent et un nombre aléatoire (proof)
+        Genere un POW sur l'en-tête du prochain bloc (transactions en cours, hash du bloc précédent)
+        et un nombre aléatoire (proof)
+        La recherche est faite par le moteur de minage (réparti sur plusieurs processus si workers > 1)
 
+        :param workers: nombre de processus de minage (par défaut celui du moteur)
+        :param cancel: threading.Event optionnel qui annule la recherche
+        :return <tuple>: (contenu du bloc préparé par block_template, proof valide pour ce contenu ou None si annulé)
         """
-        last_block = self.blockchain[-1]
-        last_hash = self.hash_block(last_block)
-        proof = 0
+        template = self.block_template()
+        prefix = self.template_header(*template)
+        return template, self.pow_engine.search(prefix, template[2], cancel, workers)
 
-        # Cherche le proof number en incrémentant de un à chaque test
-        while not self.valid_proof(self.current_transactions, last_hash, proof):
-            proof += 1
-        return proof
+
+    def reward_transaction(self, fees):
+        """
+        Transaction récompense du mineur (dernière transaction du bloc) : récompense + frais du bloc
+        """
+        return Transaction('Mining reward', self.public_key, '', MINING_REWARD + fees)
 
 
 
     def get_balance(self, account=None):
         """
         Calcul le solde de l'utilisateur courant (via sa clé publique)
+        Lecture en O(1) dans l'index des soldes (account_state)
 
         """
         if account == None :
@@ -122,108 +330,418 @@ class Blockchain:
         else:
             user = account
 
-        solde_sent = 0
-        solde_receive = 0
+        # Note : On ne vérifie pas l'argent reçu dans les transactions qui ne sont pas encore validées
+        with self.lock.read():
+            return self.account_state.balance(user) - self.current_transactions.pending_spend(user)
 
-        # Dans chaque bloc de la blockchain, on regarde chaque transaction
-        # Si le user est receiver/sender sur la transaction, on incrémente les variables solde_sent (argent envoyé) et solde_receive (argent reçu)
-        for block in self.blockchain:
-            for transaction in block.transactions:
-                if transaction.sender == user:
-                    solde_sent += transaction.amount
-                if transaction.receiver == user:
-                    solde_receive += transaction.amount
 
-        # Même chose pour les transactions en cours
-        # Note : On ne vérifie pas l'argent reçu dans les transactions qui ne sont pas encore validées
-        for transac in self.current_transactions:
-            if transac.sender == user:
-                solde_sent += transac.amount
 
-        # Retourne la différence entre argent reçu et argent envoyé (solde)
-        return solde_receive - solde_sent
+    def apply_block(self, block):
+        """
+        Met à jour les index (soldes, transactions) avec un bloc ajouté en haut de la chaine
+        Note : appelé sous le verrou en écriture
+        """
+        self.account_state.apply_block(block)
+        self.chain_index.apply_block(block)
+        self.chain_work += block_work(block)
+        if self.snapshot_interval and block.index and block.index % self.snapshot_interval == 0:
+            self.take_snapshot(block)
+        if self.store is not None and block.index and block.index % (self.snapshot_interval or SNAPSHOT_INTERVAL) == 0:
+            self.checkpoint_state(block)
+
+
+    def checkpoint_state(self, block):
+        """
+        Sauvegarde l'index des soldes à jour jusqu'au bloc (dernier bloc de la chaine, déjà stocké) :
+        après un crash, seuls les blocs suivants sont rejoués au démarrage (au plus un intervalle de snapshot)
+        Note : appelé sous le verrou en écriture, le bloc est déjà dans le stockage
+        """
+        start = perf_counter()
+        self.store.checkpoint(block.index, self.hash_block(block), self.account_state, self.chain_work)
+        logger.debug('State checkpoint: height %s (%.3fs)', block.index, perf_counter() - start)
 
 
+    def drop_unaffordable(self, senders=None):
+        """
+        Retire des transactions en cours celles que le solde validé de leur envoyeur ne couvre plus :
+        le total en attente d'un envoyeur ne dépasse jamais son solde (sinon le prochain bloc miné serait invalide)
+        Note : appelé sous le verrou en écriture
 
-    def check_block(self, block):
+        :param senders: envoyeurs dont le solde a baissé (None : tous les envoyeurs)
         """
-        Check si le bloc passée en paramètre est valide
+        removed = self.current_transactions.remove_unaffordable(senders, self.account_state.balance)
+        if removed:
+            logger.info('%s pending transactions dropped (balance no longer covers them)', len(removed))
 
-        :param block: <Block>
-        :return <boolean>: Vrai si valide, Faux sinon
+
+    def revert_block(self, block):
         """
-        if block.index != 0:
-            if block.previous_hash != self.hash_block(blockchain[block.index - 1]):
-                return False
-            if not self.valid_proof(block.transactions[:-1], block.previous_hash, block.proof):
-                print('Proof of work is invalid')
+        Annule un bloc retiré du haut de la chaine dans les index (soldes, transactions)
+        Note : appelé sous le verrou en écriture
+        """
+        self.account_state.revert_block(block)
+        self.chain_index.revert_block(block)
+        self.chain_work -= block_work(block)
+        if self.latest_snapshot is not None and self.latest_snapshot.height == block.index:
+            # le snapshot porte sur un bloc retiré : le précédent n'est plus connu
+            self.latest_snapshot = self.base_snapshot
+
+
+    def take_snapshot(self, block):
+        """
+        Produit le snapshot des soldes après le bloc (dernier bloc de la chaine), sauvegardé avec la chaine
+        Note : appelé sous le verrou en écriture
+        """
+        self.latest_snapshot = StateSnapshot.from_state(block.index, self.hash_block(block), self.account_state)
+        if self.store is not None:
+            self.store.save_snapshot(self.latest_snapshot.encode())
+        logger.info('State snapshot: height %s, %s accounts, hash %s', block.index,
+                    len(self.latest_snapshot.balances), self.latest_snapshot.get_hash())
+
+
+    def get_snapshot(self):
+        """
+        Retourne le dernier snapshot des soldes (<StateSnapshot>), None si aucun
+        """
+        with self.lock.read():
+            return self.latest_snapshot
+
+
+    def first_height(self):
+        """
+        Retourne la hauteur du premier bloc disponible (0 sauf noeud démarré depuis un snapshot)
+        """
+        return chain_base(self.blockchain)
+
+
+    def snapshot_height(self):
+        """
+        Retourne la hauteur du snapshot de départ : les blocs jusqu'à cette hauteur ne sont pas remplaçables
+        (0 si la chaine commence au bloc de genèse)
+        """
+        return self.base_snapshot.height if self.base_snapshot is not None else 0
+
+
+    def bootstrap(self, snapshot, blocks):
+        """
+        Démarre la chaine depuis un snapshot des soldes (noeud neuf) : seuls les derniers blocs jusqu'au snapshot
+        sont gardés (ancres, pour l'ajustement de la difficulté), les blocs précédents ne sont pas téléchargés
+        Note : le snapshot doit être de confiance (hash vérifié par l'appelant)
+
+        :param snapshot: <StateSnapshot>
+        :param blocks: liste de <Block> consécutifs dont le dernier est le bloc du snapshot
+        :return <boolean>: Vrai si la chaine a été remplacée, Faux si les blocs ne correspondent pas au snapshot
+                           ou si la chaine locale n'est pas neuve
+        """
+        if not blocks or blocks[-1].index != snapshot.height or blocks[-1].get_hash() != snapshot.block_hash:
+            return False
+        if check_linkage(blocks[1:], blocks[0]) is not None:
+            return False
+        if not all(check_block_work(block) for block in blocks):
+            return False
+
+        with self.lock.write():
+            if len(self.blockchain) != 1:
                 return False
+            base = blocks[0].index
+            if self.store is None:
+                self.blockchain = PrunedChain(base, blocks)
+            else:
+                del self.blockchain[0:]
+                self.store.set_base(base, snapshot.encode())
+                self.blockchain.extend(blocks)
+            self.base_snapshot = snapshot
+            self.latest_snapshot = snapshot
+            self.account_state = snapshot.to_state()
+            self.chain_work = chain_work(blocks)
+            self.chain_index.clear()
+            for block in blocks:
+                self.chain_index.apply_block(block)
+                self.current_transactions.remove_confirmed(block.transactions)
+            self.drop_unaffordable()
+        logger.info('Bootstrapped from snapshot: height %s, %s accounts', snapshot.height, len(snapshot.balances))
+        self.notify('block')
         return True
 
 
+    def find_transaction(self, transaction_id):
+        """
+        Cherche une transaction de la chaine par son identifiant (O(1) dans l'index des transactions)
+
+        :return <tuple>: (transaction, hauteur du bloc, position dans le bloc, hash du bloc), None si absente
+        """
+        with self.lock.read():
+            location = self.chain_index.locate(transaction_id)
+            if location is None:
+                return None
+            height, position = location
+            block = self.blockchain[height]
+            return block.transactions[position], height, position, self.hash_block(block)
+
+
+    def get_merkle_proof(self, transaction_id):
+        """
+        Retourne la preuve d'inclusion d'une transaction de la chaine dans la racine de Merkle de son bloc
+
+        :return <tuple>: (bloc, position dans le bloc, preuve), None si la transaction n'est pas dans la chaine
+        """
+        with self.lock.read():
+            location = self.chain_index.locate(transaction_id)
+            if location is None:
+                return None
+            height, position = location
+            block = self.blockchain[height]
+        return block, position, block.get_merkle_proof(position)
+
+
+    def get_pending_transaction(self, transaction_id):
+        """
+        Retourne la transaction en cours (non validée) d'identifiant transaction_id, None si absente
+        """
+        with self.lock.read():
+            return self.current_transactions.get(transaction_id)
+
+
+    def get_history(self, account, cursor=None, limit=HISTORY_PAGE_SIZE):
+        """
+        Retourne une page de l'historique (transactions envoyées et reçues) d'un compte
+
+        :param cursor: (hauteur, position) de la dernière transaction de la page précédente
+        :param limit: nombre maximal de transactions
+        :return <tuple>: (liste de (hauteur, position, <Transaction>), curseur suivant ou None)
+        """
+        with self.lock.read():
+            locations, next_cursor = self.chain_index.get_history(account, cursor, limit)
+            entries = [(height, position, self.blockchain[height].transactions[position])
+                       for height, position in locations]
+        return entries, next_cursor
+
+
+
+    def switch_chain(self, fork, new_blocks):
+        """
+        Remplace les blocs à partir de la hauteur fork par new_blocks
+        Seuls les blocs après le bloc commun sont annulés/rejoués dans l'index des soldes
+        Les transactions en cours que les nouveaux soldes ne couvrent plus (fonds reçus dans les blocs annulés)
+        sont retirées, puis les transactions des blocs annulés qui ne sont pas dans les nouveaux blocs
+        reviennent dans les transactions en cours (si elles sont toujours valides)
+        Note : les nouveaux blocs doivent avoir été vérifiés avant l'appel (check_suffix)
+
+        :param fork: nombre de blocs communs (hauteur du premier bloc remplacé)
+        :param new_blocks: liste de <Block> qui suivent le bloc fork - 1
+        """
+        with self.lock.write():
+            # Annule les blocs de l'ancienne chaine après le bloc commun (du plus haut au plus bas)
+            dropped = self.blockchain[fork:]
+            for block in reversed(dropped):
+                self.revert_block(block)
+            if isinstance(self.blockchain, list):
+                # nouvelle liste : les lecteurs (snapshot) gardent l'ancienne chaine intacte
+                self.blockchain = self.blockchain[:fork] + list(new_blocks)
+            elif isinstance(self.blockchain, PrunedChain):
+                base = self.blockchain.base
+                self.blockchain = PrunedChain(base, self.blockchain[base:fork] + list(new_blocks))
+            else:
+                # chaine stockée : les vues des lecteurs (snapshot) sont invalidées
+                del self.blockchain[fork:]
+                self.blockchain.extend(new_blocks)
+            # les blocs sont stockés avant d'être appliqués aux index (checkpoint des soldes, voir apply_block)
+            for block in new_blocks:
+                self.apply_block(block)
+
+            # Supprime les transactions courantes déjà présentes dans la nouvelle chaine
+            confirmed = set()
+            for block in new_blocks:
+                self.current_transactions.remove_confirmed(block.transactions)
+                confirmed.update(t.get_id() for t in block.transactions)
+            # Les soldes de tous les comptes ont pu baisser : toutes les transactions en cours sont revérifiées
+            self.drop_unaffordable()
+
+            # Remet en cours les transactions des blocs annulés (sauf les récompenses)
+            for block in dropped:
+                for t in block.transactions[:-1]:
+                    if t.get_id() not in confirmed:
+                        self.store_transaction(t)
+        self.notify('block')
+
+
+    def check_suffix(self, fork, blocks):
+        """
+        Check les blocs qui remplaceraient la chaine courante à partir de la hauteur fork
+        Seuls ces blocs sont vérifiés (chainage, PoW, signatures, soldes), pas toute la chaine
+        Ils doivent avoir plus de travail cumulé que les blocs remplacés (une chaine plus longue ne suffit pas)
+
+        :param fork: nombre de blocs communs
+        :param blocks: liste de <Block>
+        :return <boolean>: Vrai si valide, Faux sinon
+        """
+        # les blocs jusqu'au snapshot de départ ne sont pas remplaçables
+        if fork <= self.snapshot_height() or fork > len(self.blockchain):
+            return False
+        if check_linkage(blocks, self.blockchain[fork - 1]) is not None:
+            return False
+        with self.lock.read():
+            replaced_work = chain_work(self.blockchain[fork:])
+        if chain_work(blocks) <= replaced_work:
+            return False
+        if self.adjuster.check_blocks(blocks, self.blockchain.__getitem__) is not None:
+            return False
+        if not self.validator.check_work(blocks):
+            return False
+
+        # Soldes au bloc commun : on annule les blocs remplacés sur une copie de l'index
+        with self.lock.read():
+            state = self.account_state.copy()
+            for block in reversed(self.blockchain[fork:]):
+                state.revert_block(block)
+        return replay_balances(blocks, state, MINING_REWARD, self.chain_index.locate) is None
+
+
     def check_chain(self, blockchain):
         """
         Check si la blockchain passée en paramètre est valide
+        (chainage, PoW et signatures en parallèle, soldes ; reprend au dernier bloc déjà validé)
 
-        :param blockchain: <Blockchain>
+        :param blockchain: liste de <Block>
         :return <boolean>: Vrai si valide, Faux sinon
         """
-        for block in enumerate(blockchain):
-            if not check_block(block):
-                return False
-        return True
+        snapshot = self.base_snapshot if chain_base(blockchain) else None
+        # l'index des transactions ne décrit que la chaine courante
+        locate = self.chain_index.locate if blockchain is self.blockchain else None
+        return self.validator.validate(blockchain, snapshot, locate)
 
 
     def check_transaction(self, transaction, get_balance):
         """
-        Check si l'envoyeur a assez pour effectuer de fond la transaction
+        Check si l'envoyeur a assez pour effectuer de fond la transaction (montant + frais)
+        Le montant doit être strictement positif et les frais positifs ou nuls (voir check_amounts)
 
         :param transaction: Transaction à vérifier
         :return <boolean>: Vrai si valide, Faux sinon
         """
+        if not check_amounts(transaction):
+            return False
         sender_balance = get_balance(transaction.sender)
-        return sender_balance >= transaction.amount and Wallet.verify_transaction(transaction)
+        return sender_balance >= transaction.cost and Wallet.verify_transaction(transaction)
+
+
+    def store_transaction(self, transaction):
+        """
+        Ajoute la transaction aux transactions en cours si elle est valide
+        et n'y est pas déjà (doublon) ni dans la chaine (rejeu)
+
+        :return <boolean>: Vrai si la transaction est ajoutée, Faux sinon
+        """
+        if transaction.get_id() in self.current_transactions:
+            return False
+        # La signature est vérifiée hors du verrou (elle est ensuite en cache dans le service de vérification)
+        if not Wallet.verify_transaction(transaction):
+            return False
+        with self.lock.write():
+            # Re-vérifie sous le verrou : doublon et solde (une autre transaction a pu être ajoutée entre temps)
+            if transaction.get_id() in self.current_transactions:
+                return False
+            # transaction déjà validée dans la chaine : pas de rejeu
+            if self.chain_index.locate(transaction.get_id()) is not None:
+                return False
+            if not self.check_transaction(transaction, self.get_balance):
+                return False
+            if self.current_transactions.add(transaction) is None:
+                # transactions en cours pleines (politique reject)
+                return False
+        self.notify('transaction')
+        return True
 
 
-    def create_transaction(self, receiver, sender, signature, amount):
+    def create_transaction(self, receiver, sender, signature, amount, fee=0):
         """
         Ajoute une transaction aux transactions courante (non validés)
-        Si valide, envoie cette transaction à tous les noeuds connus
+        Si valide, envoie cette transaction aux meilleurs noeuds connus (voir PeerManager.select)
+        L'envoi est fait en arrière-plan : un noeud lent ou absent ne bloque pas l'appel
 
+        :param fee: frais payés au mineur (optionnels, signés s'ils ne sont pas nuls)
         :return <boolean>: Vrai si la transaction est ajoutée, Faux sinon
         """
 
-        transaction = Transaction(sender, receiver, signature, amount)
-        check_transac = self.check_transaction(transaction, self.get_balance)
-        if check_transac:
-            self.current_transactions.append(transaction)
-
-            # envoit la transaction à tout les noeuds connus
-            for node in self.nodes:
-                url = 'http://{}/store-received-transaction'.format(node)
-                data = {'sender': sender, 'receiver': receiver, 'amount': amount, 'signature': signature}
-                try:
-                    response = requests.post(url, json=data)
-                    if response.status_code != 201:
-                        print("transaction error to {}".format(node) )
-                        return False
-                except:
-                    print("Error Transaction add, -transaction")
-                    continue
+        transaction = Transaction(sender, receiver, signature, amount, fee)
+        if self.store_transaction(transaction):
+            # envoit la transaction à tout les noeuds connus (en arrière-plan)
+            data = {'sender': sender, 'receiver': receiver, 'amount': amount, 'signature': signature, 'fee': fee}
+            self.broadcaster.broadcast(self.nodes.select(), '/store-received-transaction', json=data)
             return True
         else:
             return False
 
-    def add_transaction(self, receiver, sender, signature, amount):
+    def add_transaction(self, receiver, sender, signature, amount, fee=0):
         """
         Stocke la transaction recu par les autres noeuds dans les transactions en cours (non validées)
         """
-        transaction = Transaction(sender, receiver, signature, amount)
-        check_transac = self.check_transaction(transaction, self.get_balance)
-        if check_transac:
-            self.current_transactions.append(transaction)
-            return True
-        return False
+        transaction = Transaction(sender, receiver, signature, amount, fee)
+        return self.store_transaction(transaction)
+
+
+    def store_transactions(self, transactions):
+        """
+        Ajoute un lot de transactions aux transactions en cours (celles qui sont valides)
+            - doublons (déjà en cours, déjà validés ou répétés dans le lot) refusés
+            - signatures vérifiées en un seul lot hors du verrou (en parallèle si le lot est grand)
+            - soldes vérifiés sous le verrou avec un solde courant par envoyeur : un envoyeur ne peut pas
+              dépenser plus que son solde avec plusieurs transactions du même lot (ordre du lot)
+
+        :param transactions: liste de <Transaction>
+        :return <list>: un booléen par transaction (Vrai si ajoutée), dans le même ordre
+        """
+        results = [False] * len(transactions)
+        candidates = []
+        seen = set()
+        for i, transaction in enumerate(transactions):
+            transaction_id = transaction.get_id()
+            if transaction_id in seen or transaction_id in self.current_transactions:
+                continue
+            seen.add(transaction_id)
+            candidates.append(i)
+
+        signed = verifier.verify_many([transactions[i] for i in candidates])
+        candidates = [i for i, valid in zip(candidates, signed) if valid]
+
+        with self.lock.write():
+            # solde disponible de chaque envoyeur du lot (lu une fois puis mis à jour)
+            available = {}
+            for i in candidates:
+                transaction = transactions[i]
+                if not check_amounts(transaction) or transaction.get_id() in self.current_transactions:
+                    continue
+                # transaction déjà validée dans la chaine : pas de rejeu
+                if self.chain_index.locate(transaction.get_id()) is not None:
+                    continue
+                sender = transaction.sender
+                if sender not in available:
+                    available[sender] = self.get_balance(sender)
+                if available[sender] < transaction.cost:
+                    continue
+                if self.current_transactions.add(transaction) is None:
+                    # transactions en cours pleines (politique reject)
+                    continue
+                available[sender] -= transaction.cost
+                results[i] = True
+        if any(results):
+            self.notify('transaction')
+        return results
+
+
+    def create_transactions(self, transactions):
+        """
+        Ajoute un lot de transactions signées par les clients (voir store_transactions)
+        Les transactions ajoutées sont envoyées aux meilleurs noeuds connus en un seul message (encodé en binaire)
+
+        :return <list>: un booléen par transaction (Vrai si ajoutée), dans le même ordre
+        """
+        results = self.store_transactions(transactions)
+        accepted = [t for t, added in zip(transactions, results) if added]
+        if accepted:
+            self.broadcaster.broadcast(self.nodes.select(), '/transactions/relay', data=encode_transactions(accepted),
+                                       headers={'Content-Type': CONTENT_TYPE})
+        return results
 
 
 
@@ -235,43 +753,73 @@ class Blockchain:
             - Verifie les transactions courante de ce bloc
             - Supprime les transactions courante de la blockchaine courante
 
+        :param block: <Block> ou dict (JSON) du bloc reçu
         :return <boolean>: Vrai si le bloc a été ajoutée, Faux sinon
 
         """
-        transactions = []
-
-        # Place toutes les transactions courantes (non validées) dans un tableau temporaire
-        for transaction in block['transactions']:
-            t = Transaction(transaction['sender'], transaction['receiver'], transaction['signature'], transaction['amount'])
-            transactions.append(t)
+        if not metrics.registry.enabled:
+            return self._add_block(block)
+        start = perf_counter()
+        added = self._add_block(block)
+        metrics.block_import_seconds.labels(result='accepted' if added else 'rejected').observe(perf_counter() - start)
+        return added
+
+
+    def _add_block(self, block):
+        # Le bloc peut être reçu en JSON (dict) ou déjà décodé (binaire, voir codec.py)
+        if not isinstance(block, Block):
+            block = Block.from_dict(block)
+        transactions = block.transactions
+
+        # Check la taille du bloc (nombre de transactions et octets)
+        if not check_block_size(block):
+            return False
 
-        # Check si le proof du bloc est valide
-        proof_valid = self.valid_proof(transactions[:-1], block['previous_hash'], block['proof'])
-        # Check si le previous hash du bloc courant est égal au hash du bloc précedent
-        check_block = self.hash_block(self.blockchain[-1]) == block['previous_hash']
+        # Check si le proof du bloc est valide (la cible elle-même est vérifiée plus bas)
+        if not self.valid_proof(block):
+            return False
 
-        if not proof_valid or not check_block:
+        # Check les signatures (sauf la récompense du mineur, dernière transaction du bloc)
+        # hors du verrou : les lectures ne sont pas bloquées pendant la vérification
+        if not Wallet.verify_transactions(transactions[:-1]):
             return False
 
-        converted_block = Block(block['index'], block['previous_hash'], transactions, block['proof'], block['timestamp'])
-        self.blockchain.append(converted_block)
+        with self.lock.write():
+            # Check si le previous hash du bloc courant est égal au hash du bloc précedent
+            if self.hash_block(self.blockchain[-1]) != block.previous_hash:
+                return False
 
-        # Crée une copie des transactions courantes
-        current_transactions = self.current_transactions[:]
+            # Un bloc de l'ancien format ne peut pas suivre un bloc à en-tête
+            if not check_version(block, self.blockchain[-1]):
+                return False
+
+            # Check la cible (ajustement de la difficulté) et la date du bloc
+            if not self.adjuster.check_block(block, self.blockchain.__getitem__):
+                return False
+
+            # Check qu'aucune transaction n'est déjà validée (rejeu) ni répétée dans le bloc
+            confirmed = lambda transaction_id: self.chain_index.locate(transaction_id) is not None
+            if not check_block_duplicates(block, confirmed):
+                return False
 
-        # Supprime les transactions courante si elle sont déjà dans le bloc
-        for t in block['transactions']:
-            for ct in current_transactions:
-                if ct.sender == t['sender'] and ct.receiver == t['receiver'] and ct.signature == t['signature']:
-                    try:
-                        self.current_transactions.remove(ct)
-                    except:
-                        print('Error remove current transaction')
+            # Check la récompense et qu'aucun envoyeur ne dépense plus que son solde
+            if not check_block_balances(block, self.account_state, MINING_REWARD):
+                return False
+
+            self.blockchain.append(block)
+            self.apply_block(block)
+
+            # Supprime les transactions courante si elle sont déjà dans le bloc (recherche par identifiant)
+            self.current_transactions.remove_confirmed(transactions)
+            # puis celles que le solde des envoyeurs du bloc ne couvre plus (dépense concurrente)
+            self.drop_unaffordable({transaction.sender for transaction in transactions[:-1]})
+        logger.debug('Block added: height %s, hash %s', block.index, block.get_hash())
+        self.notify('block')
         return True
 
 
     # Mine a new block in the Blockchain ( Create a new block and add open transactions to it )
-    def mine_block(self):
+    def mine_block(self, workers=None, cancel=None):
         """
         Mine le block courant:
             - Cherche PoW
@@ -279,46 +827,146 @@ class Blockchain:
             - Si trouvé, gagne reward
             - Envoi le bloc à tous les noeuds connus
             - Supprime les transactions courante de la blockchaine courante
-        :return <Block>: retourne le block si miné / None si erreur
+        :param workers: nombre de processus de minage (par défaut celui du moteur)
+        :param cancel: threading.Event optionnel qui annule la recherche du PoW
+        :return <Block>: retourne le block si miné / None si erreur ou recherche annulée
         """
         if self.public_key == None:
-            print("Wallet not initialized, GET /wallet")
+            logger.warning('Wallet not initialized, GET /wallet')
             return None
 
-        # Le mineur hash le dernier block et cherche le proof number
-        hashed_block = self.hash_block(self.blockchain[-1])
-        proof = self.proof_of_work()
-
+        # Le mineur hash le dernier block et cherche le proof number sur l'en-tête du bloc :
+        # transactions choisies pour le bloc (dans la limite de taille, frais les plus élevés d'abord)
+        # et récompense du mineur (récompense + frais des transactions), engagées par la racine de Merkle
+        # Les autres restent en cours. La recherche est faite hors du verrou
+        (hashed_block, current_transactions, target, timestamp), proof = self.proof_of_work(workers, cancel)
+        if proof is None:
+            return None
 
         # On vérifie si chaque transaction est valide
-        current_transactions = self.current_transactions[:]
-        for tx in current_transactions:
-            if not Wallet.verify_transaction(tx):
-                return None
+        # (les transactions vérifiées à leur arrivée ne sont pas re-vérifiées)
+        mined = current_transactions[:-1]
+        if not Wallet.verify_transactions(mined):
+            return None
 
-        # Création de la transaction récompense pour le mineur
-        reward_transaction = Transaction('Mining reward', self.public_key, '', MINING_REWARD)
-        current_transactions.append(reward_transaction)
+        with self.lock.write():
+            # Le bloc est obsolète si un autre bloc a été ajouté pendant la recherche
+            # ou si une des transactions minées n'est plus en cours
+            if self.hash_block(self.blockchain[-1]) != hashed_block:
+                return None
+            if any(tx.get_id() not in self.current_transactions for tx in mined):
+                return None
 
-        block = Block(len(self.blockchain), hashed_block,
-                      current_transactions, proof)
-        self.blockchain.append(block)
-        self.current_transactions = []
+            block = Block(len(self.blockchain), hashed_block,
+                          current_transactions, proof, timestamp, target, BLOCK_VERSION)
+            self.blockchain.append(block)
+            self.apply_block(block)
+            # Les transactions arrivées pendant la recherche restent en cours pour le prochain bloc
+            self.current_transactions.remove_confirmed(mined)
+            self.drop_unaffordable({transaction.sender for transaction in mined})
+        self.notify('block')
 
         # Envoi le bloc à tout les noeuds connus
-        for node in self.nodes:
-            url = 'http://{}/store-received-block'.format(node)
-            converted_block = block.__dict__.copy()
-            # Converti les transactions en dict (JSON)
-            converted_block['transactions'] = [transaction.__dict__ for transaction in converted_block['transactions']]
-            data = {'block': converted_block}
-            print(converted_block)
-            try:
-                response = requests.post(url, json=data)
-                if response.status_code == 201:
-                    print("bloc sent to {}".format(node))
-            except :
-                print("Error Mine block, store-received-block")
-                continue
+        # Le bloc est envoyé encodé en binaire (codec.py), plus compact que le JSON
+        # L'envoi est fait en arrière-plan (voir broadcast.py)
+        metrics.blocks_mined.inc()
+        logger.info('Block mined: height %s, hash %s, %s transactions', block.index, block.get_hash(),
+                    len(block.transactions))
+        self.relay_block(block)
 
         return block
+
+
+    def relay_block(self, block):
+        """
+        Envoie un bloc (miné ou reçu et ajouté) aux meilleurs noeuds connus, en arrière-plan (voir broadcast.py) :
+        bloc compact (en-tête et identifiants courts des transactions, voir compact.py) pour les blocs à en-tête,
+        les noeuds demandent ensuite les transactions qu'ils n'ont pas. Bloc complet sinon
+        """
+        if block.version != HEADER_BLOCK_VERSION:
+            self.broadcaster.broadcast(self.nodes.select(), '/store-received-block',
+                                       data=encode_block(block), headers={'Content-Type': CONTENT_TYPE})
+            return
+        self.broadcaster.broadcast(self.nodes.select(), '/compact-block', self._compact_block_callback(block),
+                                   data=CompactBlock.from_block(block).encode(),
+                                   headers={'Content-Type': CONTENT_TYPE})
+
+
+    def _compact_block_callback(self, block):
+        # Réponse d'un noeud au bloc compact (ou aux transactions envoyées) :
+        #   - 200 et positions manquantes : envoi de ces transactions seulement
+        #   - 404 : noeud sans relais compact, envoi du bloc complet
+        def callback(node, response):
+            if response.status_code == 404:
+                self.broadcaster.broadcast([node], '/store-received-block',
+                                           data=encode_block(block), headers={'Content-Type': CONTENT_TYPE})
+                return
+            if response.status_code != 200:
+                return
+            mined = block.transactions[:-1]
+            try:
+                missing = response.json()['missing']
+                if not all(isinstance(position, int) and 0 <= position < len(mined) for position in missing):
+                    raise ValueError(missing)
+            except (ValueError, KeyError, TypeError):
+                logger.warning('Invalid compact block response from %s', node)
+                return
+            transactions = [mined[position] for position in missing]
+            self.broadcaster.broadcast([node], '/compact-block/transactions', callback,
+                                       data=encode_block_transactions(block.get_hash(), transactions),
+                                       headers={'Content-Type': CONTENT_TYPE})
+        return callback
+
+
+    def receive_compact_block(self, compact):
+        """
+        Reconstruit un bloc compact reçu depuis les transactions en cours
+
+        :param compact: <CompactBlock> (PoW déjà vérifié)
+        :return <tuple>: (<Block> complet ou None, positions des transactions à demander au mineur)
+        """
+        with self.lock.read():
+            transactions, missing = compact.reconstruct(self.current_transactions)
+        if not missing:
+            block = compact.to_block(transactions)
+            if block is not None:
+                metrics.compact_block_transactions.labels(source='mempool').inc(len(transactions))
+                return block, []
+            # collision d'identifiants courts : toutes les transactions sont demandées
+            missing = list(range(len(transactions)))
+        metrics.compact_block_transactions.labels(source='mempool').inc(len(transactions) - len(missing))
+        self.partial_blocks.add(compact, transactions, missing)
+        return None, missing
+
+
+    def complete_compact_block(self, block_hash, received):
+        """
+        Complète un bloc compact en attente avec les transactions manquantes reçues du mineur
+        Le bloc en attente n'est retiré qu'une fois reconstruit : des transactions invalides
+        (envoyées par n'importe quel pair) ne font pas oublier le bloc
+
+        :param received: transactions reçues, dans l'ordre des positions demandées
+        :return <tuple>: (<Block> complet ou None, positions encore à demander ou None si le bloc
+                         est inconnu ou les transactions invalides)
+        """
+        partial = self.partial_blocks.get(block_hash)
+        if partial is None:
+            return None, None
+        compact, transactions, missing = partial
+        if len(received) != len(missing):
+            return None, None
+        transactions = list(transactions)
+        for position, transaction in zip(missing, received):
+            transactions[position] = transaction
+        block = compact.to_block(transactions)
+        if block is not None:
+            self.partial_blocks.pop(block_hash)
+            metrics.compact_block_transactions.labels(source='requested').inc(len(received))
+            return block, []
+        if len(missing) == len(transactions):
+            # toutes les transactions ont été reçues : elles sont invalides, le bloc reste en attente
+            return None, None
+        # collision avec une transaction en cours : toutes les transactions sont demandées
+        missing = list(range(len(transactions)))
+        self.partial_blocks.add(compact, transactions, missing)
+        return None, missing
@@ -0,0 +1,180 @@
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import threading
+from time import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# nombre maximal d'envois simultanés (tous noeuds confondus)
+MAX_WORKERS = 16
+# délai maximal d'une requête vers un noeud (connexion, réponse) en secondes
+TIMEOUT = 3.0
+# nombre de nouvelles tentatives après une erreur réseau
+MAX_RETRIES = 3
+# délai avant la première nouvelle tentative (doublé à chaque fois)
+BACKOFF = 0.5
+# nombre maximal d'envois en attente de nouvelle tentative par noeud
+MAX_PENDING_RETRIES = 1000
+
+
+# Envoi des transactions et des blocs aux autres noeuds
+class Broadcaster():
+
+    def __init__(self, max_workers=MAX_WORKERS, timeout=TIMEOUT, max_retries=MAX_RETRIES, backoff=BACKOFF,
+                 peers=None):
+        """
+        Les envois sont faits en arrière-plan (pool de threads) : l'appelant n'attend pas les noeuds
+            - une session HTTP (connexions keep-alive) par noeud
+            - délai maximal par requête
+            - nouvelles tentatives avec délai croissant si un noeud ne répond pas
+            - statistiques d'envoi par noeud
+
+        :param max_workers: nombre maximal d'envois simultanés
+        :param timeout: délai maximal d'une requête (secondes)
+        :param max_retries: nombre de nouvelles tentatives après une erreur réseau
+        :param backoff: délai avant la première nouvelle tentative (secondes)
+        :param peers: <PeerManager> optionnel, informé de la latence et des échecs de chaque envoi
+                      (pas de nouvelle tentative vers un pair oublié)
+        """
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.peers = peers
+
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='broadcast')
+        self.sessions = {}
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+        # File des nouvelles tentatives : (date, numéro, noeud, chemin, paramètres, tentative, callback)
+        self.retries = []
+        self.retry_count = 0
+        self.retry_ready = threading.Condition(self.lock)
+        self.retry_thread = None
+
+
+    def _session(self, node):
+        with self.lock:
+            session = self.sessions.get(node)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self.sessions[node] = session
+            return session
+
+
+    def _node_metrics(self, node):
+        # À appeler avec self.lock
+        metrics = self.metrics.get(node)
+        if metrics is None:
+            metrics = {
+                'delivered': 0,
+                'rejected': 0,
+                'failed': 0,
+                'retries': 0,
+                'pending_retries': 0,
+                'total_latency': 0.0,
+                'last_latency': None,
+                'last_error': None
+            }
+            self.metrics[node] = metrics
+        return metrics
+
+
+    def broadcast(self, nodes, path, callback=None, **kwargs):
+        """
+        Envoie une requête POST à chaque noeud, sans attendre les réponses
+
+        :param nodes: noeuds destinataires (host:port)
+        :param path: chemin de la route (ex: '/store-received-block')
+        :param callback: fonction optionnelle appelée avec (noeud, réponse) quand un noeud répond
+                         (dans le thread d'envoi, ex: envoi d'une suite selon la réponse)
+        :param kwargs: paramètres de requests.post (json, data, headers)
+        :return <list>: futures des envois (résultat : Vrai si le noeud a accepté)
+        """
+        return [self.executor.submit(self._deliver, node, path, kwargs, 0, callback) for node in list(nodes)]
+
+
+    def _deliver(self, node, path, kwargs, attempt, callback=None):
+        url = 'http://{}{}'.format(node, path)
+        start = time()
+        try:
+            response = self._session(node).post(url, timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            metrics.broadcast_seconds.labels(peer=node, result='failed').observe(time() - start)
+            if self.peers is not None:
+                self.peers.record_failure(node, e)
+            self._failed(node, path, kwargs, attempt, callback, e)
+            return False
+
+        latency = time() - start
+        result = 'delivered' if response.status_code < 300 else 'rejected'
+        metrics.broadcast_seconds.labels(peer=node, result=result).observe(latency)
+        if self.peers is not None:
+            self.peers.record_success(node, latency)
+        with self.lock:
+            node_metrics = self._node_metrics(node)
+            node_metrics['total_latency'] += latency
+            node_metrics['last_latency'] = latency
+            if response.status_code < 300:
+                node_metrics['delivered'] += 1
+            else:
+                # le noeud a répondu mais refusé (ex: doublon, bloc déjà connu) : pas de nouvelle tentative
+                node_metrics['rejected'] += 1
+        if callback is not None:
+            callback(node, response)
+        return response.status_code < 300
+
+
+    def _failed(self, node, path, kwargs, attempt, callback, error):
+        with self.lock:
+            node_metrics = self._node_metrics(node)
+            node_metrics['last_error'] = str(error)
+            forgotten = self.peers is not None and node not in self.peers
+            if attempt >= self.max_retries or node_metrics['pending_retries'] >= MAX_PENDING_RETRIES or forgotten:
+                node_metrics['failed'] += 1
+                return
+            node_metrics['retries'] += 1
+            node_metrics['pending_retries'] += 1
+            self.retry_count += 1
+            due = time() + self.backoff * 2 ** attempt
+            heapq.heappush(self.retries, (due, self.retry_count, node, path, kwargs, attempt + 1, callback))
+            if self.retry_thread is None:
+                self.retry_thread = threading.Thread(target=self._retry_loop, daemon=True)
+                self.retry_thread.start()
+            self.retry_ready.notify()
+
+
+    def _retry_loop(self):
+        # Relance les envois en attente quand leur délai est écoulé
+        with self.lock:
+            while True:
+                if not self.retries:
+                    self.retry_ready.wait()
+                    continue
+                due = self.retries[0][0]
+                now = time()
+                if due > now:
+                    self.retry_ready.wait(due - now)
+                    continue
+                _, _, node, path, kwargs, attempt, callback = heapq.heappop(self.retries)
+                self._node_metrics(node)['pending_retries'] -= 1
+                self.executor.submit(self._deliver, node, path, kwargs, attempt, callback)
+
+
+    def get_metrics(self):
+        """
+        Retourne les statistiques d'envoi par noeud (dont la latence moyenne)
+        """
+        with self.lock:
+            result = {}
+            for node, metrics in self.metrics.items():
+                answered = metrics['delivered'] + metrics['rejected']
+                result[node] = dict(metrics, average_latency=metrics['total_latency'] / answered if answered else None)
+            return result
@@ -0,0 +1,220 @@
+from bisect import bisect_right
+import sqlite3
+import threading
+
+# envoyeur de la transaction récompense (pas un compte : pas d'historique)
+REWARD_SENDER = 'Mining reward'
+# nombre maximal de transactions d'une page d'historique
+HISTORY_PAGE_SIZE = 100
+
+
+def parse_cursor(cursor):
+    """
+    Converti un curseur 'hauteur:position' en tuple, None si absent
+
+    :raise ValueError: curseur mal formé
+    """
+    if cursor is None:
+        return None
+    height, position = cursor.split(':')
+    return int(height), int(position)
+
+
+def format_cursor(location):
+    return '{}:{}'.format(*location)
+
+
+# Index des transactions et historiques des comptes
+class ChainIndex():
+
+    def __init__(self):
+        """
+        Index secondaires de la chaine maintenus à chaque bloc ajouté/retiré (comme AccountState) :
+            - transactions : id de transaction -> (hauteur, position dans le bloc), recherche en O(1)
+            - history : clé publique -> positions (hauteur, position) de ses transactions envoyées
+              ou reçues, dans l'ordre de la chaine : une page d'historique se trouve en O(log n)
+        """
+        self.transactions = {}
+        self.history = {}
+
+
+    def apply_block(self, block):
+        """
+        Indexe les transactions d'un bloc ajouté en haut de la chaine
+        """
+        for position, transaction in enumerate(block.transactions):
+            location = (block.index, position)
+            # une transaction identique déjà dans la chaine garde sa première position
+            self.transactions.setdefault(transaction.get_id(), location)
+            for account in self._accounts(transaction):
+                self.history.setdefault(account, []).append(location)
+
+
+    def revert_block(self, block):
+        """
+        Retire les transactions d'un bloc retiré du haut de la chaine
+        """
+        for position in reversed(range(len(block.transactions))):
+            transaction = block.transactions[position]
+            location = (block.index, position)
+            if self.transactions.get(transaction.get_id()) == location:
+                del self.transactions[transaction.get_id()]
+            for account in self._accounts(transaction):
+                locations = self.history.get(account)
+                if locations and locations[-1] == location:
+                    locations.pop()
+                    if not locations:
+                        del self.history[account]
+
+
+    @staticmethod
+    def _accounts(transaction):
+        # comptes concernés par la transaction (une seule fois si envoyeur = receveur)
+        accounts = [] if transaction.sender == REWARD_SENDER else [transaction.sender]
+        if transaction.receiver not in accounts:
+            accounts.append(transaction.receiver)
+        return accounts
+
+
+    def locate(self, transaction_id):
+        """
+        Retourne (hauteur, position) de la transaction, None si elle n'est pas dans la chaine
+        """
+        return self.transactions.get(transaction_id)
+
+
+    def get_history(self, account, cursor=None, limit=HISTORY_PAGE_SIZE):
+        """
+        Retourne une page de l'historique d'un compte (dans l'ordre de la chaine)
+
+        :param cursor: (hauteur, position) de la dernière transaction de la page précédente
+        :param limit: nombre maximal de transactions
+        :return <tuple>: (positions (hauteur, position), curseur de la page suivante ou None)
+        """
+        locations = self.history.get(account, [])
+        start = bisect_right(locations, cursor) if cursor is not None else 0
+        page = locations[start:start + limit]
+        next_cursor = page[-1] if page and start + limit < len(locations) else None
+        return page, next_cursor
+
+
+    def clear(self):
+        self.transactions = {}
+        self.history = {}
+
+
+# Index des transactions et historiques des comptes stocké sur disque (chaine persistée)
+class StoredChainIndex():
+
+    def __init__(self, path):
+        """
+        Même index que ChainIndex, dans une base SQLite (txindex.db) mise à jour à chaque bloc ajouté/retiré :
+            - rien n'est chargé en mémoire au démarrage, seuls les blocs absents de l'index sont rejoués (resume)
+            - l'écriture d'un bloc est en O(transactions du bloc), jamais une réécriture de tout l'index
+        Tables : transactions (id -> hauteur, position), history (compte, hauteur, position),
+        blocks (hauteur -> hash des blocs indexés, pour reprendre après un crash ou un changement de chaine)
+
+        :param path: fichier de la base
+        """
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        # journal WAL sans fsync à chaque bloc : un crash peut perdre les derniers blocs indexés (rejoués par resume)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS transactions '
+                        '(id TEXT PRIMARY KEY, height INTEGER, position INTEGER)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS transactions_height ON transactions (height)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS history (account TEXT, height INTEGER, position INTEGER, '
+                        'PRIMARY KEY (account, height, position)) WITHOUT ROWID')
+        self.db.execute('CREATE INDEX IF NOT EXISTS history_height ON history (height)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS blocks (height INTEGER PRIMARY KEY, hash TEXT)')
+        self.db.commit()
+
+
+    def resume(self, block_hash, base, length):
+        """
+        Retire les blocs indexés qui ne sont plus dans la chaine stockée (crash, changement de chaine non indexé)
+
+        :param block_hash: fonction qui retourne le hash du bloc stocké à une hauteur (BlockStore.block_hash)
+        :param base: hauteur du premier bloc stocké
+        :param length: nombre de blocs de la chaine
+        :return <int>: hauteur du premier bloc à indexer (les blocs suivants sont à rejouer)
+        """
+        with self.lock:
+            top = self.db.execute('SELECT MAX(height) FROM blocks').fetchone()[0]
+            height = min(top, length - 1) if top is not None else base - 1
+            while height >= base:
+                row = self.db.execute('SELECT hash FROM blocks WHERE height = ?', (height,)).fetchone()
+                if row is not None and row[0] == block_hash(height):
+                    break
+                height -= 1
+            self._delete_from(height + 1)
+            self.db.commit()
+        return max(height + 1, base)
+
+
+    def _delete_from(self, height):
+        for table in ('transactions', 'history', 'blocks'):
+            self.db.execute('DELETE FROM {} WHERE height >= ?'.format(table), (height,))
+
+
+    def apply_block(self, block):
+        """
+        Indexe les transactions d'un bloc ajouté en haut de la chaine
+        """
+        transactions = []
+        history = []
+        for position, transaction in enumerate(block.transactions):
+            transactions.append((transaction.get_id(), block.index, position))
+            history.extend((account, block.index, position) for account in ChainIndex._accounts(transaction))
+        with self.lock:
+            # une transaction identique déjà dans la chaine garde sa première position
+            self.db.executemany('INSERT OR IGNORE INTO transactions VALUES (?, ?, ?)', transactions)
+            self.db.executemany('INSERT OR IGNORE INTO history VALUES (?, ?, ?)', history)
+            self.db.execute('INSERT OR REPLACE INTO blocks VALUES (?, ?)', (block.index, block.get_hash()))
+            self.db.commit()
+
+
+    def revert_block(self, block):
+        """
+        Retire les transactions d'un bloc retiré du haut de la chaine
+        """
+        with self.lock:
+            self._delete_from(block.index)
+            self.db.commit()
+
+
+    def clear(self):
+        with self.lock:
+            self._delete_from(0)
+            self.db.commit()
+
+
+    def locate(self, transaction_id):
+        """
+        Retourne (hauteur, position) de la transaction, None si elle n'est pas dans la chaine
+        """
+        with self.lock:
+            row = self.db.execute('SELECT height, position FROM transactions WHERE id = ?',
+                                  (transaction_id,)).fetchone()
+        return tuple(row) if row is not None else None
+
+
+    def get_history(self, account, cursor=None, limit=HISTORY_PAGE_SIZE):
+        """
+        Retourne une page de l'historique d'un compte (dans l'ordre de la chaine), voir ChainIndex.get_history
+        """
+        height, position = cursor if cursor is not None else (-1, -1)
+        with self.lock:
+            rows = self.db.execute('SELECT height, position FROM history WHERE account = ? '
+                                   'AND (height > ? OR (height = ? AND position > ?)) '
+                                   'ORDER BY height, position LIMIT ?',
+                                   (account, height, height, position, limit + 1)).fetchall()
+        page = [tuple(row) for row in rows[:limit]]
+        next_cursor = page[-1] if len(rows) > limit else None
+        return page, next_cursor
+
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,258 @@
+import struct
+
+from block import Block
+from header import LEGACY_BLOCK_VERSION
+from keytable import is_hex
+from transaction import Transaction
+
+"""
+Encodage binaire compact des blocs et transactions
+
+Chaque valeur est précédée d'un octet de type, ce qui permet de retrouver exactement
+la valeur d'origine (int/float/string) et donc le même hash de bloc :
+    - n : None
+    - t / F : booléen
+    - i : entier signé 64 bits
+    - L : grand entier (écrit en décimal)
+    - f : flottant 64 bits
+    - x : string hexadécimale (clés, signatures, hash), stockée en octets (2 fois plus petit)
+          les clés des transactions décodées sont internées (keytable)
+    - s : string utf8
+"""
+
+CODEC_VERSION = 4
+# versions précédentes, toujours décodées :
+#   1 : blocs sans cible, transactions sans frais
+#   2 : transactions sans frais
+#   3 : blocs sans version (blocs de l'ancien format, voir header.py)
+LEGACY_CODEC_VERSION = 1
+NO_FEE_CODEC_VERSION = 2
+NO_BLOCK_VERSION_CODEC_VERSION = 3
+SUPPORTED_VERSIONS = (LEGACY_CODEC_VERSION, NO_FEE_CODEC_VERSION, NO_BLOCK_VERSION_CODEC_VERSION, CODEC_VERSION)
+
+# Type de contenu HTTP des blocs/transactions encodés (échanges entre noeuds)
+CONTENT_TYPE = 'application/octet-stream'
+
+_INT = struct.Struct('<q')
+_FLOAT = struct.Struct('<d')
+_LENGTH = struct.Struct('<I')
+
+
+def pack_value(value, out):
+    """
+    Ajoute la valeur encodée au bytearray out
+    """
+    if value is None:
+        out += b'n'
+    elif value is True:
+        out += b't'
+    elif value is False:
+        out += b'F'
+    elif isinstance(value, int):
+        if -2**63 <= value < 2**63:
+            out += b'i'
+            out += _INT.pack(value)
+        else:
+            data = str(value).encode()
+            out += b'L'
+            out += _LENGTH.pack(len(data))
+            out += data
+    elif isinstance(value, float):
+        out += b'f'
+        out += _FLOAT.pack(value)
+    elif isinstance(value, bytes):
+        # octets = clé ou signature (string hexadécimale) déjà convertie
+        out += b'x'
+        out += _LENGTH.pack(len(value))
+        out += value
+    elif isinstance(value, str):
+        if is_hex(value):
+            data = bytes.fromhex(value)
+            out += b'x'
+        else:
+            data = value.encode('utf8')
+            out += b's'
+        out += _LENGTH.pack(len(data))
+        out += data
+    else:
+        raise TypeError('Type non supporté : {}'.format(type(value)))
+
+
+def unpack_value(data, offset, raw=False):
+    """
+    Lit une valeur encodée à la position offset
+
+    :param raw: retourne les strings hexadécimales en octets (sans conversion)
+    :return <tuple>: (valeur, position suivante)
+    """
+    tag = data[offset:offset + 1]
+    offset += 1
+    if tag == b'n':
+        return None, offset
+    if tag == b't':
+        return True, offset
+    if tag == b'F':
+        return False, offset
+    if tag == b'i':
+        return _INT.unpack_from(data, offset)[0], offset + _INT.size
+    if tag == b'f':
+        return _FLOAT.unpack_from(data, offset)[0], offset + _FLOAT.size
+    if tag in (b'x', b's', b'L'):
+        length = _LENGTH.unpack_from(data, offset)[0]
+        offset += _LENGTH.size
+        value = bytes(data[offset:offset + length])
+        offset += length
+        if tag == b'x':
+            return (value if raw else value.hex()), offset
+        if tag == b'L':
+            return int(value), offset
+        return value.decode('utf8'), offset
+    raise ValueError('Type inconnu : {}'.format(tag))
+
+
+def encode_transaction(transaction, out):
+    # Les clés et la signature sont écrites directement depuis leurs octets
+    for value in transaction.raw_fields():
+        pack_value(value, out)
+
+
+def decode_transaction(data, offset, version=CODEC_VERSION):
+    sender, offset = unpack_value(data, offset, True)
+    receiver, offset = unpack_value(data, offset, True)
+    signature, offset = unpack_value(data, offset, True)
+    amount, offset = unpack_value(data, offset)
+    fee = 0
+    if version > NO_FEE_CODEC_VERSION:
+        fee, offset = unpack_value(data, offset)
+    return Transaction(sender, receiver, signature, amount, fee), offset
+
+
+def encode_block(block):
+    """
+    Encode un bloc en binaire
+
+    :param block: <Block>
+    :return <bytes>: bloc encodé
+    """
+    out = bytearray()
+    out.append(CODEC_VERSION)
+    pack_value(block.index, out)
+    pack_value(block.previous_hash, out)
+    pack_value(block.timestamp, out)
+    pack_value(block.proof, out)
+    pack_value(block.target, out)
+    pack_value(block.version, out)
+    out += _LENGTH.pack(len(block.transactions))
+    for transaction in block.transactions:
+        encode_transaction(transaction, out)
+    return bytes(out)
+
+
+def decode_block(data):
+    """
+    Décode un bloc encodé par encode_block
+
+    :param data: <bytes>
+    :return <Block>: bloc décodé
+    :raise ValueError: version inconnue, données vides ou tronquées
+    """
+    if not data:
+        raise ValueError('Bloc vide')
+    version = data[0]
+    if version not in SUPPORTED_VERSIONS:
+        raise ValueError('Version de bloc inconnue : {}'.format(version))
+    try:
+        offset = 1
+        index, offset = unpack_value(data, offset)
+        previous_hash, offset = unpack_value(data, offset)
+        timestamp, offset = unpack_value(data, offset)
+        proof, offset = unpack_value(data, offset)
+        target = None
+        if version != LEGACY_CODEC_VERSION:
+            target, offset = unpack_value(data, offset)
+        block_version = LEGACY_BLOCK_VERSION
+        if version > NO_BLOCK_VERSION_CODEC_VERSION:
+            block_version, offset = unpack_value(data, offset)
+        count = _LENGTH.unpack_from(data, offset)[0]
+        offset += _LENGTH.size
+        transactions = []
+        for _ in range(count):
+            transaction, offset = decode_transaction(data, offset, version)
+            transactions.append(transaction)
+        return Block(index, previous_hash, transactions, proof, timestamp, target, block_version)
+    except (struct.error, TypeError):
+        raise ValueError('Bloc tronqué ou invalide')
+
+
+def encode_transactions(transactions):
+    """
+    Encode une liste de transactions (ex: transactions en cours)
+    """
+    out = bytearray()
+    out.append(CODEC_VERSION)
+    out += _LENGTH.pack(len(transactions))
+    for transaction in transactions:
+        encode_transaction(transaction, out)
+    return bytes(out)
+
+
+def decode_transactions(data, max_count=None):
+    """
+    Décode une liste de transactions encodée par encode_transactions
+
+    :param max_count: nombre maximal de transactions (vérifié avant de décoder)
+    :raise ValueError: version inconnue, données vides ou tronquées, trop de transactions
+    """
+    if not data:
+        raise ValueError('Transactions vides')
+    version = data[0]
+    if version not in SUPPORTED_VERSIONS:
+        raise ValueError('Version inconnue : {}'.format(version))
+    try:
+        count = _LENGTH.unpack_from(data, 1)[0]
+        if max_count is not None and count > max_count:
+            raise ValueError('Too many transactions (max {}).'.format(max_count))
+        offset = 1 + _LENGTH.size
+        transactions = []
+        for _ in range(count):
+            transaction, offset = decode_transaction(data, offset, version)
+            transactions.append(transaction)
+    except (struct.error, TypeError):
+        raise ValueError('Transactions tronquées ou invalides')
+    return transactions
+
+
+def frame(data):
+    """
+    Préfixe un bloc encodé par sa taille (élément d'une suite de blocs)
+    """
+    return _LENGTH.pack(len(data)) + data
+
+
+def encode_block_stream(blocks):
+    """
+    Encode une suite de blocs : chaque bloc encodé est précédé de sa taille
+
+    :param blocks: liste (ou itérable) de <Block>
+    :return <bytes>: blocs encodés
+    """
+    return b''.join(frame(encode_block(block)) for block in blocks)
+
+
+def decode_block_stream(data):
+    """
+    Décode une suite de blocs encodée par encode_block_stream
+
+    :return <list>: liste de <Block>
+    :raise ValueError: données tronquées ou bloc invalide
+    """
+    blocks = []
+    offset = 0
+    while offset < len(data):
+        if offset + _LENGTH.size > len(data):
+            raise ValueError('Suite de blocs tronquée')
+        length = _LENGTH.unpack_from(data, offset)[0]
+        offset += _LENGTH.size
+        blocks.append(decode_block(data[offset:offset + length]))
+        offset += length
+    return blocks
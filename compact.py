@@ -0,0 +1,241 @@
+from collections import OrderedDict
+import hashlib as hl
+import struct
+import threading
+
+from block import Block
+from codec import pack_value, unpack_value, encode_transaction, decode_transaction, CODEC_VERSION
+from header import HEADER_BLOCK_VERSION, check_header_fields, header_prefix, encode_nonce
+from keytable import is_hex
+
+"""
+Relais compact des blocs à en-tête (voir header.py)
+
+Les noeuds ont déjà presque toutes les transactions d'un bloc miné (relais des transactions en cours) :
+le bloc est envoyé sans ses transactions
+    - champs de l'en-tête, racine de Merkle comprise : le receveur calcule le hash du bloc
+      et vérifie le PoW avant de chercher les transactions
+    - identifiant court de chaque transaction (SHORT_ID_SIZE premiers octets de son id)
+    - transaction récompense complète (elle n'est jamais dans les transactions en cours)
+
+Le receveur reconstruit le bloc depuis ses transactions en cours et ne demande au mineur que les
+transactions manquantes (positions dans le bloc). Deux transactions en cours avec le même identifiant
+court sont traitées comme manquantes ; une collision avec une transaction absente du bloc donne une
+racine de Merkle différente : toutes les transactions sont alors demandées.
+"""
+
+# octets de l'id (sha256) d'une transaction gardés dans un bloc compact
+SHORT_ID_SIZE = 6
+# nombre maximal de blocs compacts en attente de transactions manquantes
+MAX_PARTIAL_BLOCKS = 16
+
+_LENGTH = struct.Struct('<I')
+
+
+def short_id(transaction_id):
+    """
+    Retourne l'identifiant court (octets) d'une transaction depuis son id (hexadécimal)
+    """
+    return bytes.fromhex(transaction_id[:2 * SHORT_ID_SIZE])
+
+
+# Bloc sans ses transactions (identifiants courts)
+class CompactBlock():
+
+    def __init__(self, index, previous_hash, timestamp, proof, target, version, merkle_root, short_ids, reward):
+        """
+        :param merkle_root: racine de Merkle des transactions du bloc (hexadécimal)
+        :param short_ids: identifiants courts des transactions du bloc, sauf la récompense
+        :param reward: <Transaction> récompense du mineur (dernière transaction du bloc)
+        :raise ValueError: bloc de l'ancien format ou champs qui ne tiennent pas dans l'en-tête
+        """
+        if version != HEADER_BLOCK_VERSION:
+            raise ValueError('Relais compact réservé aux blocs à en-tête')
+        check_header_fields(version, previous_hash, timestamp, proof, target)
+        if not isinstance(merkle_root, str) or len(merkle_root) != 64 or not is_hex(merkle_root):
+            raise ValueError('Racine de Merkle invalide')
+        self.index = index
+        self.previous_hash = previous_hash
+        self.timestamp = timestamp
+        self.proof = proof
+        self.target = target
+        self.version = version
+        self.merkle_root = merkle_root
+        self.short_ids = short_ids
+        self.reward = reward
+        self._hash = None
+
+
+    @staticmethod
+    def from_block(block):
+        transactions = block.transactions[:-1]
+        return CompactBlock(block.index, block.previous_hash, block.timestamp, block.proof, block.target,
+                            block.version, block.get_merkle_root(),
+                            [short_id(transaction.get_id()) for transaction in transactions],
+                            block.transactions[-1])
+
+
+    def get_hash(self):
+        """
+        Retourne le hash du bloc (hash de l'en-tête, le même que celui du bloc reconstruit)
+        """
+        if self._hash is None:
+            header = header_prefix(self.version, self.previous_hash, self.merkle_root, self.timestamp,
+                                   self.target) + encode_nonce(self.proof)
+            self._hash = hl.sha256(header).hexdigest()
+        return self._hash
+
+
+    def valid_proof(self):
+        """
+        Check le PoW de l'en-tête avant de reconstruire le bloc
+        """
+        return int(self.get_hash(), 16) <= self.target
+
+
+    def reconstruct(self, transactions):
+        """
+        Retrouve les transactions du bloc parmi des transactions connues (transactions en cours)
+
+        :param transactions: itérable de <Transaction>
+        :return <tuple>: (transactions du bloc, None aux positions manquantes ; positions manquantes)
+        """
+        wanted = set(self.short_ids)
+        known = {}
+        for transaction in transactions:
+            key = short_id(transaction.get_id())
+            if key in wanted:
+                # identifiant court ambigu : la transaction est demandée
+                known[key] = None if key in known else transaction
+        found = [known.get(key) for key in self.short_ids]
+        return found, [position for position, transaction in enumerate(found) if transaction is None]
+
+
+    def to_block(self, transactions):
+        """
+        Retourne le bloc complet, None si ses transactions ne donnent pas la racine de Merkle annoncée
+
+        :param transactions: transactions du bloc sans la récompense
+        """
+        block = Block(self.index, self.previous_hash, list(transactions) + [self.reward], self.proof,
+                      self.timestamp, self.target, self.version)
+        if block.get_merkle_root() != self.merkle_root:
+            return None
+        return block
+
+
+    def encode(self):
+        out = bytearray()
+        out.append(CODEC_VERSION)
+        pack_value(self.index, out)
+        pack_value(self.previous_hash, out)
+        pack_value(self.timestamp, out)
+        pack_value(self.proof, out)
+        pack_value(self.target, out)
+        pack_value(self.version, out)
+        pack_value(self.merkle_root, out)
+        out += _LENGTH.pack(len(self.short_ids))
+        for key in self.short_ids:
+            out += key
+        encode_transaction(self.reward, out)
+        return bytes(out)
+
+
+    @staticmethod
+    def decode(data):
+        """
+        Décode un bloc compact encodé par encode
+
+        :raise ValueError: version ou champ invalide, données tronquées
+        """
+        if not data or data[0] != CODEC_VERSION:
+            raise ValueError('Version de bloc compact inconnue')
+        try:
+            offset = 1
+            index, offset = unpack_value(data, offset)
+            previous_hash, offset = unpack_value(data, offset)
+            timestamp, offset = unpack_value(data, offset)
+            proof, offset = unpack_value(data, offset)
+            target, offset = unpack_value(data, offset)
+            version, offset = unpack_value(data, offset)
+            merkle_root, offset = unpack_value(data, offset)
+            count = _LENGTH.unpack_from(data, offset)[0]
+            offset += _LENGTH.size
+            end = offset + count * SHORT_ID_SIZE
+            if end > len(data):
+                raise ValueError('Bloc compact tronqué')
+            short_ids = [bytes(data[i:i + SHORT_ID_SIZE]) for i in range(offset, end, SHORT_ID_SIZE)]
+            reward, _ = decode_transaction(data, end)
+        except struct.error:
+            raise ValueError('Bloc compact tronqué')
+        return CompactBlock(index, previous_hash, timestamp, proof, target, version, merkle_root, short_ids, reward)
+
+
+def encode_block_transactions(block_hash, transactions):
+    """
+    Encode les transactions manquantes d'un bloc compact (réponse du mineur)
+
+    :param block_hash: hash du bloc
+    :param transactions: transactions demandées, dans l'ordre des positions demandées
+    """
+    out = bytearray()
+    out.append(CODEC_VERSION)
+    pack_value(block_hash, out)
+    out += _LENGTH.pack(len(transactions))
+    for transaction in transactions:
+        encode_transaction(transaction, out)
+    return bytes(out)
+
+
+def decode_block_transactions(data):
+    """
+    :return <tuple>: (hash du bloc, liste de <Transaction>)
+    :raise ValueError: version inconnue, données tronquées
+    """
+    if not data or data[0] != CODEC_VERSION:
+        raise ValueError('Version inconnue')
+    try:
+        block_hash, offset = unpack_value(data, 1)
+        count = _LENGTH.unpack_from(data, offset)[0]
+        offset += _LENGTH.size
+        transactions = []
+        for _ in range(count):
+            transaction, offset = decode_transaction(data, offset)
+            transactions.append(transaction)
+    except struct.error:
+        raise ValueError('Transactions tronquées')
+    return block_hash, transactions
+
+
+# Blocs compacts en attente de leurs transactions manquantes (les plus anciens sont oubliés)
+class PartialBlocks():
+
+    def __init__(self, max_blocks=MAX_PARTIAL_BLOCKS):
+        self.max_blocks = max_blocks
+        self.lock = threading.Lock()
+        # hash du bloc -> (bloc compact, transactions trouvées, positions manquantes)
+        self.blocks = OrderedDict()
+
+
+    def add(self, compact, transactions, missing):
+        with self.lock:
+            self.blocks[compact.get_hash()] = (compact, transactions, missing)
+            while len(self.blocks) > self.max_blocks:
+                self.blocks.popitem(last=False)
+
+
+    def get(self, block_hash):
+        """
+        Retourne le bloc en attente sans le retirer (les transactions reçues sont vérifiées avant pop)
+        """
+        with self.lock:
+            return self.blocks.get(block_hash)
+
+
+    def pop(self, block_hash):
+        with self.lock:
+            return self.blocks.pop(block_hash, None)
+
+
+    def __len__(self):
+        return len(self.blocks)
@@ -0,0 +1,143 @@
+from time import time
+
+
+# plus grande cible possible (hash de 256 bits)
+MAX_TARGET = 2 ** 256 - 1
+
+
+def prefix_target(zeros):
+    """
+    Converti une difficulté exprimée en préfixe de zéros hexadécimaux (ex: '00') en cible numérique :
+    un hash commence par ce préfixe si et seulement si il est inférieur ou égal à la cible
+    """
+    return MAX_TARGET >> (4 * len(zeros))
+
+
+# cible des blocs de l'ancien format (sans cible dans le bloc, hash commençant par '00')
+LEGACY_TARGET = prefix_target('00')
+# cible du premier bloc qui en contient une
+INITIAL_TARGET = LEGACY_TARGET
+# nombre de blocs entre deux ajustements de la cible
+RETARGET_WINDOW = 20
+# temps visé entre deux blocs (secondes)
+BLOCK_INTERVAL = 10.0
+# facteur maximal d'ajustement de la cible en une fois
+MAX_ADJUSTMENT = 4
+# avance maximale de la date d'un bloc sur l'horloge locale (secondes)
+MAX_FUTURE_DRIFT = 2 * 60 * 60
+
+
+def block_target(block):
+    """
+    Retourne la cible du bloc (LEGACY_TARGET pour les blocs de l'ancien format)
+    """
+    return block.target if block.target is not None else LEGACY_TARGET
+
+
+def block_work(block):
+    """
+    Retourne le travail d'un bloc : nombre moyen de hash à calculer pour trouver son PoW, 2**256 // (cible + 1)
+    La meilleure chaine est celle qui a le plus de travail cumulé, pas la plus longue : des dates
+    décalées font baisser la difficulté et permettent de produire plus de blocs avec moins de travail
+    """
+    return 2 ** 256 // (block_target(block) + 1)
+
+
+def chain_work(blocks):
+    """
+    Retourne le travail cumulé d'une suite de blocs
+    """
+    return sum(block_work(block) for block in blocks)
+
+
+def target_to_hex(target):
+    return '{:064x}'.format(target)
+
+
+def hex_to_target(value):
+    return int(value, 16)
+
+
+# Ajustement de la difficulté
+class DifficultyAdjuster():
+
+    def __init__(self, window=RETARGET_WINDOW, interval=BLOCK_INTERVAL, initial_target=INITIAL_TARGET):
+        """
+        Chaque bloc contient sa cible (entier de 256 bits) : le hash du PoW doit être inférieur ou égal
+        Tous les window blocs, la cible est ajustée pour que les blocs soient espacés de interval secondes :
+            nouvelle cible = cible * temps mis par les window derniers blocs / temps visé
+        (ajustement borné à un facteur MAX_ADJUSTMENT)
+
+        :param window: nombre de blocs entre deux ajustements
+        :param interval: temps visé entre deux blocs (secondes)
+        :param initial_target: cible du premier bloc qui en contient une
+        """
+        self.window = max(2, int(window))
+        self.interval = interval
+        self.initial_target = initial_target
+
+
+    def next_target(self, get_block, height):
+        """
+        Calcule la cible attendue du bloc à la hauteur height
+
+        :param get_block: fonction qui retourne le bloc d'une hauteur (< height), ex: chain.__getitem__
+        :param height: hauteur du bloc
+        :return <int>: cible du bloc
+        """
+        previous = get_block(height - 1)
+        if previous.target is None:
+            # premier bloc avec une cible après des blocs de l'ancien format
+            return self.initial_target
+        if height % self.window or height < self.window:
+            return previous.target
+        first = get_block(height - self.window)
+        if first.target is None:
+            return previous.target
+
+        # temps mis par les window derniers blocs, en millisecondes (calcul en entiers)
+        expected = int(self.interval * (self.window - 1) * 1000)
+        actual = int((previous.timestamp - first.timestamp) * 1000)
+        actual = max(expected // MAX_ADJUSTMENT, min(actual, expected * MAX_ADJUSTMENT))
+        return max(1, min(MAX_TARGET, previous.target * actual // max(1, expected)))
+
+
+    def check_block(self, block, get_block, now=None):
+        """
+        Check la cible et la date d'un bloc par rapport aux blocs précédents
+
+        :param get_block: fonction qui retourne le bloc d'une hauteur (< block.index)
+        :return <boolean>: Vrai si valide, Faux sinon
+        """
+        if block.index == 0:
+            return True
+        previous = get_block(block.index - 1)
+        if block.target is None:
+            # ancien format accepté uniquement tant que la chaine n'a pas de cible
+            return previous.target is None
+        now = time() if now is None else now
+        if block.timestamp < previous.timestamp or block.timestamp > now + MAX_FUTURE_DRIFT:
+            return False
+        return block.target == self.next_target(get_block, block.index)
+
+
+    def check_blocks(self, blocks, get_block):
+        """
+        Check les cibles et dates d'une suite de blocs
+
+        :param blocks: liste de <Block> consécutifs
+        :param get_block: fonction qui retourne les blocs qui précèdent blocks
+        :return <int>: position du premier bloc invalide, None si tout est valide
+        """
+        if not blocks:
+            return None
+        start = blocks[0].index
+
+        def lookup(height):
+            return blocks[height - start] if height >= start else get_block(height)
+
+        now = time()
+        for position, block in enumerate(blocks):
+            if not self.check_block(block, lookup, now):
+                return position
+        return None
@@ -0,0 +1,121 @@
+import hashlib as hl
+import struct
+
+from keytable import is_hex
+
+"""
+En-tête binaire des blocs (taille fixe)
+
+    version (4 octets) | hash précédent (32) | racine de Merkle (32) | date (flottant 8) | cible (32) | nonce (8)
+
+Le PoW et le hash des blocs de version HEADER_BLOCK_VERSION portent sur cet en-tête uniquement :
+chaque proof testé hashe HEADER_SIZE octets quelle que soit la taille du bloc,
+les transactions (récompense comprise) sont engagées par la racine de Merkle.
+Les blocs LEGACY_BLOCK_VERSION (PoW sur le repr des transactions, hash JSON) restent valides
+tant qu'ils suivent un bloc de la même version.
+"""
+
+# PoW sur str(transactions) + hash précédent + proof, hash = JSON du bloc
+LEGACY_BLOCK_VERSION = 1
+# PoW et hash sur l'en-tête binaire
+HEADER_BLOCK_VERSION = 2
+# version des blocs minés
+BLOCK_VERSION = HEADER_BLOCK_VERSION
+BLOCK_VERSIONS = (LEGACY_BLOCK_VERSION, HEADER_BLOCK_VERSION)
+
+_PREFIX = struct.Struct('>I32s32sd32s')
+_NONCE = struct.Struct('>Q')
+HEADER_SIZE = _PREFIX.size + _NONCE.size
+# plus grand nonce (proof) d'un en-tête
+MAX_NONCE = 2 ** 64 - 1
+
+
+def check_header_fields(version, previous_hash, timestamp, proof, target):
+    """
+    Check que les champs d'un bloc peuvent être écrits dans son en-tête (bloc reçu d'un autre noeud)
+
+    :raise ValueError: version inconnue ou champ invalide
+    """
+    if version not in BLOCK_VERSIONS:
+        raise ValueError('Version de bloc inconnue : {}'.format(version))
+    if version == LEGACY_BLOCK_VERSION:
+        return
+    if not isinstance(previous_hash, str) or len(previous_hash) != 64 or not is_hex(previous_hash):
+        raise ValueError('Hash précédent invalide')
+    if not isinstance(timestamp, (int, float)) or isinstance(timestamp, bool):
+        raise ValueError('Date invalide')
+    if not isinstance(proof, int) or isinstance(proof, bool) or not 0 <= proof <= MAX_NONCE:
+        raise ValueError('Proof invalide')
+    if not isinstance(target, int) or not 0 < target < 2 ** 256:
+        raise ValueError('Cible invalide')
+
+
+def header_prefix(version, previous_hash, merkle_root, timestamp, target):
+    """
+    Retourne l'en-tête sans le nonce : partie fixe hashée pendant la recherche du PoW
+
+    :param previous_hash: hash du bloc précédent (hexadécimal)
+    :param merkle_root: racine de Merkle des transactions du bloc (hexadécimal)
+    :param target: <int> cible du bloc
+    :return <bytes>: en-tête sans le nonce
+    """
+    return _PREFIX.pack(version, bytes.fromhex(previous_hash), bytes.fromhex(merkle_root),
+                        float(timestamp), target.to_bytes(32, 'big'))
+
+
+def encode_nonce(nonce):
+    return _NONCE.pack(nonce)
+
+
+def decode_header(data, offset=0):
+    """
+    Lit un en-tête binaire (client léger : en-têtes reçus de /headers?format=binary)
+
+    :return <dict>: champs de l'en-tête et hash du bloc
+    """
+    version, previous_hash, merkle_root, timestamp, target = _PREFIX.unpack_from(data, offset)
+    nonce = _NONCE.unpack_from(data, offset + _PREFIX.size)[0]
+    return {
+        'version': version,
+        'previous_hash': previous_hash.hex(),
+        'merkle_root': merkle_root.hex(),
+        'timestamp': timestamp,
+        'target': int.from_bytes(target, 'big'),
+        'proof': nonce,
+        'hash': hl.sha256(bytes(data[offset:offset + HEADER_SIZE])).hexdigest()
+    }
+
+
+def verify_headers(data, previous_hash):
+    """
+    Check une suite d'en-têtes binaires sans les blocs (client léger) :
+    chaque en-tête suit le précédent et son hash est inférieur ou égal à sa cible
+
+    :param data: <bytes> en-têtes mis bout à bout
+    :param previous_hash: hash du bloc (déjà vérifié) qui précède le premier en-tête
+    :return <list>: en-têtes décodés (decode_header), None si la suite est invalide
+    """
+    if len(data) % HEADER_SIZE:
+        return None
+    headers = []
+    for offset in range(0, len(data), HEADER_SIZE):
+        header = decode_header(data, offset)
+        if header['version'] != HEADER_BLOCK_VERSION or header['previous_hash'] != previous_hash:
+            return None
+        if int(header['hash'], 16) > header['target']:
+            return None
+        headers.append(header)
+        previous_hash = header['hash']
+    return headers
+
+
+def check_version(block, previous_block):
+    """
+    Check la version d'un bloc par rapport au bloc précédent :
+    un bloc de l'ancien format n'est accepté qu'à la suite d'un bloc de l'ancien format
+
+    :return <boolean>: Vrai si valide, Faux sinon
+    """
+    if block.version == LEGACY_BLOCK_VERSION:
+        return previous_block.version == LEGACY_BLOCK_VERSION
+    return True
@@ -0,0 +1,80 @@
+# Table des clés publiques
+from collections import OrderedDict
+import threading
+
+# nombre maximal de clés gardées : les clés reçues ne sont pas toutes valides (transactions refusées),
+# les clés les moins récemment vues sont oubliées
+MAX_KEYS = 100000
+
+_HEX_CHARS = frozenset('0123456789abcdef')
+
+
+def is_hex(value):
+    """
+    Vrai si value est une string hexadécimale (minuscules) convertible en octets sans perte
+    """
+    return len(value) % 2 == 0 and len(value) > 0 and _HEX_CHARS.issuperset(value)
+
+
+class KeyTable():
+
+    def __init__(self, max_keys=MAX_KEYS):
+        """
+        Table d'internement des clés : chaque clé n'est stockée qu'une fois (en octets),
+        toutes les transactions d'un même envoyeur/receveur partagent le même objet
+        La forme hexadécimale de chaque clé est aussi gardée (une fois par clé)
+
+        :param max_keys: nombre maximal de clés gardées (les moins récemment vues sont oubliées,
+                         les transactions qui les utilisent gardent leur clé en octets)
+        """
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        self.by_hex = {}
+        # clé en octets -> forme hexadécimale, de la moins récemment vue à la plus récente
+        self.by_bytes = OrderedDict()
+
+
+    def intern(self, key):
+        """
+        Retourne l'objet partagé pour cette clé
+
+        :param key: clé en octets ou en hexadécimal
+        :return: octets partagés (ou la string telle quelle si elle n'est pas hexadécimale, ex: 'Mining reward')
+        """
+        if isinstance(key, (bytes, bytearray)):
+            key = bytes(key)
+            with self.lock:
+                key_hex = self.by_bytes.get(key)
+                if key_hex is not None:
+                    self.by_bytes.move_to_end(key)
+                    return self.by_hex[key_hex]
+                key_hex = self.by_bytes[key] = key.hex()
+                self.by_hex[key_hex] = key
+                while len(self.by_bytes) > self.max_keys:
+                    _, old_hex = self.by_bytes.popitem(last=False)
+                    del self.by_hex[old_hex]
+            return key
+        shared = self.by_hex.get(key)
+        if shared is not None:
+            return self.intern(shared)
+        if not isinstance(key, str) or not is_hex(key):
+            return key
+        return self.intern(bytes.fromhex(key))
+
+
+    def to_hex(self, key):
+        """
+        Retourne la forme hexadécimale d'une clé (calculée si la clé a été oubliée)
+        """
+        if isinstance(key, bytes):
+            key_hex = self.by_bytes.get(key)
+            return key_hex if key_hex is not None else key.hex()
+        return key
+
+
+    def __len__(self):
+        return len(self.by_bytes)
+
+
+# Table partagée par toutes les transactions
+keys = KeyTable()
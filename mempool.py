@@ -0,0 +1,185 @@
+from collections import OrderedDict
+
+from codec import encode_transaction
+
+# Politiques quand les transactions en cours dépassent la taille maximale
+EVICT_OLDEST = 'oldest'   # supprime les transactions les plus anciennes
+REJECT_NEW = 'reject'     # refuse la nouvelle transaction
+EVICTION_POLICIES = (EVICT_OLDEST, REJECT_NEW)
+
+
+def transaction_size(transaction):
+    """
+    Taille (octets) de la transaction encodée en binaire (codec.py)
+    """
+    out = bytearray()
+    encode_transaction(transaction, out)
+    return len(out)
+
+
+# Transactions en cours (non validées)
+class Mempool():
+
+    def __init__(self, max_count=None, max_bytes=None, eviction=EVICT_OLDEST):
+        """
+        Transactions en cours indexées par identifiant (Transaction.get_id) :
+            - recherche, ajout et suppression en O(1)
+            - refus des doublons
+            - index par envoyeur et total en attente par envoyeur
+            - taille bornée (nombre et/ou octets) avec politique d'éviction
+
+        :param max_count: nombre maximal de transactions (None = illimité)
+        :param max_bytes: taille maximale en octets (None = illimité)
+        :param eviction: politique si la taille maximale est atteinte (oldest, reject)
+        """
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError('eviction doit valoir {}'.format(', '.join(EVICTION_POLICIES)))
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.eviction = eviction
+
+        # id -> transaction (dans l'ordre d'arrivée)
+        self.transactions = OrderedDict()
+        # id -> taille en octets
+        self.sizes = {}
+        # envoyeur -> ids de ses transactions (dans l'ordre d'arrivée)
+        self.by_sender = {}
+        # envoyeur -> total envoyé en attente (montants + frais)
+        self.pending = {}
+        self.size_bytes = 0
+
+
+    def __len__(self):
+        return len(self.transactions)
+
+
+    def __iter__(self):
+        return iter(list(self.transactions.values()))
+
+
+    def __contains__(self, transaction_id):
+        return transaction_id in self.transactions
+
+
+    def __getitem__(self, item):
+        # Accès comme une liste (ex: transactions[:])
+        return list(self.transactions.values())[item]
+
+
+    def get(self, transaction_id):
+        return self.transactions.get(transaction_id)
+
+
+    def get_sender_transactions(self, sender):
+        """
+        Retourne les transactions en cours d'un envoyeur (dans l'ordre d'arrivée)
+        """
+        return [self.transactions[i] for i in self.by_sender.get(sender, ())]
+
+
+    def pending_spend(self, sender):
+        """
+        Retourne le total envoyé par sender dans les transactions en cours
+        """
+        return self.pending.get(sender, 0)
+
+
+    def _fits(self, size):
+        return ((self.max_count is None or len(self) + 1 <= self.max_count)
+                and (self.max_bytes is None or self.size_bytes + size <= self.max_bytes))
+
+
+    def add(self, transaction):
+        """
+        Ajoute une transaction (si ce n'est pas un doublon)
+        Si la taille maximale est atteinte, applique la politique d'éviction
+
+        :return <list>: transactions évincées, None si la transaction est refusée
+        """
+        transaction_id = transaction.get_id()
+        if transaction_id in self.transactions:
+            return None
+        size = transaction_size(transaction)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return None
+
+        evicted = []
+        while not self._fits(size):
+            if self.eviction == REJECT_NEW or not self.transactions:
+                return None
+            evicted.append(self.remove(next(iter(self.transactions))))
+
+        sender = transaction.sender
+        self.transactions[transaction_id] = transaction
+        self.sizes[transaction_id] = size
+        self.size_bytes += size
+        self.by_sender.setdefault(sender, OrderedDict())[transaction_id] = None
+        self.pending[sender] = self.pending.get(sender, 0) + transaction.cost
+        return evicted
+
+
+    def remove(self, transaction_id):
+        """
+        Supprime une transaction
+
+        :return <Transaction>: la transaction supprimée, None si absente
+        """
+        transaction = self.transactions.pop(transaction_id, None)
+        if transaction is None:
+            return None
+        self.size_bytes -= self.sizes.pop(transaction_id)
+
+        sender = transaction.sender
+        ids = self.by_sender[sender]
+        del ids[transaction_id]
+        if not ids:
+            del self.by_sender[sender]
+        remaining = self.pending[sender] - transaction.cost
+        if remaining or sender in self.by_sender:
+            self.pending[sender] = remaining
+        else:
+            del self.pending[sender]
+        return transaction
+
+
+    def remove_confirmed(self, transactions):
+        """
+        Supprime les transactions validées dans un bloc, en O(k) pour k transactions
+
+        :param transactions: transactions du bloc
+        :return <list>: transactions supprimées des transactions en cours
+        """
+        removed = []
+        for transaction in transactions:
+            found = self.remove(transaction.get_id())
+            if found is not None:
+                removed.append(found)
+        return removed
+
+
+    def remove_unaffordable(self, senders, balance):
+        """
+        Supprime les transactions en cours que le solde validé de leur envoyeur ne couvre plus
+        (ex: dépense concurrente validée dans un bloc reçu, bloc annulé par un changement de chaine)
+        Les transactions de chaque envoyeur sont gardées dans l'ordre d'arrivée tant que leur total
+        (montants + frais) ne dépasse pas son solde
+
+        :param senders: envoyeurs à vérifier (None : tous les envoyeurs)
+        :param balance: fonction qui retourne le solde validé d'un compte
+        :return <list>: transactions supprimées des transactions en cours
+        """
+        removed = []
+        for sender in list(self.by_sender if senders is None else senders):
+            available = balance(sender)
+            if self.pending.get(sender, 0) <= available:
+                continue
+            for transaction in self.get_sender_transactions(sender):
+                if transaction.cost <= available:
+                    available -= transaction.cost
+                else:
+                    removed.append(self.remove(transaction.get_id()))
+        return removed
+
+
+    def clear(self):
+        self.__init__(self.max_count, self.max_bytes, self.eviction)
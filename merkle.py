@@ -0,0 +1,66 @@
+import hashlib as hl
+
+
+# racine d'un bloc sans transaction
+EMPTY_ROOT = '0' * 64
+
+
+def merkle_root(hashes):
+    """
+    Calcule la racine de Merkle d'une liste de hash (hexadécimal)
+    Chaque niveau hashe les paires de noeuds (le dernier est dupliqué si le nombre est impair)
+
+    :param hashes: liste des hash des transactions
+    :return <string>: racine de Merkle (hexadécimal)
+    """
+    if not hashes:
+        return EMPTY_ROOT
+    level = [bytes.fromhex(h) for h in hashes]
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [hl.sha256(level[i] + level[i + 1]).digest() for i in range(0, len(level), 2)]
+    return level[0].hex()
+
+
+def merkle_proof(hashes, position):
+    """
+    Calcule la preuve d'inclusion de la feuille hashes[position] : les voisins de la feuille à la racine
+    (même construction que merkle_root, un noeud sans voisin est son propre voisin)
+
+    :param hashes: liste des hash des transactions
+    :param position: position de la transaction dans la liste
+    :return <list>: liste de (hash du voisin, 'left' ou 'right' : côté du voisin)
+    """
+    if not 0 <= position < len(hashes):
+        raise IndexError('Position hors du bloc : {}'.format(position))
+    proof = []
+    level = [bytes.fromhex(h) for h in hashes]
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        if position % 2:
+            proof.append((level[position - 1].hex(), 'left'))
+        else:
+            proof.append((level[position + 1].hex(), 'right'))
+        level = [hl.sha256(level[i] + level[i + 1]).digest() for i in range(0, len(level), 2)]
+        position //= 2
+    return proof
+
+
+def verify_merkle_proof(leaf, proof, root):
+    """
+    Check qu'une feuille fait partie de l'arbre de racine root (client léger : sans les autres transactions)
+
+    :param leaf: hash de la transaction (hexadécimal)
+    :param proof: preuve retournée par merkle_proof
+    :param root: racine de Merkle de l'en-tête du bloc
+    :return <boolean>: Vrai si la feuille est incluse, Faux sinon
+    """
+    node = bytes.fromhex(leaf)
+    for sibling, side in proof:
+        if side == 'left':
+            node = hl.sha256(bytes.fromhex(sibling) + node).digest()
+        else:
+            node = hl.sha256(node + bytes.fromhex(sibling)).digest()
+    return node.hex() == root
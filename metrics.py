@@ -0,0 +1,269 @@
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+import threading
+
+"""
+Métriques du noeud (compteurs, jauges, histogrammes) exposées au format texte Prometheus (GET /metrics)
+
+Désactivées par défaut : chaque point de mesure ne coûte alors qu'un test de registry.enabled
+(time() retourne un contexte vide, inc/observe/set retournent tout de suite)
+
+Usage :
+    metrics.registry.enable()
+    metrics.pow_attempts.inc(attempts)
+    with metrics.valid_proof_seconds.time():
+        ...
+    metrics.broadcast_seconds.labels(peer=node).observe(latency)
+"""
+
+# bornes des histogrammes de durée (secondes)
+DEFAULT_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+_NULL_CONTEXT = nullcontext()
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return str(value) if isinstance(value, int) else repr(value)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = ('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+               for k, v in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+
+# Métrique (compteur, jauge ou histogramme), éventuellement déclinée par étiquettes (labels)
+class Metric():
+    kind = None
+
+    def __init__(self, registry, name, help, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        # valeurs par étiquettes (tuple des valeurs d'étiquettes -> valeur)
+        self.children = {}
+
+
+    def labels(self, **labels):
+        """
+        Retourne la métrique pour ces valeurs d'étiquettes (ex: peer='localhost:8001')
+        """
+        return _Child(self, tuple(str(labels[name]) for name in self.labelnames))
+
+
+    def samples(self):
+        """
+        Retourne les lignes (nom, étiquettes, valeur) de la métrique
+        """
+        with self.lock:
+            return [(self.name, _format_labels(self.labelnames, key), value)
+                    for key, value in sorted(self.children.items())]
+
+
+# Métrique associée à des valeurs d'étiquettes (voir Metric.labels)
+class _Child():
+    __slots__ = ('metric', 'key')
+
+    def __init__(self, metric, key):
+        self.metric = metric
+        self.key = key
+
+
+    def inc(self, amount=1):
+        self.metric.inc(amount, self.key)
+
+
+    def set(self, value):
+        self.metric.set(value, self.key)
+
+
+    def observe(self, value):
+        self.metric.observe(value, self.key)
+
+
+    def time(self):
+        return self.metric.time(self.key)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, key=()):
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            self.children[key] = self.children.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, registry, name, help, labelnames=(), function=None):
+        """
+        :param function: fonction optionnelle appelée à chaque lecture des métriques (ex: taille des transactions en cours)
+        """
+        Metric.__init__(self, registry, name, help, labelnames)
+        self.function = function
+
+
+    def set(self, value, key=()):
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            self.children[key] = value
+
+
+    def set_function(self, function):
+        """
+        Associe une fonction de lecture à la jauge (valeur calculée à chaque lecture des métriques)
+        """
+        self.function = function
+
+
+    def samples(self):
+        if self.function is not None:
+            return [(self.name, '', self.function())]
+        return Metric.samples(self)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        Metric.__init__(self, registry, name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+
+    def observe(self, value, key=()):
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            child = self.children.get(key)
+            if child is None:
+                # [nombre par borne..., +Inf], somme
+                child = self.children[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts = child[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            child[1] += value
+
+
+    def time(self, key=()):
+        """
+        Contexte qui mesure la durée de son bloc (contexte vide si les métriques sont désactivées)
+        """
+        if not self.registry.enabled:
+            return _NULL_CONTEXT
+        return self._timer(key)
+
+
+    @contextmanager
+    def _timer(self, key):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start, key)
+
+
+    def samples(self):
+        lines = []
+        with self.lock:
+            for key, (counts, total) in sorted(self.children.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = (('le', _format_value(float(bound))),)
+                    lines.append((self.name + '_bucket', _format_labels(self.labelnames, key, le), cumulative))
+                labels = _format_labels(self.labelnames, key)
+                lines.append((self.name + '_sum', labels, total))
+                lines.append((self.name + '_count', labels, cumulative))
+        return lines
+
+
+# Registre des métriques
+class MetricsRegistry():
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.metrics = []
+
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(self, name, help, labelnames))
+
+
+    def gauge(self, name, help, labelnames=(), function=None):
+        return self._add(Gauge(self, name, help, labelnames, function))
+
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(self, name, help, labelnames, buckets))
+
+
+    def render(self):
+        """
+        Retourne les métriques au format texte Prometheus (version 0.0.4)
+        """
+        lines = []
+        for metric in self.metrics:
+            samples = metric.samples()
+            lines.append('# HELP {} {}'.format(metric.name, metric.help))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+            for name, labels, value in samples:
+                lines.append('{}{} {}'.format(name, labels, _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+# Type de contenu HTTP du format texte Prometheus
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Registre partagé par le noeud et métriques des chemins critiques
+registry = MetricsRegistry()
+
+pow_attempts = registry.counter('blockchain_pow_attempts_total', 'Proofs testés par le minage')
+pow_hashrate = registry.gauge('blockchain_pow_hashrate', 'Proofs testés par seconde lors de la dernière recherche')
+pow_search_seconds = registry.histogram('blockchain_pow_search_seconds', 'Durée des recherches de PoW',
+                                        buckets=(0.001, 0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0))
+hash_block_seconds = registry.histogram('blockchain_hash_block_seconds', 'Durée du calcul du hash d\'un bloc')
+valid_proof_seconds = registry.histogram('blockchain_valid_proof_seconds', 'Durée de la vérification du PoW d\'un bloc')
+verify_seconds = registry.histogram('blockchain_signature_verify_seconds',
+                                    'Durée de la vérification d\'une signature (hors cache)', ['scheme'])
+verify_cache_hits = registry.counter('blockchain_signature_cache_hits_total', 'Signatures déjà vérifiées (cache)')
+block_import_seconds = registry.histogram('blockchain_block_import_seconds', 'Durée de l\'ajout d\'un bloc reçu',
+                                          ['result'])
+blocks_mined = registry.counter('blockchain_blocks_mined_total', 'Blocs minés par le noeud')
+chain_height = registry.gauge('blockchain_chain_height', 'Nombre de blocs de la chaine')
+mempool_transactions = registry.gauge('blockchain_mempool_transactions', 'Nombre de transactions en cours')
+mempool_bytes = registry.gauge('blockchain_mempool_bytes', 'Taille des transactions en cours (octets)')
+request_seconds = registry.histogram('blockchain_http_request_seconds', 'Durée des requêtes HTTP par route',
+                                     ['method', 'route', 'status'])
+compact_block_transactions = registry.counter('blockchain_compact_block_transactions_total',
+                                              'Transactions des blocs compacts reçus, par origine', ['source'])
+peers_known = registry.gauge('blockchain_peers_known', 'Nombre de pairs connus')
+peers_available = registry.gauge('blockchain_peers_available',
+                                 'Nombre de pairs connus qui ne sont pas en attente après un échec')
+broadcast_seconds = registry.histogram('blockchain_broadcast_seconds', 'Latence des envois vers chaque noeud',
+                                       ['peer', 'result'])
@@ -0,0 +1,121 @@
+import threading
+from time import time
+
+
+# Mineur en arrière-plan
+class BackgroundMiner():
+
+    def __init__(self, blockchain, workers=None, mine_empty_blocks=False):
+        """
+        Mine en continu dans un thread séparé (les requêtes HTTP ne sont pas bloquées)
+        La recherche du PoW est annulée puis relancée dès que la chaine ou les transactions en cours changent
+
+        :param blockchain: <Blockchain> blockchain du noeud
+        :param workers: nombre de processus de minage (par défaut celui du moteur de la blockchain)
+        :param mine_empty_blocks: mine aussi quand il n'y a aucune transaction en cours
+        """
+        self.blockchain = blockchain
+        self.workers = workers
+        self.mine_empty_blocks = mine_empty_blocks
+
+        self.thread = None
+        self.running = threading.Event()
+        # Event levé à chaque changement : annule la recherche en cours
+        self.restart = threading.Event()
+
+        # Statistiques
+        self.blocks_mined = 0
+        self.restarts = 0
+        self.attempts = 0
+        self.mining_time = 0.0
+        self.last_hashrate = 0.0
+
+        blockchain.add_listener(self.on_change)
+
+
+    def on_change(self, event):
+        """
+        Appelé par la blockchain quand un bloc est ajouté ou que les transactions en cours changent
+        """
+        self.restart.set()
+
+
+    def start(self, workers=None, mine_empty_blocks=None):
+        """
+        Démarre le minage en arrière-plan
+
+        :return <boolean>: Vrai si le mineur a été démarré, Faux s'il tournait déjà
+        """
+        if workers is not None:
+            self.workers = workers
+        if mine_empty_blocks is not None:
+            self.mine_empty_blocks = mine_empty_blocks
+        if self.is_running():
+            return False
+        self.running.set()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return True
+
+
+    def stop(self):
+        """
+        Arrête le minage (la recherche en cours est annulée)
+
+        :return <boolean>: Vrai si le mineur a été arrêté, Faux s'il ne tournait pas
+        """
+        if not self.is_running():
+            return False
+        self.running.clear()
+        self.restart.set()
+        self.thread.join()
+        self.thread = None
+        return True
+
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+
+    def status(self):
+        """
+        Retourne l'état du mineur et son hashrate (proofs testés par seconde)
+        """
+        return {
+            'running': self.is_running(),
+            'workers': self.workers or self.blockchain.pow_engine.workers,
+            'mine_empty_blocks': self.mine_empty_blocks,
+            'blocks_mined': self.blocks_mined,
+            'restarts': self.restarts,
+            'attempts': self.attempts,
+            'hashrate': self.attempts / self.mining_time if self.mining_time else 0.0,
+            'last_hashrate': self.last_hashrate
+        }
+
+
+    def _run(self):
+        while self.running.is_set():
+            self.restart.clear()
+
+            # Attend un wallet et des transactions à miner
+            if self.blockchain.public_key == None or (
+                    not self.mine_empty_blocks and not self.blockchain.current_transactions):
+                self.restart.wait(0.5)
+                continue
+
+            start = time()
+            block = self.blockchain.mine_block(self.workers, self.restart)
+            elapsed = time() - start
+
+            attempts = self.blockchain.pow_engine.last_attempts
+            self.attempts += attempts
+            self.mining_time += elapsed
+            if elapsed:
+                self.last_hashrate = attempts / elapsed
+            if block != None:
+                self.blocks_mined += 1
+            else:
+                self.restarts += 1
+                # Bloc refusé sans changement (ex: transaction invalide) : on évite de boucler
+                if not self.restart.is_set():
+                    self.restart.wait(0.5)
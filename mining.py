@@ -0,0 +1,164 @@
+import hashlib as hl
+import multiprocessing
+import queue
+from time import perf_counter
+
+from difficulty import block_target
+from header import LEGACY_BLOCK_VERSION, encode_nonce
+import metrics
+
+
+# nombre de proofs testés par un worker entre deux vérifications de l'arrêt
+CHUNK_SIZE = 20000
+
+
+def pow_prefix(transactions, last_hash):
+    """
+    Retourne la partie fixe du string hashé par le PoW des blocs de l'ancien format (transactions + last hash)
+
+    :param transactions: Les transactions du bloc en cours de validation
+    :param last_hash: Le hash du bloc précédent
+    :return <bytes>: préfixe à hasher avant le proof
+    """
+    return (str([tx.to_ordered_dict() for tx in transactions]) + str(last_hash)).encode()
+
+
+def check_proof(transactions, last_hash, proof, target):
+    """
+    Check si le proof d'un bloc de l'ancien format est valide : le hash (transactions + last hash + proof),
+    lu comme un entier de 256 bits, est inférieur ou égal à la cible
+    Fonction du module (sans Blockchain) pour être utilisable dans les processus de validation
+
+    :param target: <int> cible du bloc (voir difficulty.py)
+    :return <boolean>: Vrai si il est valide, Faux sinon.
+    """
+    digest = hl.sha256(pow_prefix(transactions, last_hash) + str(proof).encode()).digest()
+    return int.from_bytes(digest, 'big') <= target
+
+
+def check_block_proof(block):
+    """
+    Check le PoW d'un bloc selon sa version :
+        - en-tête binaire : hash du bloc (hash de l'en-tête) inférieur ou égal à la cible
+        - ancien format : voir check_proof (la récompense, dernière transaction, n'est pas couverte)
+
+    :return <boolean>: Vrai si il est valide, Faux sinon.
+    """
+    with metrics.valid_proof_seconds.time():
+        if block.version == LEGACY_BLOCK_VERSION:
+            return check_proof(block.transactions[:-1], block.previous_hash, block.proof, block_target(block))
+        return int(block.get_hash(), 16) <= block.target
+
+
+def search_proof(prefix, target, start=0, step=1, stop=None, chunk_size=CHUNK_SIZE):
+    """
+    Cherche un nonce valide à partir de start en avançant de step (start, start + step, ...)
+    Le SHA256 de l'en-tête sans le nonce est calculé une fois puis copié (.copy()) pour chaque nonce :
+    chaque essai ne hashe que les 8 octets du nonce, quelle que soit la taille du bloc
+    La cible est convertie une fois en 32 octets : comparer les digests octet par octet
+    équivaut à comparer les entiers (big endian), sans int.from_bytes à chaque proof
+
+    :param prefix: <bytes> en-tête sans le nonce (header.header_prefix)
+    :param target: <int> cible du bloc
+    :param stop: Event (threading/multiprocessing) qui interrompt la recherche
+    :return <tuple>: (proof trouvé ou None si interrompu, nombre de proofs testés)
+    """
+    bound = target.to_bytes(32, 'big')
+    seeded = hl.sha256(prefix)
+    proof = start
+    attempts = 0
+    while stop is None or not stop.is_set():
+        for _ in range(chunk_size):
+            h = seeded.copy()
+            h.update(encode_nonce(proof))
+            if h.digest() <= bound:
+                return proof, attempts + 1
+            attempts += 1
+            proof += step
+    return None, attempts
+
+
+def _worker(prefix, target, start, step, stop, results, chunk_size):
+    # Processus de minage : teste start, start + step, ... jusqu'à trouver ou être arrêté
+    proof, attempts = search_proof(prefix, target, start, step, stop, chunk_size)
+    if proof is not None:
+        stop.set()
+    results.put((proof, attempts))
+
+
+# Moteur de Proof of Work
+class ProofOfWorkEngine():
+
+    def __init__(self, workers=1, chunk_size=CHUNK_SIZE):
+        """
+        :param workers: nombre de processus de minage (1 = dans le processus courant)
+        :param chunk_size: nombre de proofs testés entre deux vérifications de l'arrêt
+        """
+        self.workers = max(1, int(workers))
+        self.chunk_size = chunk_size
+        # nombre de proofs testés lors de la dernière recherche
+        self.last_attempts = 0
+
+
+    def search(self, prefix, target, cancel=None, workers=None):
+        """
+        Cherche un nonce valide pour un en-tête de bloc (hash de l'en-tête <= target)
+        L'espace des proofs est partagé entre les workers (worker i teste i, i + n, i + 2n, ...)
+        Dès qu'un worker trouve, les autres sont arrêtés
+
+        :param prefix: <bytes> en-tête sans le nonce (header.header_prefix)
+        :param cancel: threading.Event optionnel qui annule la recherche
+        :param workers: nombre de processus (par défaut celui du moteur)
+        :return <int>: proof trouvé, None si la recherche a été annulée
+        """
+        workers = self.workers if workers is None else max(1, int(workers))
+        start = perf_counter()
+
+        if workers == 1:
+            proof, self.last_attempts = search_proof(prefix, target, 0, 1, cancel, self.chunk_size)
+            self._record(perf_counter() - start)
+            return proof
+
+        stop = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=_worker,
+                                    args=(prefix, target, i, workers, stop, results, self.chunk_size),
+                                    daemon=True)
+            for i in range(workers)
+            ]
+        for p in processes:
+            p.start()
+
+        proof = None
+        attempts = 0
+        finished = 0
+        try:
+            # Attend les résultats des workers (en surveillant l'annulation)
+            while finished < workers:
+                try:
+                    found, tested = results.get(timeout=0.05)
+                except queue.Empty:
+                    if cancel is not None and cancel.is_set():
+                        stop.set()
+                    continue
+                finished += 1
+                attempts += tested
+                if found is not None and proof is None:
+                    proof = found
+                    stop.set()
+        finally:
+            stop.set()
+            for p in processes:
+                p.join()
+        self.last_attempts = attempts
+        self._record(perf_counter() - start)
+        return proof
+
+
+    def _record(self, elapsed):
+        # métriques de la dernière recherche (proofs testés, durée, hashrate)
+        metrics.pow_attempts.inc(self.last_attempts)
+        metrics.pow_search_seconds.observe(elapsed)
+        if elapsed > 0:
+            metrics.pow_hashrate.set(self.last_attempts / elapsed)
@@ -1,9 +1,31 @@
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, g, jsonify, request, send_from_directory
 from flask_cors import CORS
 from argparse import ArgumentParser
+from time import perf_counter
+import atexit
+import logging
+import os
+import threading
 
 from wallet import Wallet
-from blockchain import Blockchain
+from verification import SCHEMES, RSA_SCHEME
+from block import Block
+from transaction import Transaction
+from blockchain import Blockchain, MAX_BATCH_TRANSACTIONS
+from validation import check_amounts
+from codec import decode_block, decode_transactions, encode_block_stream, frame, CONTENT_TYPE
+from miner import BackgroundMiner
+from storage import BlockStore, FSYNC_POLICIES, FSYNC_BATCH
+from mempool import Mempool, EVICTION_POLICIES, EVICT_OLDEST
+from sync import ChainSynchronizer, HEADERS_BATCH, BLOCKS_BATCH
+from difficulty import DifficultyAdjuster, RETARGET_WINDOW, BLOCK_INTERVAL, target_to_hex
+from template import BlockTemplateBuilder, MAX_BLOCK_BYTES, MAX_BLOCK_TRANSACTIONS
+from header import LEGACY_BLOCK_VERSION
+from compact import CompactBlock, decode_block_transactions
+from snapshot import SNAPSHOT_INTERVAL
+from peers import PeerManager, valid_address, MAX_PEERS, MAX_FANOUT, GOSSIP_INTERVAL
+import metrics
+from chain_index import parse_cursor, format_cursor, HISTORY_PAGE_SIZE
 
 """
 Flask est un framework de developpement web
@@ -26,6 +48,31 @@ Les codes :
 app = Flask(__name__)
 CORS(app)
 
+# Les requêtes sont traitées en parallèle (serveur multi-thread) :
+# la blockchain a son propre verrou (voir Blockchain.lock), le wallet n'est créé qu'une fois
+wallet_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+@app.before_request
+def start_request_timer():
+    if metrics.registry.enabled:
+        g.request_start = perf_counter()
+
+
+@app.after_request
+def record_request_latency(response):
+    """
+    Durée de chaque requête par route (modèle de la route, ex: /transaction/<transaction_id>)
+    Pour les réponses générées bloc par bloc (/blockchain), seule la préparation de la réponse est mesurée
+    """
+    if metrics.registry.enabled and 'request_start' in g:
+        route = request.url_rule.rule if request.url_rule is not None else 'unknown'
+        timer = metrics.request_seconds.labels(method=request.method, route=route, status=response.status_code)
+        timer.observe(perf_counter() - g.request_start)
+    return response
+
 
 
 
@@ -39,12 +86,12 @@ def get_wallet():
 
     """
     # Si l'utilisateur n'a pas de wallet, creation d'un wallet
-    if not wallet.hasKeys():
-        wallet.create_keys()
-        global blockchain
-        # la blockchain de l'utilisateur détient la clé publique
-        # de l'utilisateur pour faciliter les fonctions
-        blockchain.set_public_key(wallet.public_key)
+    with wallet_lock:
+        if not wallet.hasKeys():
+            wallet.create_keys()
+            # la blockchain de l'utilisateur détient la clé publique
+            # de l'utilisateur pour faciliter les fonctions
+            blockchain.set_public_key(wallet.public_key)
 
     response = {
         'public_key': wallet.public_key,
@@ -68,20 +115,260 @@ def get_nodes():
     return jsonify(response), 200
 
 
+@app.route('/peers', methods=['GET'])
+def get_peers():
+    """
+    Retourne l'état de chaque pair connu, les meilleurs d'abord
+    (latence moyenne, échecs consécutifs et total, hauteur de chaine, dernière réponse, attente après un échec)
+    """
+    response = {
+        'address': blockchain.nodes.address,
+        'fanout': blockchain.nodes.fanout,
+        'peers': blockchain.nodes.get_peers()
+    }
+    return jsonify(response), 200
+
+
+@app.route('/peers', methods=['POST'])
+def exchange_peers():
+    """
+    Echange de listes de pairs (gossip) : ajoute les pairs reçus {"peers": ["host:port", ...]}
+    et retourne les meilleurs pairs connus du noeud
+    """
+    request_data = request.get_json(silent=True)
+    if not request_data or not isinstance(request_data.get('peers'), list):
+        response = {'info': 'No peers found.'}
+        return jsonify(response), 400
+    added = blockchain.nodes.merge(request_data['peers'])
+    response = {
+        'added': added,
+        'peers': blockchain.nodes.gossip_peers()
+    }
+    return jsonify(response), 200
+
+
+
+@app.route('/broadcast/metrics', methods=['GET'])
+def get_broadcast_metrics():
+    """
+    Retourne les statistiques d'envoi vers chaque noeud
+    (envois acceptés/refusés/en échec, nouvelles tentatives, latence)
+
+    """
+    return jsonify(blockchain.broadcaster.get_metrics()), 200
+
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Retourne les métriques du noeud au format texte Prometheus (noeud lancé avec --metrics) :
+    PoW (proofs testés, hashrate), durées de hash_block / valid_proof / vérification des signatures,
+    ajout des blocs reçus, transactions en cours, latence des requêtes par route et des envois par noeud
+    """
+    if not metrics.registry.enabled:
+        response = {'info': 'Metrics disabled, start the node with --metrics'}
+        return jsonify(response), 404
+    return Response(metrics.registry.render(), 200, content_type=metrics.CONTENT_TYPE)
+
 
 @app.route('/blockchain', methods=['GET'])
 def get_blockchain():
     """
     Retourne une copie actuelle de la blockchain
+    La réponse est générée bloc par bloc (streaming) sans construire toute la chaine en mémoire
+
+    Paramètres optionnels :
+        - start, end : plage de hauteurs [start, end[
+        - limit : nombre maximal de blocs, la suite s'obtient avec ?cursor= (entête X-Next-Cursor)
+        - cursor : curseur retourné par la page précédente
+        - format : json (tableau, par défaut), ndjson (un bloc JSON par ligne) ou binary (codec.py)
+    Un noeud démarré depuis un snapshot n'a pas les blocs avant le premier bloc stocké : la plage commence à ce bloc
+    Un entête ETag (basé sur le hash du dernier bloc) permet de recevoir un 304 si la chaine n'a pas changé
+    Si des blocs envoyés sont remplacés pendant l'envoi (changement de chaine), la réponse est interrompue
+    (IndexError, connexion fermée sans fin de réponse) : le client ne reçoit jamais un mélange des deux chaines
     """
-    blockchain_copy = blockchain.blockchain
-    dict_chain = []
-    for block in blockchain_copy:
-        dict_chain.append(block.__dict__.copy())
+    output = request.args.get('format', 'json')
+    if output not in ('json', 'ndjson', 'binary'):
+        return jsonify({'info': 'Error: format must be json, ndjson or binary'}), 400
+
+    # La chaine lue est celle du moment de la requête (les blocs ajoutés ensuite ne sont pas envoyés)
+    chain, height = blockchain.snapshot()
+    cursor = request.args.get('cursor')
+    start = request.args.get('start', 0, type=int) if cursor is None else int(cursor) if cursor.isdigit() else -1
+    end = min(height, request.args.get('end', height, type=int))
+    if start < 0:
+        return jsonify({'info': 'Error: invalid start or cursor'}), 400
+    start = max(start, blockchain.first_height())
+    limit = request.args.get('limit', type=int)
+    if limit is not None and limit > 0:
+        end = min(end, start + limit)
+    next_cursor = str(end) if end < min(height, request.args.get('end', height, type=int)) else None
+
+    # Le hash du dernier bloc identifie l'état de la chaine
+    try:
+        tip = blockchain.hash_block(chain[height - 1])
+    except IndexError:
+        return chain_changed_response()
+    etag = '{}-{}-{}-{}'.format(tip, start, end, output)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    def generate_json():
+        yield '['
+        for h in range(start, end):
+            yield (',' if h > start else '') + app.json.dumps(chain[h].to_dict())
+        yield ']\n'
+
+    def generate_ndjson():
+        for h in range(start, end):
+            yield app.json.dumps(chain[h].to_dict()) + '\n'
+
+    def generate_binary():
+        for h in range(start, end):
+            yield frame(blockchain.get_encoded_block(h, chain))
+
+    if output == 'binary':
+        response = Response(generate_binary(), 200, content_type=CONTENT_TYPE)
+    elif output == 'ndjson':
+        response = Response(generate_ndjson(), 200, content_type='application/x-ndjson')
+    else:
+        response = Response(generate_json(), 200, content_type='application/json')
+    response.set_etag(etag)
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+
+def get_range(max_count):
+    """
+    Lit la plage de hauteurs demandée (?start=&count=), bornée à max_count blocs
+    et aux blocs disponibles (noeud démarré depuis un snapshot)
 
-    for dict_block in dict_chain:
-        dict_block['transactions'] = [transaction.__dict__ for transaction in dict_block['transactions']]
-    return jsonify(dict_chain), 200
+    :return <tuple>: (chaine, début, fin)
+    """
+    chain, height = blockchain.snapshot()
+    start = max(blockchain.first_height(), request.args.get('start', 0, type=int))
+    count = min(max(0, request.args.get('count', max_count, type=int)), max_count)
+    return chain, start, min(height, start + count)
+
+
+def chain_changed_response():
+    """
+    Réponse quand la chaine lue (Blockchain.snapshot) a été remplacée pendant la requête : le client recommence
+    """
+    response = {'info': 'Error: blockchain changed during the request, retry.'}
+    return jsonify(response), 409
+
+
+@app.route('/chain/info', methods=['GET'])
+def get_chain_info():
+    """
+    Retourne la hauteur de la chaine, son travail cumulé (hexadécimal, comparé par la synchronisation),
+    le hash du dernier bloc, la cible du prochain bloc
+    et la hauteur du premier bloc disponible (base, non nulle si le noeud a démarré depuis un snapshot)
+    """
+    chain, height = blockchain.snapshot()
+    work = blockchain.chain_work
+    last_block = chain[height - 1]
+    response = {
+        'height': last_block.index,
+        'work': '{:x}'.format(work),
+        'tip': blockchain.hash_block(last_block),
+        'next_target': target_to_hex(blockchain.adjuster.next_target(chain.__getitem__, height)),
+        'base': blockchain.first_height()
+    }
+    return jsonify(response), 200
+
+
+@app.route('/snapshot', methods=['GET'])
+def get_snapshot():
+    """
+    Retourne le dernier snapshot des soldes du noeud, encodé en binaire (snapshot.py)
+    Entêtes X-Snapshot-Height et X-Snapshot-Hash (hash à comparer à un hash de confiance)
+    """
+    snapshot = blockchain.get_snapshot()
+    if snapshot is None:
+        response = {'info': 'No snapshot yet'}
+        return jsonify(response), 404
+    headers = {'X-Snapshot-Height': str(snapshot.height), 'X-Snapshot-Hash': snapshot.get_hash()}
+    return Response(snapshot.encode(), 200, content_type=CONTENT_TYPE, headers=headers)
+
+
+@app.route('/snapshot/info', methods=['GET'])
+def get_snapshot_info():
+    """
+    Retourne la hauteur, le hash du bloc, le hash et la taille du dernier snapshot des soldes
+    """
+    snapshot = blockchain.get_snapshot()
+    if snapshot is None:
+        response = {'info': 'No snapshot yet'}
+        return jsonify(response), 404
+    return jsonify(snapshot.to_dict()), 200
+
+
+@app.route('/headers', methods=['GET'])
+def get_headers():
+    """
+    Retourne les en-têtes (hash, hash précédent, proof, racine de Merkle...) des blocs ?start=&count=
+    ?format=binary : en-têtes binaires de taille fixe mis bout à bout (header.py), pour les clients légers
+    Les blocs de l'ancien format n'ont pas d'en-tête binaire : ils sont omis, l'entête X-Start donne
+    la hauteur du premier en-tête retourné
+    """
+    chain, start, end = get_range(HEADERS_BATCH)
+    try:
+        blocks = [chain[height] for height in range(start, end)]
+    except IndexError:
+        return chain_changed_response()
+    if request.args.get('format') == 'binary':
+        blocks = [block for block in blocks if block.version != LEGACY_BLOCK_VERSION]
+        first = blocks[0].index if blocks else end
+        data = b''.join(block.header() for block in blocks)
+        return Response(data, 200, content_type=CONTENT_TYPE, headers={'X-Start': str(first)})
+    headers = [block.to_header() for block in blocks]
+    return jsonify(headers), 200
+
+
+@app.route('/blocks', methods=['GET'])
+def get_blocks():
+    """
+    Retourne les blocs ?start=&count= (par pages de BLOCKS_BATCH blocs)
+    ?format=binary : blocs encodés en binaire (codec.py), JSON sinon
+    """
+    chain, start, end = get_range(BLOCKS_BATCH)
+    try:
+        blocks = chain[start:end]
+    except IndexError:
+        return chain_changed_response()
+    if request.args.get('format') == 'binary':
+        return Response(encode_block_stream(blocks), 200, content_type=CONTENT_TYPE)
+    return jsonify([block.to_dict() for block in blocks]), 200
+
+
+@app.route('/sync', methods=['POST'])
+def synchronize():
+    """
+    Rattrape la chaine des noeuds connus qui a le plus de travail cumulé
+    """
+    result = synchronizer.synchronize()
+    return jsonify(result), 200
+
+
+@app.route('/validate', methods=['POST'])
+def validate_chain():
+    """
+    Valide la blockchain locale (chainage, PoW, signatures, soldes)
+    Reprend à partir du dernier bloc déjà validé
+    """
+    chain, height = blockchain.snapshot()
+    valid = blockchain.check_chain(chain)
+    response = {
+        'valid': valid,
+        'height': height - 1
+    }
+    return jsonify(response), 200 if valid else 409
 
 
 @app.route('/add_node', methods=['POST'])
@@ -98,7 +385,10 @@ def add_node():
         return jsonify(response), 400
 
 
-    node = values['node']
+    node = values.get('node')
+    if not valid_address(node):
+        response = {'info': 'Invalid node address (host:port).'}
+        return jsonify(response), 400
     blockchain.add_node(node)
     response = {
         'info': 'Node added successfully.',
@@ -108,16 +398,38 @@ def add_node():
 
 
 
+def read_workers(values):
+    """
+    Lit le nombre de processus de minage demandé (optionnel)
+
+    :return <int>: nombre de processus, None si absent (nombre du noeud)
+    :raise ValueError: pas un entier entre 1 et le nombre de processeurs
+    """
+    workers = values.get('workers')
+    if workers is None:
+        return None
+    max_workers = os.cpu_count() or 1
+    if not isinstance(workers, int) or isinstance(workers, bool) or not 1 <= workers <= max_workers:
+        raise ValueError('workers must be an integer between 1 and {}.'.format(max_workers))
+    return workers
+
+
 @app.route('/mine', methods=['POST'])
 def mine():
     """
     Mine le block courant (fonction mine_block() dans blockchain.py)
+    Données JSON optionnelles : {"workers": n} nombre de processus de minage (au plus le nombre de processeurs)
     Retourne un message (erreur/success) JSON
     """
-    block = blockchain.mine_block()
+    values = request.get_json(silent=True) or {}
+    try:
+        workers = read_workers(values)
+    except ValueError as e:
+        response = {'info': 'Error: {}'.format(e)}
+        return jsonify(response), 400
+    block = blockchain.mine_block(workers)
     if block != None:
-        dict_block = block.__dict__.copy()
-        dict_block['transactions'] = [transaction.__dict__ for transaction in dict_block['transactions']]
+        dict_block = block.to_dict()
 
         response = {
             'info': 'Block added, miner get reward',
@@ -131,6 +443,51 @@ def mine():
         return jsonify(response), 500
 
 
+@app.route('/miner/start', methods=['POST'])
+def start_miner():
+    """
+    Démarre le minage en continu en arrière-plan
+    Données JSON optionnelles : {"workers": n, "mine_empty_blocks": true} (workers : au plus le nombre de processeurs)
+    """
+    if wallet.public_key == None:
+        response = {'info': 'Error: No wallet'}
+        return jsonify(response), 400
+
+    values = request.get_json(silent=True) or {}
+    try:
+        workers = read_workers(values)
+    except ValueError as e:
+        response = {'info': 'Error: {}'.format(e)}
+        return jsonify(response), 400
+    started = miner.start(workers, values.get('mine_empty_blocks'))
+    response = {
+        'info': 'Miner started' if started else 'Miner already running',
+        'miner': miner.status()
+    }
+    return jsonify(response), 201 if started else 200
+
+
+@app.route('/miner/stop', methods=['POST'])
+def stop_miner():
+    """
+    Arrête le minage en arrière-plan
+    """
+    stopped = miner.stop()
+    response = {
+        'info': 'Miner stopped' if stopped else 'Miner not running',
+        'miner': miner.status()
+    }
+    return jsonify(response), 200
+
+
+@app.route('/miner/status', methods=['GET'])
+def get_miner_status():
+    """
+    Retourne l'état du mineur (en cours, blocs minés, hashrate)
+    """
+    return jsonify(miner.status()), 200
+
+
 @app.route('/current_transactions', methods=['GET'])
 def get_current_transactions():
     """
@@ -139,18 +496,98 @@ def get_current_transactions():
     """
     transactions = []
     transactions = blockchain.get_transactions()
-    print(blockchain.get_transactions())
+    logger.debug('%s current transactions', len(transactions))
     dict_transactions = []
     for t in transactions:
-        dict_transactions.append(t.__dict__)
+        dict_transactions.append(t.to_dict())
     return jsonify(dict_transactions), 200
 
 
+@app.route('/transaction/<transaction_id>', methods=['GET'])
+def get_transaction(transaction_id):
+    """
+    Retourne une transaction par son identifiant (index des transactions, sans parcourir la chaine)
+    Validée : bloc (hauteur, hash), position dans le bloc et nombre de confirmations
+    En cours : status 'pending'
+    """
+    found = blockchain.find_transaction(transaction_id)
+    if found is not None:
+        transaction, height, position, block_hash = found
+        response = {
+            'status': 'confirmed',
+            'transaction': transaction.to_dict(),
+            'height': height,
+            'position': position,
+            'block_hash': block_hash,
+            'confirmations': blockchain.snapshot()[1] - height
+        }
+        return jsonify(response), 200
+    transaction = blockchain.get_pending_transaction(transaction_id)
+    if transaction is not None:
+        response = {'status': 'pending', 'transaction': transaction.to_dict()}
+        return jsonify(response), 200
+    response = {'info': 'Transaction not found.'}
+    return jsonify(response), 404
+
+
+@app.route('/proof/<transaction_id>', methods=['GET'])
+def get_transaction_proof(transaction_id):
+    """
+    Retourne la preuve d'inclusion (Merkle) d'une transaction validée et l'en-tête de son bloc :
+    un client léger vérifie l'inclusion avec les en-têtes seuls (merkle.verify_merkle_proof)
+    """
+    found = blockchain.get_merkle_proof(transaction_id)
+    if found is None:
+        response = {'info': 'Transaction not found.'}
+        return jsonify(response), 404
+    block, position, proof = found
+    response = {
+        'transaction_id': transaction_id,
+        'height': block.index,
+        'position': position,
+        'block_hash': block.get_hash(),
+        'merkle_root': block.get_merkle_root(),
+        'proof': [{'hash': sibling, 'side': side} for sibling, side in proof],
+        'header': block.to_header(),
+        'raw_header': block.header().hex() if block.version != LEGACY_BLOCK_VERSION else None
+    }
+    return jsonify(response), 200
+
+
+@app.route('/account/<key>/history', methods=['GET'])
+def get_account_history(key):
+    """
+    Retourne l'historique (transactions validées envoyées et reçues) d'un compte, dans l'ordre de la chaine
+    Paginé : ?limit= (HISTORY_PAGE_SIZE au maximum) et ?cursor= (next_cursor de la page précédente)
+    """
+    try:
+        cursor = parse_cursor(request.args.get('cursor'))
+    except ValueError:
+        response = {'info': 'Error: invalid cursor.'}
+        return jsonify(response), 400
+    limit = min(max(1, request.args.get('limit', HISTORY_PAGE_SIZE, type=int)), HISTORY_PAGE_SIZE)
+
+    entries, next_cursor = blockchain.get_history(key, cursor, limit)
+    transactions = []
+    for height, position, transaction in entries:
+        entry = transaction.to_dict()
+        entry.update({'height': height, 'position': position,
+                      'direction': 'sent' if transaction.sender == key else 'received'})
+        transactions.append(entry)
+    response = {
+        'account': key,
+        'transactions': transactions,
+        'next_cursor': format_cursor(next_cursor) if next_cursor is not None else None
+    }
+    return jsonify(response), 200
+
+
 @app.route('/create_transaction', methods=['POST'])
 def transaction():
     """
     Crée une nouvelle transaction via la fonction (create_transaction() de blockchain.py)
     La transaction est implicitement envoyé à tout les noeuds connus (dans la fonction create_transaction() de blockchain.py)
+    Données JSON : receiver, amount et fee (optionnel : frais payés au mineur, prioritaires au minage)
     Retourne un message (succes/error) JSON
     """
 
@@ -159,21 +596,26 @@ def transaction():
         return jsonify(response), 400
 
     request_data = request.get_json()
-    if not request_data or ('receiver' not in request_data):
+    if not isinstance(request_data, dict) or 'receiver' not in request_data or 'amount' not in request_data:
         response = {'info': 'Error: POST data'}
         return jsonify(response), 400
+    if not isinstance(request_data['receiver'], str):
+        response = {'info': 'Error: invalid receiver.'}
+        return jsonify(response), 400
 
     receiver = request_data['receiver']
     amount = request_data['amount']
+    fee = request_data.get('fee', 0)
 
 
-    signature = wallet.sign_transaction(wallet.public_key, receiver, amount)
-    add_transaction = blockchain.create_transaction(receiver, wallet.public_key, signature, amount)
+    signature = wallet.sign_transaction(wallet.public_key, receiver, amount, fee)
+    add_transaction = blockchain.create_transaction(receiver, wallet.public_key, signature, amount, fee)
 
     if add_transaction:
         response = {
             'info': 'Transaction created',
-            'transaction_signature': signature
+            'transaction_signature': signature,
+            'transaction_id': Transaction(wallet.public_key, receiver, signature, amount, fee).get_id()
             }
         return jsonify(response), 201
     else:
@@ -190,20 +632,25 @@ def store_received_transaction():
     """
     Stocke la transaction reçu par les autres noeuds dans
     la liste de transactions en cours (non validées)
+    Une transaction nouvelle est relayée aux meilleurs pairs du noeud (un doublon est refusé : fin du relais)
 
     """
 
     request_data = request.get_json()
 
-    if not request_data:
+    if not request_data or not isinstance(request_data, dict):
         response = {'info': 'No data found.'}
         return jsonify(response), 400
     required = ['sender', 'receiver', 'amount', 'signature']
     if not all(key in request_data for key in required):
         response = {'info': 'Some data is missing.'}
         return jsonify(response), 400
-    success = blockchain.add_transaction(
-        request_data['receiver'], request_data['sender'], request_data['signature'], request_data['amount'])
+    if not all(isinstance(request_data[key], str) for key in ('sender', 'receiver', 'signature')):
+        response = {'info': 'Invalid sender, receiver or signature.'}
+        return jsonify(response), 400
+    success = blockchain.create_transaction(
+        request_data['receiver'], request_data['sender'], request_data['signature'], request_data['amount'],
+        request_data.get('fee', 0))
     if success:
         response = {
             'info': 'Transaction added.',
@@ -217,6 +664,77 @@ def store_received_transaction():
         return jsonify(response), 500
 
 
+def read_transactions():
+    """
+    Lit un lot de transactions : binaire (codec.py) ou JSON {"transactions": [{sender, receiver, amount, signature, fee}]}
+
+    :return <list>: liste de <Transaction>
+    :raise ValueError: données mal formées (binaire vide ou tronqué, champs manquants ou du mauvais type,
+                       montant non strictement positif, frais négatifs) ou lot trop grand (MAX_BATCH_TRANSACTIONS)
+    La taille du lot est vérifiée avant de créer les transactions (et d'interner leurs clés)
+    """
+    if request.content_type == CONTENT_TYPE:
+        transactions = decode_transactions(request.get_data(), MAX_BATCH_TRANSACTIONS)
+    else:
+        request_data = request.get_json(silent=True)
+        if not isinstance(request_data, dict) or not isinstance(request_data.get('transactions'), list):
+            raise ValueError('No transactions found.')
+        values = request_data['transactions']
+        if len(values) > MAX_BATCH_TRANSACTIONS:
+            raise ValueError('Too many transactions (max {}).'.format(MAX_BATCH_TRANSACTIONS))
+        required = ['sender', 'receiver', 'amount', 'signature']
+        transactions = []
+        for t in values:
+            if not isinstance(t, dict) or not all(key in t for key in required):
+                raise ValueError('Some data is missing.')
+            if not all(isinstance(t[key], str) for key in ('sender', 'receiver', 'signature')):
+                raise ValueError('Invalid sender, receiver or signature.')
+            transactions.append(Transaction(t['sender'], t['receiver'], t['signature'], t['amount'], t.get('fee', 0)))
+    if not all(check_amounts(transaction) for transaction in transactions):
+        raise ValueError('Invalid amount.')
+    return transactions
+
+
+def batch_response(transactions, results):
+    accepted = sum(results)
+    response = {
+        'accepted': accepted,
+        'rejected': len(results) - accepted,
+        'results': [{'transaction_id': t.get_id(), 'accepted': added} for t, added in zip(transactions, results)]
+    }
+    return jsonify(response), 201 if accepted else 400
+
+
+@app.route('/transactions/batch', methods=['POST'])
+def create_transactions():
+    """
+    Ajoute un lot de transactions signées par les clients (jusqu'à MAX_BATCH_TRANSACTIONS par requête)
+    Les transactions sont validées ensemble (signatures en un lot, solde courant par envoyeur)
+    puis les transactions acceptées sont envoyées aux noeuds connus en un seul message (/transactions/relay)
+    Retourne le résultat de chaque transaction (dans l'ordre du lot)
+    """
+    try:
+        transactions = read_transactions()
+    except ValueError as e:
+        response = {'info': 'Error: {}'.format(e)}
+        return jsonify(response), 400
+    return batch_response(transactions, blockchain.create_transactions(transactions))
+
+
+@app.route('/transactions/relay', methods=['POST'])
+def store_received_transactions():
+    """
+    Stocke un lot de transactions reçu d'un autre noeud dans les transactions en cours (non validées)
+    Les transactions nouvelles sont relayées aux meilleurs pairs du noeud
+    """
+    try:
+        transactions = read_transactions()
+    except ValueError as e:
+        response = {'info': 'Error: {}'.format(e)}
+        return jsonify(response), 400
+    return batch_response(transactions, blockchain.create_transactions(transactions))
+
+
 @app.route('/store-received-block', methods=['POST'])
 def store_received_block():
     """
@@ -224,30 +742,170 @@ def store_received_block():
     la blockchain actuelle
 
     """
-    request_data = request.get_json()
-
-    if not request_data:
-        response = {'info': 'No data found.'}
+    # Le bloc est reçu encodé en binaire (codec.py) ou en JSON
+    try:
+        if request.content_type == CONTENT_TYPE:
+            block = decode_block(request.get_data())
+        else:
+            request_data = request.get_json(silent=True)
+            if not request_data or not isinstance(request_data, dict):
+                response = {'info': 'No data found.'}
+                return jsonify(response), 400
+            block = Block.from_dict(request_data.get('block'))
+    except ValueError:
+        # version inconnue, données tronquées, champs manquants ou qui ne tiennent pas dans l'en-tête du bloc
+        response = {'info': 'Error: invalid block.'}
         return jsonify(response), 400
+    return store_block(block, blockchain.snapshot()[1])
+
 
-    block = request_data['block']
-    if block['index'] == blockchain.blockchain[-1].index + 1:
-        if blockchain.add_block(block):
-            response = {'info': 'Block added'}
-            return jsonify(response), 201
-    elif block['index'] > blockchain.blockchain[-1].index:
-        pass
+def store_block(block, height):
+    """
+    Ajoute un bloc reçu (complet ou reconstruit depuis un bloc compact) et retourne la réponse
+    Un bloc ajouté est relayé aux meilleurs pairs du noeud (un bloc déjà connu est refusé : fin du relais)
+
+    :param height: hauteur de la chaine à la réception du bloc
+    """
+    if block.index == height and blockchain.add_block(block):
+        blockchain.relay_block(block)
+        response = {'info': 'Block added'}
+        return jsonify(response), 201
+    elif block.index >= height:
+        # Le bloc est en avance (ou sur une autre branche) : rattrape la chaine des autres noeuds
+        synchronizer.synchronize_async()
+        response = {'info': 'Block ahead, synchronizing'}
+        return jsonify(response), 202
     else:
         response = {'info': 'Error, blockchain, block not added'}
         return jsonify(response), 409
 
 
+def catch_up():
+    """
+    Rattrape la chaine si un pair est plus haut (après un tour de vérification des pairs) :
+    les blocs ne sont envoyés qu'à une partie des pairs, un bloc peut ne pas atteindre le noeud
+    """
+    height = blockchain.nodes.best_height()
+    if height is not None and height >= blockchain.snapshot()[1]:
+        synchronizer.synchronize_async()
+
+
+def compact_block_response(block, missing, height):
+    # Bloc reconstruit : ajouté comme un bloc reçu, sinon le mineur envoie les transactions manquantes
+    if block is not None:
+        return store_block(block, height)
+    if missing is None:
+        response = {'info': 'Error: unknown block or invalid transactions.'}
+        return jsonify(response), 409
+    response = {'info': 'Missing transactions', 'missing': missing}
+    return jsonify(response), 200
+
+
+@app.route('/compact-block', methods=['POST'])
+def store_compact_block():
+    """
+    Reçoit un bloc compact (en-tête et identifiants courts des transactions, voir compact.py)
+    et le reconstruit depuis les transactions en cours
+
+    Réponse 200 avec les positions des transactions manquantes, à envoyer sur /compact-block/transactions
+    """
+    try:
+        compact = CompactBlock.decode(request.get_data())
+    except ValueError:
+        response = {'info': 'Error: invalid block.'}
+        return jsonify(response), 400
+    if not compact.valid_proof():
+        response = {'info': 'Error: invalid proof.'}
+        return jsonify(response), 400
+
+    height = blockchain.snapshot()[1]
+    if compact.index > height:
+        synchronizer.synchronize_async()
+        response = {'info': 'Block ahead, synchronizing'}
+        return jsonify(response), 202
+    if compact.index < height:
+        response = {'info': 'Error, blockchain, block not added'}
+        return jsonify(response), 409
+    block, missing = blockchain.receive_compact_block(compact)
+    return compact_block_response(block, missing, height)
+
+
+@app.route('/compact-block/transactions', methods=['POST'])
+def store_compact_block_transactions():
+    """
+    Reçoit les transactions manquantes d'un bloc compact (dans l'ordre des positions demandées)
+    """
+    try:
+        block_hash, transactions = decode_block_transactions(request.get_data())
+    except ValueError:
+        response = {'info': 'Error: invalid transactions.'}
+        return jsonify(response), 400
+    height = blockchain.snapshot()[1]
+    block, missing = blockchain.complete_compact_block(block_hash, transactions)
+    return compact_block_response(block, missing, height)
+
+
 
 if __name__ == '__main__':
     parser = ArgumentParser()
     parser.add_argument('-p', '--port', type=int, default=8000)
+    parser.add_argument('-w', '--workers', type=int, default=1)
+    parser.add_argument('-d', '--data-dir', default=None)
+    parser.add_argument('--fsync', choices=FSYNC_POLICIES, default=FSYNC_BATCH)
+    parser.add_argument('--mempool-size', type=int, default=None)
+    parser.add_argument('--mempool-bytes', type=int, default=None)
+    parser.add_argument('--mempool-eviction', choices=EVICTION_POLICIES, default=EVICT_OLDEST)
+    parser.add_argument('--validate', action='store_true')
+    parser.add_argument('--block-interval', type=float, default=BLOCK_INTERVAL)
+    parser.add_argument('--retarget-window', type=int, default=RETARGET_WINDOW)
+    parser.add_argument('--block-max-bytes', type=int, default=MAX_BLOCK_BYTES)
+    parser.add_argument('--block-max-count', type=int, default=MAX_BLOCK_TRANSACTIONS)
+    parser.add_argument('--key-type', choices=SCHEMES, default=RSA_SCHEME)
+    parser.add_argument('--metrics', action='store_true')
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default='INFO')
+    parser.add_argument('--snapshot-interval', type=int, default=SNAPSHOT_INTERVAL)
+    parser.add_argument('--bootstrap', default=None)
+    parser.add_argument('--snapshot-hash', default=None)
+    parser.add_argument('--peer', action='append', default=[])
+    parser.add_argument('--advertise', default=None)
+    parser.add_argument('--max-peers', type=int, default=MAX_PEERS)
+    parser.add_argument('--fanout', type=int, default=MAX_FANOUT)
+    parser.add_argument('--gossip-interval', type=float, default=GOSSIP_INTERVAL)
     args = parser.parse_args()
+    logging.basicConfig(level=args.log_level, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
     port = args.port
-    wallet = Wallet()
-    blockchain = Blockchain(None)
-    app.run(host='0.0.0.0', port=port)
+    wallet = Wallet(args.key_type)
+    # Sans dossier de données, la blockchain reste en mémoire
+    store = BlockStore(args.data_dir, args.fsync) if args.data_dir else None
+    mempool = Mempool(args.mempool_size, args.mempool_bytes, args.mempool_eviction)
+    adjuster = DifficultyAdjuster(args.retarget_window, args.block_interval)
+    template = BlockTemplateBuilder(args.block_max_bytes, args.block_max_count)
+    # Adresse annoncée aux autres noeuds lors des échanges de pairs (--advertise host:port derrière un NAT)
+    peers = PeerManager(args.advertise or 'localhost:{}'.format(port), args.max_peers, args.fanout)
+    blockchain = Blockchain(None, args.workers, store, mempool, adjuster, template, args.snapshot_interval, peers)
+    for peer in args.peer:
+        blockchain.add_node(peer)
+    atexit.register(blockchain.save)
+    # Valide la chaine stockée au démarrage (reprend au dernier bloc validé)
+    if args.validate and not blockchain.check_chain(blockchain.blockchain):
+        raise SystemExit('Invalid blockchain in {}'.format(args.data_dir))
+    miner = BackgroundMiner(blockchain)
+    synchronizer = ChainSynchronizer(blockchain)
+    # Noeud neuf : démarre depuis le snapshot des soldes d'un noeud de confiance puis rattrape les blocs suivants
+    if args.bootstrap and len(blockchain.blockchain) == 1:
+        blockchain.add_node(args.bootstrap)
+        result = synchronizer.bootstrap(args.bootstrap, args.snapshot_hash)
+        if not result.get('bootstrapped'):
+            raise SystemExit('Bootstrap from {} failed: {}'.format(args.bootstrap, result['info']))
+        logger.info('Bootstrap: %s', result['info'])
+    if args.metrics:
+        metrics.registry.enable()
+        metrics.chain_height.set_function(lambda: blockchain.snapshot()[1])
+        metrics.mempool_transactions.set_function(lambda: len(blockchain.current_transactions))
+        metrics.mempool_bytes.set_function(lambda: blockchain.current_transactions.size_bytes)
+        metrics.peers_known.set_function(lambda: len(peers))
+        metrics.peers_available.set_function(lambda: len(peers.available()))
+    # Vérification des pairs et échange des listes de pairs en arrière-plan (0 : désactivé)
+    if args.gossip_interval > 0:
+        peers.start(args.gossip_interval, catch_up)
+    app.run(host='0.0.0.0', port=port, threaded=True)
@@ -0,0 +1,374 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import random
+import threading
+from time import time, perf_counter
+
+import requests
+
+"""
+Gestion des noeuds connus (pairs)
+
+    - découverte : les noeuds échangent leurs listes de pairs (gossip, POST /peers)
+    - santé : latence moyenne, échecs consécutifs et hauteur de chaque pair, mis à jour par les vérifications
+      périodiques (/chain/info), les envois (broadcast.py) et la synchronisation (sync.py)
+    - un pair en échec est mis en attente (délai doublé à chaque échec), un pair appris par gossip
+      est oublié après MAX_FAILURES échecs consécutifs (les pairs ajoutés à la main sont gardés)
+    - les envois ne visent que MAX_FANOUT pairs disponibles (les meilleurs et quelques autres au hasard),
+      les noeuds relaient ensuite les blocs et transactions nouveaux à leurs propres pairs ; un noeud
+      qu'un bloc n'a pas atteint le rattrape au tour suivant (hauteur des pairs, voir node.py)
+"""
+
+logger = logging.getLogger(__name__)
+
+# nombre maximal de pairs connus
+MAX_PEERS = 64
+# nombre de pairs destinataires d'un envoi
+MAX_FANOUT = 8
+# nombre de pairs envoyés lors d'un échange de listes
+GOSSIP_SIZE = 16
+# échecs consécutifs avant d'oublier un pair appris par gossip
+MAX_FAILURES = 5
+# attente après le premier échec (secondes), doublée à chaque échec consécutif
+BACKOFF = 1.0
+# attente maximale après des échecs
+MAX_BACKOFF = 300.0
+# temps entre deux tours de vérification et d'échange (secondes)
+GOSSIP_INTERVAL = 30.0
+# délai maximal d'une requête de vérification ou d'échange (secondes)
+TIMEOUT = 3.0
+# nombre de vérifications simultanées
+MAX_WORKERS = 8
+# poids de la dernière mesure dans la latence moyenne (moyenne mobile exponentielle)
+LATENCY_WEIGHT = 0.3
+
+
+def valid_address(address):
+    """
+    Vrai si address est de la forme host:port
+    """
+    if not isinstance(address, str) or len(address) > 255:
+        return False
+    host, _, port = address.rpartition(':')
+    return bool(host) and port.isdigit() and not any(c in host for c in '/@ ')
+
+
+# Etat d'un pair
+class Peer():
+    __slots__ = ('address', 'pinned', 'latency', 'failures', 'total_failures', 'successes', 'height',
+                 'last_seen', 'retry_at', 'last_error')
+
+    def __init__(self, address, pinned=False):
+        """
+        :param pinned: pair ajouté à la main (jamais oublié, seulement mis en attente)
+        """
+        self.address = address
+        self.pinned = pinned
+        # latence moyenne (secondes), None tant que le pair n'a pas répondu
+        self.latency = None
+        self.failures = 0
+        self.total_failures = 0
+        self.successes = 0
+        self.height = None
+        self.last_seen = None
+        # date avant laquelle le pair n'est plus contacté (après un échec)
+        self.retry_at = 0.0
+        self.last_error = None
+
+
+    def rank(self):
+        # les pairs sans échec, les plus rapides puis les plus hauts d'abord
+        latency = self.latency if self.latency is not None else TIMEOUT
+        return self.failures, latency, -(self.height or 0)
+
+
+    def to_dict(self):
+        return {
+            'address': self.address,
+            'pinned': self.pinned,
+            'latency': self.latency,
+            'failures': self.failures,
+            'total_failures': self.total_failures,
+            'successes': self.successes,
+            'height': self.height,
+            'last_seen': self.last_seen,
+            'retry_at': self.retry_at or None,
+            'last_error': self.last_error
+        }
+
+
+# Pairs connus du noeud
+class PeerManager():
+
+    def __init__(self, address=None, max_peers=MAX_PEERS, fanout=MAX_FANOUT, max_failures=MAX_FAILURES,
+                 backoff=BACKOFF, timeout=TIMEOUT):
+        """
+        S'utilise comme un ensemble d'adresses (add, in, itération, len) : Blockchain.nodes
+
+        :param address: adresse du noeud annoncée aux autres (host:port), jamais ajoutée comme pair
+        :param max_peers: nombre maximal de pairs connus
+        :param fanout: nombre de pairs destinataires d'un envoi (select)
+        :param max_failures: échecs consécutifs avant d'oublier un pair appris par gossip
+        :param backoff: attente après le premier échec (secondes)
+        :param timeout: délai maximal d'une requête de vérification ou d'échange (secondes)
+        """
+        self.address = address
+        self.max_peers = max_peers
+        self.fanout = fanout
+        self.max_failures = max_failures
+        self.backoff = backoff
+        self.timeout = timeout
+        self.peers = {}
+        # pairs oubliés après des échecs -> date jusqu'à laquelle le gossip ne les ajoute plus
+        # (les autres noeuds les annoncent encore tant qu'ils n'ont pas vu leurs échecs)
+        self.forgotten = {}
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+        self.stopped = threading.Event()
+        self.thread = None
+
+
+    def add(self, address, pinned=True):
+        """
+        Ajoute un pair (à la main par défaut : il est gardé même s'il ne répond plus)
+        Un pair déjà connu ajouté à la main est repris tout de suite (échecs remis à zéro)
+
+        :return <boolean>: Vrai si le pair est nouveau
+        """
+        if address == self.address or not valid_address(address):
+            return False
+        with self.lock:
+            if pinned:
+                self.forgotten.pop(address, None)
+            elif self.forgotten.get(address, 0) > time():
+                return False
+            peer = self.peers.get(address)
+            if peer is not None:
+                if pinned:
+                    peer.pinned = True
+                    peer.failures = 0
+                    peer.retry_at = 0.0
+                return False
+            # liste pleine : un pair appris par gossip ne remplace qu'un pair en échec,
+            # un pair ajouté à la main remplace le moins bon pair appris par gossip
+            if len(self.peers) >= self.max_peers and not self._evict_one(pinned) and not pinned:
+                return False
+            self.peers[address] = Peer(address, pinned)
+            logger.info('new peer %s (%s)', address, 'manual' if pinned else 'gossip')
+            return True
+
+
+    def _evict_one(self, healthy=False):
+        # Oublie le moins bon pair appris par gossip (à appeler avec self.lock)
+        # :param healthy: Vrai si un pair sans échec peut être oublié
+        candidates = [peer for peer in self.peers.values() if not peer.pinned and (healthy or peer.failures)]
+        if not candidates:
+            return False
+        worst = max(candidates, key=Peer.rank)
+        del self.peers[worst.address]
+        logger.info('peer %s evicted (peer list full)', worst.address)
+        return True
+
+
+    def remove(self, address):
+        with self.lock:
+            return self.peers.pop(address, None) is not None
+
+
+    def __contains__(self, address):
+        return address in self.peers
+
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.peers))
+
+
+    def __len__(self):
+        return len(self.peers)
+
+
+    def record_success(self, address, latency, height=None):
+        """
+        Enregistre une réponse d'un pair (envoi, vérification, synchronisation)
+
+        :param latency: durée de la requête (secondes)
+        :param height: hauteur de la chaine du pair si connue
+        """
+        with self.lock:
+            peer = self.peers.get(address)
+            if peer is None:
+                return
+            peer.latency = latency if peer.latency is None \
+                else (1 - LATENCY_WEIGHT) * peer.latency + LATENCY_WEIGHT * latency
+            peer.failures = 0
+            peer.successes += 1
+            peer.retry_at = 0.0
+            peer.last_seen = time()
+            if height is not None:
+                peer.height = height
+
+
+    def record_failure(self, address, error=None):
+        """
+        Enregistre un échec (pas de réponse) : le pair est mis en attente, puis oublié s'il a été appris
+        par gossip et a échoué max_failures fois de suite
+
+        :return <boolean>: Vrai si le pair a été oublié
+        """
+        with self.lock:
+            peer = self.peers.get(address)
+            if peer is None:
+                return False
+            peer.failures += 1
+            peer.total_failures += 1
+            peer.last_error = str(error) if error is not None else None
+            peer.retry_at = time() + min(MAX_BACKOFF, self.backoff * 2 ** (peer.failures - 1))
+            if not peer.pinned and peer.failures >= self.max_failures:
+                del self.peers[address]
+                now = time()
+                self.forgotten = {a: until for a, until in self.forgotten.items() if until > now}
+                self.forgotten[address] = now + MAX_BACKOFF
+                logger.info('peer %s evicted after %d failures: %s', address, peer.failures, peer.last_error)
+                return True
+            return False
+
+
+    def available(self):
+        """
+        Retourne les pairs qui ne sont pas en attente, les meilleurs d'abord
+        """
+        now = time()
+        with self.lock:
+            peers = [peer for peer in self.peers.values() if peer.retry_at <= now]
+            return [peer.address for peer in sorted(peers, key=Peer.rank)]
+
+
+    def select(self, count=None):
+        """
+        Retourne les pairs destinataires d'un envoi (fanout au plus) : la moitié parmi les meilleurs pairs
+        disponibles, le reste tiré au hasard parmi les autres (si tous les noeuds préfèrent les mêmes pairs,
+        les autres sont quand même atteints par relais)
+        """
+        addresses = self.available()
+        count = count or self.fanout
+        if len(addresses) <= count:
+            return addresses
+        best = count - count // 2
+        return addresses[:best] + random.sample(addresses[best:], count - best)
+
+
+    def best_height(self):
+        """
+        Retourne la plus grande hauteur de chaine des pairs disponibles, None si aucune n'est connue
+        """
+        now = time()
+        with self.lock:
+            heights = [peer.height for peer in self.peers.values() if peer.retry_at <= now and peer.height is not None]
+        return max(heights) if heights else None
+
+
+    def get_peers(self):
+        """
+        Retourne l'état de chaque pair (latence, échecs, hauteur...), les meilleurs d'abord
+        """
+        with self.lock:
+            return [peer.to_dict() for peer in sorted(self.peers.values(), key=Peer.rank)]
+
+
+    def gossip_peers(self):
+        """
+        Retourne les adresses partagées lors d'un échange : les meilleurs pairs disponibles et le noeud lui-même
+        """
+        addresses = self.available()[:GOSSIP_SIZE]
+        if self.address is not None:
+            addresses.append(self.address)
+        return addresses
+
+
+    def merge(self, addresses):
+        """
+        Ajoute les pairs reçus d'un autre noeud (appris par gossip)
+
+        :return <int>: nombre de nouveaux pairs
+        """
+        if not isinstance(addresses, list):
+            return 0
+        return sum(self.add(address, pinned=False) for address in addresses[:GOSSIP_SIZE + 1])
+
+
+    def check(self, address):
+        """
+        Vérifie un pair (/chain/info) : latence et hauteur, ou échec
+
+        :return <boolean>: Vrai si le pair a répondu
+        """
+        start = perf_counter()
+        try:
+            response = self.session.get('http://{}/chain/info'.format(address), timeout=self.timeout)
+            response.raise_for_status()
+            height = response.json()['height']
+        except (requests.RequestException, ValueError, KeyError) as e:
+            self.record_failure(address, e)
+            return False
+        self.record_success(address, perf_counter() - start, height)
+        return True
+
+
+    def exchange(self, address):
+        """
+        Echange les listes de pairs avec un pair (POST /peers)
+
+        :return <int>: nombre de nouveaux pairs appris, None si le pair n'a pas répondu
+        """
+        start = perf_counter()
+        try:
+            response = self.session.post('http://{}/peers'.format(address), json={'peers': self.gossip_peers()},
+                                         timeout=self.timeout)
+            response.raise_for_status()
+            addresses = response.json().get('peers')
+        except (requests.RequestException, ValueError, AttributeError) as e:
+            self.record_failure(address, e)
+            return None
+        self.record_success(address, perf_counter() - start)
+        return self.merge(addresses)
+
+
+    def run_once(self):
+        """
+        Un tour de gestion des pairs : vérifie les pairs disponibles (en parallèle)
+        puis échange les listes de pairs avec l'un d'eux, tiré au hasard
+        """
+        addresses = self.available()
+        if not addresses:
+            return
+        with ThreadPoolExecutor(min(MAX_WORKERS, len(addresses))) as executor:
+            answered = [a for a, ok in zip(addresses, executor.map(self.check, addresses)) if ok]
+        if answered:
+            self.exchange(random.choice(answered))
+
+
+    def start(self, interval=GOSSIP_INTERVAL, callback=None):
+        """
+        Lance les tours de gestion des pairs en arrière-plan (toutes les interval secondes)
+
+        :param callback: fonction optionnelle appelée après chaque tour
+                         (ex: rattrapage de la chaine si un pair est plus haut, voir best_height)
+        """
+        if self.thread is not None:
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._loop, args=(interval, callback), daemon=True)
+        self.thread.start()
+
+
+    def _loop(self, interval, callback):
+        while not self.stopped.wait(interval):
+            self.run_once()
+            if callback is not None:
+                callback()
+
+
+    def stop(self):
+        self.stopped.set()
+        self.thread = None
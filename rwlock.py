@@ -0,0 +1,82 @@
+from contextlib import contextmanager
+import threading
+
+
+# Verrou lecteurs/écrivain
+class RWLock():
+
+    def __init__(self):
+        """
+        Plusieurs lecteurs en même temps, un seul écrivain (sans lecteur)
+            - les lectures (courtes) ne sont bloquées que pendant une écriture
+            - l'écrivain peut reprendre le verrou (écriture ou lecture) sans se bloquer lui-même
+
+        Usage :
+            with lock.read():
+                ...
+            with lock.write():
+                ...
+        """
+        self.condition = threading.Condition(threading.Lock())
+        self.readers = 0
+        # thread qui détient le verrou en écriture et nombre de prises (réentrant)
+        self.writer = None
+        self.writer_depth = 0
+
+
+    def acquire_read(self):
+        with self.condition:
+            if self.writer == threading.get_ident():
+                self.writer_depth += 1
+                return
+            while self.writer is not None:
+                self.condition.wait()
+            self.readers += 1
+
+
+    def release_read(self):
+        with self.condition:
+            if self.writer == threading.get_ident():
+                self.writer_depth -= 1
+                return
+            self.readers -= 1
+            if self.readers == 0:
+                self.condition.notify_all()
+
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        with self.condition:
+            if self.writer == me:
+                self.writer_depth += 1
+                return
+            while self.writer is not None or self.readers:
+                self.condition.wait()
+            self.writer = me
+            self.writer_depth = 1
+
+
+    def release_write(self):
+        with self.condition:
+            self.writer_depth -= 1
+            if self.writer_depth == 0:
+                self.writer = None
+                self.condition.notify_all()
+
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
@@ -0,0 +1,185 @@
+import hashlib as hl
+import struct
+
+from account_state import AccountState
+from codec import pack_value, unpack_value
+
+"""
+Snapshots de l'état des comptes (démarrage rapide d'un nouveau noeud)
+
+Un snapshot contient le solde (reçu - envoyé, comme get_balance) de chaque compte non vide après le bloc
+d'une hauteur donnée, et le hash de ce bloc. Son encodage binaire est canonique (comptes triés) :
+le hash du snapshot (sha256 de l'encodage) l'engage entièrement, deux noeuds à la même hauteur
+de la même chaine produisent le même hash.
+
+Un noeud démarré depuis un snapshot garde seulement les derniers blocs jusqu'au snapshot
+(ancres : fenêtre d'ajustement de la difficulté) puis les blocs suivants. Les blocs jusqu'au snapshot
+ne sont ni vérifiés ni remplaçables (le snapshot est de confiance).
+"""
+
+SNAPSHOT_VERSION = 1
+# nombre de blocs entre deux snapshots produits par le noeud
+SNAPSHOT_INTERVAL = 1000
+
+_LENGTH = struct.Struct('<I')
+
+
+def chain_base(chain):
+    """
+    Retourne la hauteur du premier bloc disponible d'une chaine (0 sauf chaine démarrée depuis un snapshot)
+    """
+    return getattr(chain, 'base', 0)
+
+
+# Soldes des comptes à une hauteur
+class StateSnapshot():
+
+    def __init__(self, height, block_hash, balances):
+        """
+        :param height: hauteur du dernier bloc pris en compte
+        :param block_hash: hash de ce bloc
+        :param balances: dict clé publique -> solde (comptes non vides)
+        """
+        self.height = height
+        self.block_hash = block_hash
+        self.balances = balances
+        self._hash = None
+        self._data = None
+
+
+    @staticmethod
+    def from_state(height, block_hash, state):
+        """
+        Crée le snapshot de l'index des soldes (<AccountState>) à la hauteur height
+        """
+        balances = {}
+        for account in set(state.received) | set(state.sent):
+            balance = state.balance(account)
+            if balance:
+                balances[account] = balance
+        return StateSnapshot(height, block_hash, balances)
+
+
+    def to_state(self):
+        """
+        Retourne l'index des soldes (<AccountState>) correspondant au snapshot
+        """
+        state = AccountState()
+        state.received = dict(self.balances)
+        return state
+
+
+    def encode(self):
+        if self._data is None:
+            out = bytearray()
+            out.append(SNAPSHOT_VERSION)
+            pack_value(self.height, out)
+            pack_value(self.block_hash, out)
+            out += _LENGTH.pack(len(self.balances))
+            for account in sorted(self.balances):
+                pack_value(account, out)
+                pack_value(self.balances[account], out)
+            self._data = bytes(out)
+        return self._data
+
+
+    @staticmethod
+    def decode(data):
+        """
+        Décode un snapshot encodé par encode
+
+        :raise ValueError: version inconnue ou données tronquées
+        """
+        if not data or data[0] != SNAPSHOT_VERSION:
+            raise ValueError('Version de snapshot inconnue')
+        try:
+            height, offset = unpack_value(data, 1)
+            block_hash, offset = unpack_value(data, offset)
+            count = _LENGTH.unpack_from(data, offset)[0]
+            offset += _LENGTH.size
+            balances = {}
+            for _ in range(count):
+                account, offset = unpack_value(data, offset)
+                balances[account], offset = unpack_value(data, offset)
+        except struct.error:
+            raise ValueError('Snapshot tronqué')
+        if not isinstance(height, int) or not isinstance(block_hash, str):
+            raise ValueError('Snapshot invalide')
+        return StateSnapshot(height, block_hash, balances)
+
+
+    def get_hash(self):
+        """
+        Retourne le hash SHA256 du snapshot encodé (engagement sur la hauteur, le bloc et tous les soldes)
+        """
+        if self._hash is None:
+            self._hash = hl.sha256(self.encode()).hexdigest()
+        return self._hash
+
+
+    def to_dict(self):
+        return {
+            'height': self.height,
+            'block_hash': self.block_hash,
+            'hash': self.get_hash(),
+            'accounts': len(self.balances),
+            'size': len(self.encode())
+        }
+
+
+# Chaine en mémoire d'un noeud démarré depuis un snapshot
+class PrunedChain():
+
+    def __init__(self, base, blocks):
+        """
+        Séquence de blocs (comme une liste) indexée par hauteur, sans les blocs avant base
+
+        :param base: hauteur du premier bloc
+        :param blocks: liste de <Block> à partir de la hauteur base
+        """
+        self.base = base
+        self.blocks = list(blocks)
+
+
+    def __len__(self):
+        return self.base + len(self.blocks)
+
+
+    def _position(self, height):
+        if height < 0:
+            height += len(self)
+        if not self.base <= height < len(self):
+            raise IndexError('block {} not available (chain starts at {})'.format(height, self.base))
+        return height - self.base
+
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self.blocks[self._position(height)] for height in range(*item.indices(len(self)))]
+        return self.blocks[self._position(item)]
+
+
+    def __iter__(self):
+        return iter(self.blocks)
+
+
+    def __reversed__(self):
+        return reversed(self.blocks)
+
+
+    def __delitem__(self, item):
+        # Seule la suppression de la fin de la chaine est possible (del chain[height:])
+        if not isinstance(item, slice) or item.stop is not None or item.step is not None:
+            raise TypeError('only tail deletion (del chain[height:]) is supported')
+        start = item.start or 0
+        if start < 0:
+            start += len(self)
+        self.blocks = self.blocks[:max(0, start - self.base)]
+
+
+    def append(self, block):
+        self.blocks.append(block)
+
+
+    def extend(self, blocks):
+        self.blocks.extend(blocks)
@@ -0,0 +1,517 @@
+from collections import OrderedDict
+import json
+import mmap
+import os
+import struct
+import zlib
+
+from codec import encode_block, decode_block, encode_transactions, decode_transactions
+
+"""
+Stockage persistant de la blockchain
+
+Dossier de données :
+    - blocks-XXXXX.dat : segments du journal des blocs (ajout en fin de fichier uniquement)
+      chaque enregistrement = en-tête (taille, crc32, hash du bloc) + bloc encodé (codec.py)
+    - index.dat : une entrée de taille fixe par hauteur (segment, position, taille, hash du bloc)
+      lu via mmap au démarrage, les blocs ne sont décodés qu'à la demande
+    - mempool.dat : transactions en cours (écrit à la fermeture)
+    - state.json : index des soldes et travail cumulé à une hauteur donnée (évite de rejouer la chaine)
+      (écrit à l'arrêt et à chaque checkpoint, voir BlockStore.checkpoint)
+    - txindex.db : index des transactions et historiques des comptes (SQLite, mis à jour à chaque bloc,
+      voir chain_index.StoredChainIndex)
+    - snapshot.dat : dernier snapshot des soldes produit par le noeud (snapshot.py)
+    - bootstrap.json : noeud démarré depuis un snapshot, hauteur du premier bloc stocké et snapshot de départ
+      (index.dat commence alors à cette hauteur)
+"""
+
+# taille maximale d'un segment avant d'en créer un nouveau
+SEGMENT_SIZE = 64 * 1024 * 1024
+# nombre de blocs décodés gardés en mémoire
+BLOCK_CACHE_SIZE = 1024
+
+# Politiques d'écriture sur disque (fsync)
+FSYNC_ALWAYS = 'always'   # après chaque bloc
+FSYNC_BATCH = 'batch'     # tous les fsync_interval blocs et à la fermeture
+FSYNC_NEVER = 'never'     # laissé au système
+FSYNC_POLICIES = (FSYNC_ALWAYS, FSYNC_BATCH, FSYNC_NEVER)
+
+_RECORD_HEADER = struct.Struct('<II32s')     # taille, crc32, hash
+_INDEX_ENTRY = struct.Struct('<IQI32s')      # segment, position, taille, hash
+
+
+def _hash_bytes(block_hash):
+    return bytes.fromhex(block_hash) if block_hash else bytes(32)
+
+
+# Journal de blocs
+class BlockStore():
+
+    def __init__(self, path, fsync=FSYNC_BATCH, fsync_interval=100, segment_size=SEGMENT_SIZE):
+        """
+        Ouvre (ou crée) le stockage et répare une éventuelle fin de fichier incomplète (crash)
+
+        :param path: dossier de données
+        :param fsync: politique d'écriture (always, batch, never)
+        :param fsync_interval: nombre de blocs entre deux fsync (politique batch)
+        :param segment_size: taille maximale d'un segment
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError('fsync doit valoir {}'.format(', '.join(FSYNC_POLICIES)))
+        self.path = path
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.segment_size = segment_size
+        self.index_path = os.path.join(path, 'index.dat')
+        # incrémenté à chaque suppression de blocs : les vues de la chaine (StoredChain.view) antérieures
+        # ne sont plus lisibles (les hauteurs supprimées peuvent contenir d'autres blocs)
+        self.generation = 0
+        os.makedirs(path, exist_ok=True)
+        self._open()
+
+
+    def _open(self):
+        self.unsynced = 0
+        self._recover()
+        # hauteur du premier bloc stocké (0 sauf noeud démarré depuis un snapshot)
+        bootstrap = self.load_bootstrap()
+        self.base = bootstrap['base'] if bootstrap is not None else 0
+
+        # Index existant lu via mmap, les nouvelles entrées sont gardées en mémoire
+        self.index_file = open(self.index_path, 'ab')
+        self.mapped = None
+        self.mapped_count = 0
+        size = os.path.getsize(self.index_path)
+        if size:
+            with open(self.index_path, 'rb') as f:
+                self.mapped = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+            self.mapped_count = size // _INDEX_ENTRY.size
+        self.entries = []
+
+        # hash -> hauteur, construit à la première recherche par hash
+        self.heights = None
+        self.cache = OrderedDict()
+
+        last = self.entry(len(self) - 1) if len(self) > self.base else None
+        self.segment = last[0] if last else 0
+        self.segment_file = open(self._segment_path(self.segment), 'ab')
+
+
+    def _segment_path(self, segment):
+        return os.path.join(self.path, 'blocks-{:05d}.dat'.format(segment))
+
+
+    def _recover(self):
+        """
+        Réparation après un arrêt brutal :
+            - supprime une entrée d'index incomplète
+            - supprime les entrées d'index dont le bloc n'est pas entièrement écrit
+            - réindexe les blocs complets écrits après la dernière entrée d'index
+            - tronque la fin incomplète (torn tail) du dernier segment
+        """
+        if not os.path.exists(self.index_path):
+            open(self.index_path, 'wb').close()
+        size = os.path.getsize(self.index_path)
+        count = size // _INDEX_ENTRY.size
+
+        with open(self.index_path, 'r+b') as index:
+            # Retire les entrées qui pointent vers un bloc absent ou corrompu
+            while count:
+                index.seek((count - 1) * _INDEX_ENTRY.size)
+                segment, offset, length, _ = _INDEX_ENTRY.unpack(index.read(_INDEX_ENTRY.size))
+                if self._read_record(segment, offset) is not None:
+                    break
+                count -= 1
+            index.truncate(count * _INDEX_ENTRY.size)
+
+            if count:
+                index.seek((count - 1) * _INDEX_ENTRY.size)
+                segment, offset, length, _ = _INDEX_ENTRY.unpack(index.read(_INDEX_ENTRY.size))
+                end = offset + _RECORD_HEADER.size + length
+            else:
+                segment, end = 0, 0
+
+            # Réindexe les blocs complets non indexés puis tronque le reste
+            path = self._segment_path(segment)
+            if os.path.exists(path):
+                index.seek(count * _INDEX_ENTRY.size)
+                while True:
+                    record = self._read_record(segment, end)
+                    if record is None:
+                        break
+                    block_hash, data = record
+                    index.write(_INDEX_ENTRY.pack(segment, end, len(data), block_hash))
+                    end += _RECORD_HEADER.size + len(data)
+                with open(path, 'r+b') as f:
+                    f.truncate(end)
+            # Supprime les segments suivants (écrits après le dernier bloc valide)
+            following = segment + 1
+            while os.path.exists(self._segment_path(following)):
+                os.remove(self._segment_path(following))
+                following += 1
+
+
+    def _read_record(self, segment, offset):
+        """
+        Lit un enregistrement du journal
+
+        :return <tuple>: (hash en octets, bloc encodé), None si incomplet ou corrompu
+        """
+        path = self._segment_path(segment)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            header = f.read(_RECORD_HEADER.size)
+            if len(header) < _RECORD_HEADER.size:
+                return None
+            length, crc, block_hash = _RECORD_HEADER.unpack(header)
+            data = f.read(length)
+        if len(data) < length or zlib.crc32(data) != crc:
+            return None
+        return block_hash, data
+
+
+    def __len__(self):
+        return self.base + self.mapped_count + len(self.entries)
+
+
+    def entry(self, height):
+        """
+        Retourne l'entrée d'index (segment, position, taille, hash) d'une hauteur
+        """
+        height -= self.base
+        if height < 0:
+            raise IndexError('block {} not stored (store starts at {})'.format(height + self.base, self.base))
+        if height < self.mapped_count:
+            return _INDEX_ENTRY.unpack_from(self.mapped, height * _INDEX_ENTRY.size)
+        return self.entries[height - self.mapped_count]
+
+
+    def block_hash(self, height):
+        """
+        Retourne le hash (hexadécimal) du bloc à cette hauteur, sans lire le bloc
+        """
+        block_hash = self.entry(height)[3]
+        return block_hash.hex() if any(block_hash) else ''
+
+
+    def height_of(self, block_hash):
+        """
+        Retourne la hauteur du bloc ayant ce hash, None si inconnu
+        """
+        if self.heights is None:
+            self.heights = {self.block_hash(height): height for height in range(self.base, len(self))}
+        return self.heights.get(block_hash)
+
+
+    def read_raw(self, height):
+        """
+        Retourne le bloc encodé (binaire) à cette hauteur
+        """
+        segment, offset, length, _ = self.entry(height)
+        if segment == self.segment:
+            self.segment_file.flush()
+        with open(self._segment_path(segment), 'rb') as f:
+            f.seek(offset + _RECORD_HEADER.size)
+            return f.read(length)
+
+
+    def get(self, height):
+        """
+        Retourne le bloc (<Block>) à cette hauteur, décodé à la demande puis gardé en cache
+        """
+        if height in self.cache:
+            self.cache.move_to_end(height)
+            return self.cache[height]
+        block = decode_block(self.read_raw(height))
+        self.cache[height] = block
+        if len(self.cache) > BLOCK_CACHE_SIZE:
+            self.cache.popitem(last=False)
+        return block
+
+
+    def append(self, block, block_hash):
+        """
+        Ajoute un bloc à la fin du journal puis son entrée d'index
+
+        :param block: <Block> bloc à ajouter
+        :param block_hash: hash du bloc (hexadécimal)
+        """
+        data = encode_block(block)
+        hashed = _hash_bytes(block_hash)
+        offset = self.segment_file.tell()
+        if offset and offset + _RECORD_HEADER.size + len(data) > self.segment_size:
+            self._sync()
+            self.segment_file.close()
+            self.segment += 1
+            self.segment_file = open(self._segment_path(self.segment), 'ab')
+            offset = 0
+
+        self.segment_file.write(_RECORD_HEADER.pack(len(data), zlib.crc32(data), hashed))
+        self.segment_file.write(data)
+        # Le bloc est écrit avant son entrée d'index : un crash entre les deux est réparé par _recover
+        self.segment_file.flush()
+        entry = (self.segment, offset, len(data), hashed)
+        self.index_file.write(_INDEX_ENTRY.pack(*entry))
+        self.entries.append(entry)
+
+        height = len(self) - 1
+        self.cache[height] = block
+        if len(self.cache) > BLOCK_CACHE_SIZE:
+            self.cache.popitem(last=False)
+        if self.heights is not None:
+            self.heights[block_hash] = height
+
+        self.unsynced += 1
+        if self.fsync == FSYNC_ALWAYS or (self.fsync == FSYNC_BATCH and self.unsynced >= self.fsync_interval):
+            self._sync()
+
+
+    def truncate(self, height):
+        """
+        Supprime les blocs à partir de cette hauteur (remplacement de chaine)
+        """
+        if height >= len(self):
+            return
+        # avant toute modification : une lecture en cours depuis une vue voit le changement
+        self.generation += 1
+        segment, offset, _, _ = self.entry(height)
+        self.close()
+        for following in range(segment + 1, self.segment + 1):
+            os.remove(self._segment_path(following))
+        with open(self._segment_path(segment), 'r+b') as f:
+            f.truncate(offset)
+        with open(self.index_path, 'r+b') as f:
+            f.truncate(max(0, height - self.base) * _INDEX_ENTRY.size)
+        self._open()
+
+
+    def set_base(self, height, snapshot):
+        """
+        Démarrage depuis un snapshot : le stockage (vide) commence à la hauteur height
+
+        :param snapshot: snapshot de départ encodé (snapshot.py)
+        """
+        if len(self) != self.base:
+            raise ValueError('Le stockage doit être vide')
+        data = {'base': height, 'snapshot': snapshot.hex()}
+        self._write_atomic('bootstrap.json', json.dumps(data).encode())
+        self.base = height
+        self.heights = None
+        self.cache.clear()
+
+
+    def load_bootstrap(self):
+        """
+        Retourne la hauteur du premier bloc et le snapshot de départ (dictionnaire), None si la chaine
+        commence au bloc de genèse
+        """
+        path = os.path.join(self.path, 'bootstrap.json')
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            data = json.loads(f.read())
+        data['snapshot'] = bytes.fromhex(data['snapshot'])
+        return data
+
+
+    def _sync(self):
+        self.segment_file.flush()
+        self.index_file.flush()
+        if self.fsync != FSYNC_NEVER:
+            os.fsync(self.segment_file.fileno())
+            os.fsync(self.index_file.fileno())
+        self.unsynced = 0
+
+
+    def close(self):
+        self._sync()
+        self.segment_file.close()
+        self.index_file.close()
+        if self.mapped is not None:
+            self.mapped.close()
+            self.mapped = None
+
+
+    def save_mempool(self, transactions):
+        """
+        Sauvegarde les transactions en cours (écriture atomique)
+        """
+        self._write_atomic('mempool.dat', encode_transactions(transactions))
+
+
+    def load_mempool(self):
+        """
+        Retourne les transactions en cours sauvegardées (liste vide si aucune)
+        Le fichier est supprimé après lecture : après un crash, on ne recharge pas
+        des transactions qui ont pu être minées depuis la dernière sauvegarde
+        """
+        path = os.path.join(self.path, 'mempool.dat')
+        if not os.path.exists(path):
+            return []
+        with open(path, 'rb') as f:
+            transactions = decode_transactions(f.read())
+        os.remove(path)
+        return transactions
+
+
+    def save_state(self, height, block_hash, state, work=None):
+        """
+        Sauvegarde l'index des soldes calculé jusqu'à la hauteur height (incluse)
+
+        :param work: travail cumulé de la chaine jusqu'à cette hauteur (optionnel)
+        """
+        data = {'height': height, 'hash': block_hash, 'received': state.received, 'sent': state.sent}
+        if work is not None:
+            data['work'] = work
+        self._write_atomic('state.json', json.dumps(data).encode())
+
+
+    def load_state(self):
+        """
+        Retourne l'index des soldes sauvegardé (dictionnaire), None si aucun
+        """
+        path = os.path.join(self.path, 'state.json')
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return json.loads(f.read())
+
+
+    def checkpoint(self, height, block_hash, state, work=None):
+        """
+        Sauvegarde l'index des soldes à jour jusqu'à la hauteur height (incluse)
+        Les blocs jusqu'à cette hauteur sont d'abord écrits sur disque (fsync) : après un crash,
+        l'index sauvegardé correspond à des blocs stockés et seuls les blocs suivants sont rejoués
+        """
+        self._sync()
+        self.save_state(height, block_hash, state, work)
+
+
+    def save_snapshot(self, data):
+        """
+        Sauvegarde le dernier snapshot des soldes produit (encodé, écriture atomique)
+        """
+        self._write_atomic('snapshot.dat', data)
+
+
+    def load_snapshot(self):
+        """
+        Retourne le dernier snapshot sauvegardé (encodé), None si aucun
+        """
+        path = os.path.join(self.path, 'snapshot.dat')
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+
+    def _write_atomic(self, name, data):
+        path = os.path.join(self.path, name)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+            f.flush()
+            if self.fsync != FSYNC_NEVER:
+                os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+
+# Chaine de blocs stockée sur disque
+class StoredChain():
+
+    def __init__(self, store, hash_block, generation=None):
+        """
+        Séquence de blocs (comme une liste) lue à la demande dans le BlockStore
+
+        :param store: <BlockStore>
+        :param hash_block: fonction retournant le hash d'un bloc
+        :param generation: génération du stockage à laquelle la séquence est figée (voir view), None sinon
+        """
+        self.store = store
+        self.hash_block = hash_block
+        self.generation = generation
+
+
+    def view(self):
+        """
+        Retourne une vue de la chaine figée à son état actuel, lisible hors du verrou (Blockchain.snapshot) :
+        si des blocs sont supprimés ensuite (changement de chaine), toute lecture depuis la vue lève IndexError
+        au lieu de mélanger les blocs de l'ancienne et de la nouvelle chaine
+        """
+        return StoredChain(self.store, self.hash_block, self.store.generation)
+
+
+    def _read(self, read, height):
+        # Lit un bloc puis vérifie que la chaine n'a pas changé pendant la lecture (vue seulement)
+        if self.generation is None:
+            return read(height)
+        try:
+            value = read(height)
+        except (ValueError, OSError):
+            # fichiers fermés ou tronqués par une suppression en cours
+            self._check()
+            raise
+        self._check()
+        return value
+
+
+    def _check(self):
+        if self.store.generation != self.generation:
+            raise IndexError('blockchain changed since the snapshot (blocks replaced)')
+
+
+    def read_raw(self, height):
+        """
+        Retourne le bloc encodé (binaire) à cette hauteur, lu tel quel dans le stockage
+        """
+        return self._read(self.store.read_raw, height)
+
+
+    @property
+    def base(self):
+        # hauteur du premier bloc stocké (voir BlockStore.set_base)
+        return self.store.base
+
+
+    def __len__(self):
+        return len(self.store)
+
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self._read(self.store.get, height) for height in range(*item.indices(len(self)))]
+        if item < 0:
+            item += len(self)
+        if not self.store.base <= item < len(self):
+            raise IndexError('block index out of range')
+        return self._read(self.store.get, item)
+
+
+    def __iter__(self):
+        for height in range(self.store.base, len(self)):
+            yield self._read(self.store.get, height)
+
+
+    def __reversed__(self):
+        for height in reversed(range(self.store.base, len(self))):
+            yield self._read(self.store.get, height)
+
+
+    def __delitem__(self, item):
+        # Seule la suppression de la fin de la chaine est possible (del chain[height:])
+        if not isinstance(item, slice) or item.stop is not None or item.step is not None:
+            raise TypeError('only tail deletion (del chain[height:]) is supported')
+        start = item.start or 0
+        if start < 0:
+            start += len(self)
+        self.store.truncate(max(0, start))
+
+
+    def append(self, block):
+        self.store.append(block, self.hash_block(block))
+
+
+    def extend(self, blocks):
+        for block in blocks:
+            self.append(block)
@@ -0,0 +1,247 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from time import perf_counter
+
+import requests
+
+from codec import decode_block_stream, CONTENT_TYPE
+from snapshot import StateSnapshot
+
+# nombre d'en-têtes demandés par requête
+HEADERS_BATCH = 2000
+# nombre de blocs demandés par requête
+BLOCKS_BATCH = 200
+# délai maximal d'une requête vers un noeud (secondes)
+TIMEOUT = 10.0
+# nombre de téléchargements simultanés
+MAX_WORKERS = 4
+
+
+# Synchronisation de la chaine avec les autres noeuds
+class ChainSynchronizer():
+
+    def __init__(self, blockchain, timeout=TIMEOUT, max_workers=MAX_WORKERS):
+        """
+        Rattrape la chaine avec le plus de travail cumulé connue des autres noeuds (pas la plus longue :
+        des dates décalées font baisser la difficulté, voir difficulty.block_work) :
+            - demande la hauteur et le travail cumulé de chaque noeud (/chain/info)
+            - cherche le bloc commun avec le noeud qui a le plus de travail via les en-têtes (/headers)
+            - télécharge les blocs manquants par plages, en parallèle depuis plusieurs noeuds (/blocks)
+            - vérifie uniquement les blocs après le bloc commun (qui doivent avoir plus de travail
+              que les blocs remplacés), puis remplace la fin de la chaine
+
+        :param blockchain: <Blockchain> blockchain du noeud
+        :param timeout: délai maximal d'une requête (secondes)
+        :param max_workers: nombre de téléchargements simultanés
+        """
+        self.blockchain = blockchain
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.session = requests.Session()
+        # Une seule synchronisation à la fois
+        self.running = threading.Lock()
+
+
+    def _get(self, node, path, params=None):
+        response = self.session.get('http://{}{}'.format(node, path), params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response
+
+
+    def peer_info(self, node):
+        """
+        Retourne la hauteur, le travail cumulé et le hash du dernier bloc d'un noeud, None s'il ne répond pas
+        La latence et la hauteur (ou l'échec) sont enregistrées dans l'état du pair (voir peers.py)
+        """
+        start = perf_counter()
+        try:
+            info = self._get(node, '/chain/info').json()
+            height = info['height']
+            info['work'] = int(info['work'], 16)
+        except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+            self.blockchain.nodes.record_failure(node, e)
+            return None
+        self.blockchain.nodes.record_success(node, perf_counter() - start, height)
+        return info
+
+
+    def get_hashes(self, node, start, count):
+        """
+        Retourne les hash des blocs [start, start + count[ d'un noeud
+        """
+        headers = self._get(node, '/headers', {'start': start, 'count': count}).json()
+        return [header['hash'] for header in headers]
+
+
+    def get_blocks(self, node, start, count):
+        """
+        Télécharge les blocs [start, start + count[ d'un noeud (encodés en binaire)
+        """
+        response = self._get(node, '/blocks', {'start': start, 'count': count, 'format': 'binary'})
+        if response.headers.get('Content-Type', '').split(';')[0] != CONTENT_TYPE:
+            raise ValueError('Réponse inattendue de {}'.format(node))
+        return decode_block_stream(response.content)
+
+
+    def find_fork(self, node, height, base=0):
+        """
+        Cherche le nombre de blocs communs avec un noeud
+        Les en-têtes sont comparés en partant du haut de la chaine, par fenêtres de HEADERS_BATCH,
+        sans descendre sous le snapshot de départ de la chaine locale ni sous le premier bloc du noeud
+
+        :param height: hauteur du dernier bloc du noeud
+        :param base: hauteur du premier bloc disponible sur le noeud
+        :return <int>: nombre de blocs communs (hauteur du premier bloc différent), 0 si aucun
+        """
+        chain, length = self.blockchain.snapshot()
+        bottom = max(base, self.blockchain.snapshot_height())
+        top = min(length - 1, height)
+        while top >= bottom:
+            start = max(bottom, top - HEADERS_BATCH + 1)
+            hashes = self.get_hashes(node, start, top - start + 1)
+            for h in range(top, start - 1, -1):
+                if h - start < len(hashes) and hashes[h - start] == self.blockchain.hash_block(chain[h]):
+                    return h + 1
+            top = start - 1
+        return 0
+
+
+    def _download(self, ranges, expected, nodes, best):
+        """
+        Télécharge les plages de blocs en parallèle (une plage par noeud, à tour de rôle)
+        Chaque bloc doit avoir le hash annoncé par le meilleur noeud,
+        sinon la plage est redemandée à ce noeud
+        """
+        def fetch(i, start, count):
+            for node in (nodes[i % len(nodes)], best):
+                try:
+                    blocks = self.get_blocks(node, start, count)
+                except (requests.RequestException, ValueError):
+                    continue
+                if [self.blockchain.hash_block(b) for b in blocks] == expected[start:start + count]:
+                    return blocks
+            return None
+
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            futures = [executor.submit(fetch, i, start, count) for i, (start, count) in enumerate(ranges)]
+            results = [future.result() for future in futures]
+        if any(blocks is None for blocks in results):
+            return None
+        return [block for blocks in results for block in blocks]
+
+
+    def synchronize(self, nodes=None):
+        """
+        Rattrape la chaine des noeuds qui a le plus de travail cumulé
+
+        :param nodes: noeuds à interroger (par défaut les noeuds connus qui ne sont pas en attente après un échec)
+        :return <dict>: résultat (synchronized, height, fork, downloaded, info)
+        """
+        if not self.running.acquire(blocking=False):
+            return {'synchronized': False, 'info': 'Synchronization already running'}
+        try:
+            return self._synchronize(list(nodes if nodes is not None else self.blockchain.nodes.available()))
+        finally:
+            self.running.release()
+
+
+    def _synchronize(self, nodes):
+        local_height = self.blockchain.snapshot()[1] - 1
+        local_work = self.blockchain.chain_work
+        heights = {}
+        works = {}
+        bases = {}
+        for node in nodes:
+            info = self.peer_info(node)
+            if info is not None:
+                heights[node] = info['height']
+                works[node] = info['work']
+                bases[node] = info.get('base', 0)
+        if not works or max(works.values()) <= local_work:
+            return {'synchronized': False, 'height': local_height, 'info': 'Blockchain is up to date'}
+
+        best = max(works, key=works.get)
+        height = heights[best]
+        try:
+            fork = self.find_fork(best, height, bases[best])
+            # Hash attendus pour chaque bloc manquant (en-têtes du meilleur noeud)
+            expected = [None] * fork
+            for start in range(fork, height + 1, HEADERS_BATCH):
+                expected.extend(self.get_hashes(best, start, min(HEADERS_BATCH, height + 1 - start)))
+        except (requests.RequestException, ValueError):
+            return {'synchronized': False, 'height': local_height, 'info': 'Peer {} unreachable'.format(best)}
+        if fork == 0 or len(expected) != height + 1:
+            return {'synchronized': False, 'height': local_height, 'info': 'No common block with {}'.format(best)}
+
+        # Noeuds qui ont au moins la même hauteur et les blocs après le bloc commun (pour répartir les téléchargements)
+        sources = [node for node in heights if heights[node] >= height and bases[node] <= fork]
+        ranges = [(start, min(BLOCKS_BATCH, height + 1 - start)) for start in range(fork, height + 1, BLOCKS_BATCH)]
+        blocks = self._download(ranges, expected, sources, best)
+        if blocks is None:
+            return {'synchronized': False, 'height': local_height, 'info': 'Download failed'}
+
+        # La chaine a pu changer pendant le téléchargement (le travail est comparé par check_suffix)
+        chain, length = self.blockchain.snapshot()
+        if fork > length \
+                or self.blockchain.hash_block(chain[fork - 1]) != blocks[0].previous_hash:
+            return {'synchronized': False, 'height': length - 1, 'info': 'Blockchain changed during download'}
+        # Vérification hors du verrou (les autres requêtes ne sont pas bloquées)
+        tip = self.blockchain.hash_block(chain[length - 1])
+        if not self.blockchain.check_suffix(fork, blocks):
+            return {'synchronized': False, 'height': local_height, 'info': 'Invalid blocks from {}'.format(best)}
+
+        with self.blockchain.lock.write():
+            # Remplace la chaine seulement si elle n'a pas changé pendant la vérification
+            if self.blockchain.hash_block(self.blockchain.blockchain[-1]) != tip:
+                return {'synchronized': False, 'height': len(self.blockchain.blockchain) - 1,
+                        'info': 'Blockchain changed during validation'}
+            self.blockchain.switch_chain(fork, blocks)
+        return {'synchronized': True, 'height': height, 'fork': fork, 'downloaded': len(blocks),
+                'info': 'Synchronized with {}'.format(best)}
+
+
+    def bootstrap(self, node, trusted_hash=None):
+        """
+        Démarre une chaine neuve depuis le dernier snapshot des soldes d'un noeud (snapshot.py) :
+            - télécharge le snapshot (/snapshot) et vérifie son hash (trusted_hash)
+            - télécharge les derniers blocs jusqu'au snapshot (fenêtre d'ajustement de la difficulté)
+            - rattrape ensuite les blocs suivants (synchronize)
+        Le temps de démarrage dépend des blocs après le snapshot, pas de la longueur de la chaine
+
+        :param node: noeud de confiance (host:port)
+        :param trusted_hash: hash attendu du snapshot (si absent, le snapshot du noeud est accepté tel quel)
+        :return <dict>: résultat (bootstrapped, height, info, puis le résultat de la synchronisation)
+        """
+        try:
+            snapshot = StateSnapshot.decode(self._get(node, '/snapshot').content)
+        except (requests.RequestException, ValueError):
+            return {'bootstrapped': False, 'info': 'No snapshot from {}'.format(node)}
+        if trusted_hash is not None and snapshot.get_hash() != trusted_hash:
+            return {'bootstrapped': False, 'info': 'Snapshot hash mismatch'}
+
+        start = max(0, snapshot.height - self.blockchain.adjuster.window + 1)
+        blocks = []
+        try:
+            while start + len(blocks) <= snapshot.height:
+                count = min(BLOCKS_BATCH, snapshot.height + 1 - start - len(blocks))
+                received = self.get_blocks(node, start + len(blocks), count)
+                if not received:
+                    break
+                blocks.extend(received)
+        except (requests.RequestException, ValueError):
+            return {'bootstrapped': False, 'info': 'Peer {} unreachable'.format(node)}
+        if not self.blockchain.bootstrap(snapshot, blocks):
+            return {'bootstrapped': False, 'info': 'Invalid snapshot blocks or blockchain not empty'}
+
+        result = self.synchronize([node])
+        result.update({'bootstrapped': True, 'snapshot': snapshot.to_dict()})
+        return result
+
+
+    def synchronize_async(self, nodes=None):
+        """
+        Lance la synchronisation en arrière-plan (ex: bloc reçu en avance sur la chaine locale)
+        """
+        thread = threading.Thread(target=self.synchronize, args=(nodes,), daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,105 @@
+import heapq
+
+from mempool import transaction_size
+
+# Limites d'un bloc (règles de validité, identiques sur tous les noeuds)
+# taille maximale des transactions d'un bloc encodées en binaire (octets), récompense comprise
+MAX_BLOCK_BYTES = 1000000
+# nombre maximal de transactions d'un bloc, récompense comprise
+MAX_BLOCK_TRANSACTIONS = 10000
+
+
+def block_size(block):
+    """
+    Taille (octets) des transactions du bloc encodées en binaire
+    """
+    return sum(transaction_size(transaction) for transaction in block.transactions)
+
+
+def check_block_size(block):
+    """
+    Check que le bloc respecte les limites (nombre de transactions et taille)
+
+    :return <boolean>: Vrai si valide, Faux sinon
+    """
+    if len(block.transactions) > MAX_BLOCK_TRANSACTIONS:
+        return False
+    return block_size(block) <= MAX_BLOCK_BYTES
+
+
+# Construction du contenu des blocs à miner
+class BlockTemplateBuilder():
+
+    def __init__(self, max_bytes=MAX_BLOCK_BYTES, max_count=MAX_BLOCK_TRANSACTIONS):
+        """
+        Choisit les transactions en cours à mettre dans le prochain bloc :
+            - dans la limite de max_bytes octets et max_count transactions (récompense comprise)
+            - les frais par octet les plus élevés d'abord
+            - les transactions d'un même envoyeur restent dans leur ordre d'arrivée
+            - aucun envoyeur ne dépense plus que son solde validé (même règle que check_block_balances)
+        Les transactions non choisies restent en cours pour les blocs suivants
+
+        :param max_bytes: taille maximale des blocs minés (bornée par MAX_BLOCK_BYTES)
+        :param max_count: nombre maximal de transactions des blocs minés (borné par MAX_BLOCK_TRANSACTIONS)
+        """
+        self.max_bytes = min(max_bytes, MAX_BLOCK_BYTES)
+        self.max_count = min(max_count, MAX_BLOCK_TRANSACTIONS)
+
+
+    def select(self, mempool, reward, balance=None):
+        """
+        Choisit les transactions du prochain bloc
+        Le total dépensé par chaque envoyeur (montants + frais) est suivi pendant le choix : une transaction
+        que le solde validé ne couvre pas n'est pas choisie, même si les transactions en cours le dépassent
+
+        :param mempool: <Mempool> transactions en cours
+        :param reward: <Transaction> récompense du mineur (sa place est réservée)
+        :param balance: fonction qui retourne le solde validé d'un compte (None : soldes non vérifiés)
+        :return <list>: transactions choisies
+        """
+        max_bytes = self.max_bytes - transaction_size(reward)
+        max_count = self.max_count - 1
+        if max_bytes < 0 or max_count <= 0:
+            return []
+        # rang d'arrivée de chaque transaction (départage les frais égaux)
+        arrival = {transaction_id: n for n, transaction_id in enumerate(mempool.transactions)}
+
+        # Une file par envoyeur (ordre d'arrivée) ; le tas contient la première transaction de chaque file
+        queues = []
+        heap = []
+        for sender_ids in mempool.by_sender.values():
+            queue = list(sender_ids)
+            queues.append(queue)
+            heapq.heappush(heap, self._entry(mempool, queue[0], arrival, len(queues) - 1, 0))
+
+        selected = []
+        size = 0
+        # envoyeur -> total dépensé dans les transactions choisies
+        spent = {}
+        while heap and len(selected) < max_count:
+            _, _, transaction_id, queue_index, position = heapq.heappop(heap)
+            transaction = mempool.transactions[transaction_id]
+            tx_size = mempool.sizes[transaction_id]
+            if size + tx_size > max_bytes:
+                # les transactions suivantes de cet envoyeur attendront le prochain bloc (ordre conservé)
+                continue
+            if balance is not None:
+                sender = transaction.sender
+                total = spent.get(sender, 0) + transaction.cost
+                if balance(sender) < total:
+                    # solde validé insuffisant : les transactions suivantes de cet envoyeur ne sont pas choisies
+                    continue
+                spent[sender] = total
+            selected.append(transaction)
+            size += tx_size
+            queue = queues[queue_index]
+            if position + 1 < len(queue):
+                heapq.heappush(heap, self._entry(mempool, queue[position + 1], arrival, queue_index, position + 1))
+        return selected
+
+
+    @staticmethod
+    def _entry(mempool, transaction_id, arrival, queue_index, position):
+        # (- frais par octet, rang d'arrivée, id, file, position dans la file)
+        fee_rate = mempool.transactions[transaction_id].fee / mempool.sizes[transaction_id]
+        return (-fee_rate, arrival[transaction_id], transaction_id, queue_index, position)
@@ -1,13 +1,64 @@
 from collections import OrderedDict
+import hashlib as hl
+
+from keytable import keys, is_hex
+from verification import signed_payload
 
 # Transaction
 class Transaction():
-    def __init__(self, s, r, sign, am):
-        self.sender = s
-        self.receiver = r
-        self.signature = sign
+    # Pas de __dict__ : les clés sont internées (keytable) et la signature stockée en octets
+    __slots__ = ('_sender', '_receiver', '_signature', 'amount', 'fee', '_id')
+
+    def __init__(self, s, r, sign, am, fee=0):
+        self._sender = keys.intern(s)
+        self._receiver = keys.intern(r)
+        if isinstance(sign, str) and is_hex(sign):
+            sign = bytes.fromhex(sign)
+        self._signature = sign
         self.amount = am
+        # frais payés au mineur (en plus du montant), optionnels
+        self.fee = fee
+        self._id = None
+
+    @property
+    def sender(self):
+        return keys.to_hex(self._sender)
+
+    @property
+    def receiver(self):
+        return keys.to_hex(self._receiver)
+
+    @property
+    def signature(self):
+        if isinstance(self._signature, bytes):
+            return self._signature.hex()
+        return self._signature
+
+    # Total débité de l'envoyeur (montant + frais)
+    @property
+    def cost(self):
+        return self.amount + self.fee
+
+    # Champs tels que stockés (octets) pour l'encodage binaire
+    def raw_fields(self):
+        return self._sender, self._receiver, self._signature, self.amount, self.fee
 
     # Converti la transaction en un dictonnaire ordonné (hashable)
+    # Les frais n'y sont que s'ils ne sont pas nuls : le hash des anciens blocs ne change pas
     def to_ordered_dict(self):
-        return OrderedDict([('sender', self.sender), ('receiver', self.receiver), ('amount', self.amount)])
+        fields = OrderedDict([('sender', self.sender), ('receiver', self.receiver), ('amount', self.amount)])
+        if self.fee:
+            fields['fee'] = self.fee
+        return fields
+
+    # Converti la transaction en dictionnaire (JSON)
+    def to_dict(self):
+        return {'sender': self.sender, 'receiver': self.receiver, 'signature': self.signature, 'amount': self.amount,
+                'fee': self.fee}
+
+    # Identifiant de la transaction : hash du contenu signé et de la signature
+    def get_id(self):
+        if self._id is None:
+            payload = signed_payload(self.sender, self.receiver, self.amount, self.fee) + str(self.signature).encode()
+            self._id = hl.sha256(payload).hexdigest()
+        return self._id
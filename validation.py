@@ -0,0 +1,263 @@
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+
+from account_state import AccountState
+from block import genesis_block
+from codec import encode_block, decode_block
+from header import check_version
+from mining import check_block_proof
+from snapshot import chain_base
+from template import check_block_size
+from verification import verify_signature
+from wallet import Wallet
+
+# à partir de ce nombre de blocs, le PoW et les signatures sont vérifiés en parallèle
+PARALLEL_THRESHOLD = 32
+# envoyeur de la transaction récompense (dernière transaction de chaque bloc)
+REWARD_SENDER = 'Mining reward'
+
+
+def check_linkage(blocks, previous_block=None):
+    """
+    Passe séquentielle (peu coûteuse) : index consécutifs, hash précédent et version de chaque bloc
+
+    :param blocks: liste de <Block>
+    :param previous_block: <Block> bloc qui précède blocks (None si blocks commence au bloc de genèse)
+    :return <int>: position du premier bloc invalide, None si tout est valide
+    """
+    for position, block in enumerate(blocks):
+        if previous_block is None:
+            if block.get_hash() != genesis_block().get_hash():
+                return position
+        elif block.index != previous_block.index + 1 or block.previous_hash != previous_block.get_hash():
+            return position
+        elif not check_version(block, previous_block):
+            return position
+        previous_block = block
+    return None
+
+
+def check_block_work(block):
+    """
+    Vérifie la taille, le PoW (par rapport à la cible du bloc) et les signatures d'un bloc
+    (indépendamment des autres blocs)
+    La cible elle-même est vérifiée par la passe de chainage (DifficultyAdjuster.check_blocks)
+
+    :return <boolean>: Vrai si valide, Faux sinon
+    """
+    if block.index == 0:
+        return True
+    if not check_block_size(block):
+        return False
+    if not check_block_proof(block):
+        return False
+    return all(verify_signature(t.sender, t.receiver, t.amount, t.signature, t.fee) for t in block.transactions[:-1])
+
+
+def _check_encoded_blocks(encoded_blocks):
+    # Exécuté dans un processus du pool : les blocs sont transmis encodés (codec.py)
+    return all(check_block_work(decode_block(data)) for data in encoded_blocks)
+
+
+def check_amounts(transaction):
+    """
+    Vrai si le montant est un nombre strictement positif et les frais un nombre positif ou nul
+    (un montant négatif ferait payer le receveur, un booléen n'est pas un montant)
+    """
+    amount, fee = transaction.amount, transaction.fee
+    return (isinstance(amount, (int, float)) and not isinstance(amount, bool) and amount > 0
+            and isinstance(fee, (int, float)) and not isinstance(fee, bool) and fee >= 0)
+
+
+def check_block_balances(block, state, reward):
+    """
+    Vérifie les montants d'un bloc par rapport aux soldes (sans modifier l'index) :
+        - la dernière transaction (hors genèse) est la récompense du mineur (récompense + frais du bloc)
+        - montants strictement positifs et frais positifs ou nuls (check_amounts)
+        - aucun envoyeur ne dépense plus que son solde avant le bloc (montants + frais)
+
+    :param block: <Block>
+    :param state: <AccountState> soldes avant le bloc
+    :param reward: montant de la récompense de minage
+    :return <boolean>: Vrai si valide, Faux sinon
+    """
+    if block.index == 0:
+        return True
+    if not block.transactions:
+        return False
+    last = block.transactions[-1]
+    if not all(check_amounts(t) for t in block.transactions[:-1]):
+        return False
+    fees = sum(t.fee for t in block.transactions[:-1])
+    if last.sender != REWARD_SENDER or last.amount != reward + fees or last.fee:
+        return False
+    spent = {}
+    for t in block.transactions[:-1]:
+        if t.sender == REWARD_SENDER:
+            return False
+        spent[t.sender] = spent.get(t.sender, 0) + t.cost
+        if state.balance(t.sender) < spent[t.sender]:
+            return False
+    return True
+
+
+def check_block_duplicates(block, confirmed):
+    """
+    Vérifie qu'aucune transaction d'un bloc (hors récompense) n'y est deux fois
+    ni n'est déjà validée dans un bloc précédent (rejeu d'une transaction signée)
+
+    :param confirmed: fonction id de transaction -> Vrai si elle est dans un bloc précédent
+    :return <boolean>: Vrai si valide, Faux sinon
+    """
+    seen = set()
+    for t in block.transactions[:-1]:
+        transaction_id = t.get_id()
+        if transaction_id in seen or confirmed(transaction_id):
+            return False
+        seen.add(transaction_id)
+    return True
+
+
+def replay_balances(blocks, state, reward, locate=None):
+    """
+    Passe de soldes : rejoue les blocs sur l'index des soldes et refuse toute dépense supérieure au solde
+    ainsi que les transactions déjà validées (doublons, voir check_block_duplicates)
+
+    :param blocks: liste de <Block>
+    :param state: <AccountState> soldes avant le premier bloc (modifié)
+    :param reward: montant de la récompense de minage
+    :param locate: fonction optionnelle id -> (hauteur, position) dans la chaine (ChainIndex.locate) :
+                   une transaction placée avant le premier bloc est un doublon
+    :return <int>: position du premier bloc invalide, None si tout est valide
+    """
+    replayed = set()
+    first = blocks[0].index if blocks else 0
+
+    def confirmed(transaction_id):
+        if transaction_id in replayed:
+            return True
+        location = locate(transaction_id) if locate is not None else None
+        return location is not None and location[0] < first
+
+    for position, block in enumerate(blocks):
+        if not check_block_duplicates(block, confirmed):
+            return position
+        if not check_block_balances(block, state, reward):
+            return position
+        state.apply_block(block)
+        replayed.update(t.get_id() for t in block.transactions[:-1])
+    return None
+
+
+# Validation complète de la chaine
+class ChainValidator():
+
+    def __init__(self, adjuster, reward, processes=None, checkpoint_path=None,
+                 parallel_threshold=PARALLEL_THRESHOLD):
+        """
+        Valide une chaine en trois passes :
+            - chainage, cibles et dates des blocs (séquentiel, peu coûteux)
+            - PoW et signatures de chaque bloc (en parallèle, pool de processus)
+            - rejeu des soldes (séquentiel) : refuse les dépenses supérieures au solde
+
+        Le dernier bloc validé (et les soldes à cette hauteur) est sauvegardé dans checkpoint_path :
+        une nouvelle validation (ex: après redémarrage) reprend à partir de ce bloc
+
+        :param adjuster: <DifficultyAdjuster> règle d'ajustement de la cible
+        :param reward: récompense de minage (MINING_REWARD)
+        :param processes: nombre de processus (par défaut le nombre de coeurs)
+        :param checkpoint_path: fichier de sauvegarde du dernier bloc validé (optionnel)
+        :param parallel_threshold: nombre de blocs à partir duquel la vérification est parallélisée
+        """
+        self.adjuster = adjuster
+        self.reward = reward
+        self.processes = processes
+        self.checkpoint_path = checkpoint_path
+        self.parallel_threshold = parallel_threshold
+
+
+    def load_checkpoint(self, chain):
+        """
+        Retourne (hauteur validée, soldes) si le checkpoint correspond à la chaine, (None, soldes vides) sinon
+        """
+        state = AccountState()
+        if self.checkpoint_path is None or not os.path.exists(self.checkpoint_path):
+            return None, state
+        with open(self.checkpoint_path) as f:
+            checkpoint = json.load(f)
+        height = checkpoint['height']
+        if not chain_base(chain) <= height < len(chain) or chain[height].get_hash() != checkpoint['hash']:
+            return None, state
+        state.received = checkpoint['received']
+        state.sent = checkpoint['sent']
+        return height, state
+
+
+    def save_checkpoint(self, chain, state):
+        if self.checkpoint_path is None:
+            return
+        height = len(chain) - 1
+        data = {'height': height, 'hash': chain[height].get_hash(), 'received': state.received, 'sent': state.sent}
+        with open(self.checkpoint_path + '.tmp', 'w') as f:
+            json.dump(data, f)
+        os.replace(self.checkpoint_path + '.tmp', self.checkpoint_path)
+
+
+    def check_work(self, blocks):
+        """
+        Passe PoW + signatures : en parallèle si le nombre de blocs est suffisant
+
+        :return <boolean>: Vrai si tous les blocs sont valides, Faux sinon
+        """
+        if len(blocks) < self.parallel_threshold:
+            for block in blocks:
+                if block.index == 0:
+                    continue
+                if not check_block_size(block):
+                    return False
+                if not check_block_proof(block):
+                    return False
+            # signatures en un seul lot (cache du service de vérification)
+            return Wallet.verify_transactions([t for block in blocks for t in block.transactions[:-1]])
+
+        workers = self.processes or os.cpu_count() or 1
+        size = max(1, len(blocks) // (workers * 4))
+        chunks = [[encode_block(block) for block in blocks[i:i + size]] for i in range(0, len(blocks), size)]
+        with ProcessPoolExecutor(self.processes) as pool:
+            return all(pool.map(_check_encoded_blocks, chunks))
+
+
+    def validate(self, chain, snapshot=None, locate=None):
+        """
+        Valide la chaine complète (ou à partir du dernier checkpoint)
+
+        :param chain: liste de <Block> (ou StoredChain, PrunedChain)
+        :param snapshot: <StateSnapshot> de départ d'une chaine démarrée depuis un snapshot :
+                         la validation commence après le bloc du snapshot, avec ses soldes
+        :param locate: ChainIndex.locate de la chaine (optionnel) : doublons des transactions validées
+                       avant le checkpoint ou le snapshot
+        :return <boolean>: Vrai si valide, Faux sinon
+        """
+        if len(chain) == 0:
+            return False
+        height, state = self.load_checkpoint(chain)
+        if height is None and snapshot is not None:
+            height, state = snapshot.height, snapshot.to_state()
+        if height is None:
+            previous_block = None
+            blocks = chain[0:]
+        else:
+            previous_block = chain[height]
+            blocks = chain[height + 1:]
+
+        if check_linkage(blocks, previous_block) is not None:
+            return False
+        if self.adjuster.check_blocks(blocks, chain.__getitem__) is not None:
+            return False
+        if not self.check_work(blocks):
+            return False
+        if replay_balances(blocks, state, self.reward, locate) is not None:
+            return False
+        self.save_checkpoint(chain, state)
+        return True
@@ -0,0 +1,201 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import binascii
+import hashlib as hl
+import os
+
+from Crypto.PublicKey import RSA, ECC
+from Crypto.Signature import PKCS1_v1_5, eddsa
+from Crypto.Hash import SHA256
+
+import metrics
+
+
+# nombre de clés publiques (déjà parsées) gardées en cache
+KEY_CACHE_SIZE = 4096
+# nombre de signatures déjà vérifiées gardées en cache
+VERIFIED_CACHE_SIZE = 100000
+# à partir de cette taille, un lot de transactions est vérifié en parallèle (plusieurs processus)
+PARALLEL_THRESHOLD = 64
+
+# Types de clés (algorithmes de signature)
+RSA_SCHEME = 'rsa'            # RSA 1024 bits, PKCS1_v1_5 sur le SHA256 du contenu signé
+ED25519_SCHEME = 'ed25519'    # Ed25519 (RFC 8032) sur le contenu signé
+SCHEMES = (RSA_SCHEME, ED25519_SCHEME)
+# début de toute clé publique Ed25519 en DER (identifiant de l'algorithme, puis les 32 octets de la clé)
+ED25519_DER_PREFIX = '302a300506032b6570032100'
+
+
+def key_scheme(public_key):
+    """
+    Retourne le type d'une clé publique (DER en hexadécimal) : la clé contient l'identifiant de son algorithme,
+    chaque transaction est donc marquée par le type de clé de son envoyeur
+    """
+    return ED25519_SCHEME if public_key.startswith(ED25519_DER_PREFIX) else RSA_SCHEME
+
+
+def signed_payload(sender, receiver, amount, fee=0):
+    """
+    Retourne le contenu signé d'une transaction (envoyeur + receveur + montant)
+    Les frais ne sont ajoutés que s'ils ne sont pas nuls (les anciennes signatures restent valides),
+    après un séparateur pour ne pas pouvoir les confondre avec le montant
+
+    :return <bytes>: données hashées (SHA256) puis signées
+    """
+    payload = str(sender) + str(receiver) + str(amount)
+    if fee:
+        payload += ':fee:' + str(fee)
+    return payload.encode('utf8')
+
+
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def get_verifier(public_key):
+    """
+    Parse la clé publique (DER en hexadécimal) une seule fois et retourne son vérificateur
+    (PKCS1_v1_5 pour RSA, RFC 8032 pour Ed25519)
+
+    :param public_key: clé publique de l'envoyeur
+    :return <tuple>: (type de clé, vérificateur de signature)
+    """
+    key = binascii.unhexlify(public_key)
+    if key_scheme(public_key) == ED25519_SCHEME:
+        return ED25519_SCHEME, eddsa.new(ECC.import_key(key), 'rfc8032')
+    return RSA_SCHEME, PKCS1_v1_5.new(RSA.importKey(key))
+
+
+def verify_signature(sender, receiver, amount, signature, fee=0):
+    """
+    Vérifie la signature d'une transaction (sans cache de résultat)
+
+    :return <boolean>: Vrai si la signature est valide, Faux sinon
+    """
+    try:
+        scheme, verifier = get_verifier(sender)
+        payload = signed_payload(sender, receiver, amount, fee)
+        if scheme == ED25519_SCHEME:
+            # Ed25519 signe le contenu lui-même (lève ValueError si la signature est invalide)
+            verifier.verify(payload, binascii.unhexlify(signature))
+            return True
+        return verifier.verify(SHA256.new(payload), binascii.unhexlify(signature))
+    except (ValueError, TypeError, IndexError, binascii.Error):
+        # clé ou signature mal formée
+        return False
+
+
+def _verify_timed(sender, receiver, amount, signature, fee=0):
+    # verify_signature avec mesure de la durée par type de clé (si les métriques sont activées)
+    if not metrics.registry.enabled:
+        return verify_signature(sender, receiver, amount, signature, fee)
+    with metrics.verify_seconds.labels(scheme=key_scheme(sender)).time():
+        return verify_signature(sender, receiver, amount, signature, fee)
+
+
+def _verify_chunk(items):
+    # Exécuté dans un processus du pool : vérifie une partie du lot
+    return [verify_signature(*item) for item in items]
+
+
+# Service de vérification des signatures
+class SignatureVerifier():
+
+    def __init__(self, cache_size=VERIFIED_CACHE_SIZE, parallel_threshold=PARALLEL_THRESHOLD, processes=None):
+        """
+        :param cache_size: nombre de couples (signature, hash de transaction) vérifiés gardés en cache
+        :param parallel_threshold: taille de lot à partir de laquelle la vérification est parallélisée
+        :param processes: nombre de processus du pool (par défaut le nombre de coeurs)
+        """
+        self.cache_size = cache_size
+        self.parallel_threshold = parallel_threshold
+        self.processes = processes
+        self.pool = None
+        # couples (signature, hash du contenu signé) déjà vérifiés (LRU)
+        self.verified = OrderedDict()
+
+
+    @staticmethod
+    def cache_key(transaction):
+        payload = signed_payload(transaction.sender, transaction.receiver, transaction.amount, transaction.fee)
+        return (transaction.signature, hl.sha256(payload).hexdigest())
+
+
+    def _remember(self, key):
+        self.verified[key] = True
+        if len(self.verified) > self.cache_size:
+            self.verified.popitem(last=False)
+
+
+    def verify(self, transaction):
+        """
+        Vérifie la signature d'une transaction
+        Une transaction déjà vérifiée n'est pas re-vérifiée
+
+        :param transaction: <Transaction> transaction à vérifier
+        :return <boolean>: Vrai si la transaction est verifiée, Faux sinon
+        """
+        key = self.cache_key(transaction)
+        if key in self.verified:
+            self.verified.move_to_end(key)
+            metrics.verify_cache_hits.inc()
+            return True
+        valid = _verify_timed(transaction.sender, transaction.receiver, transaction.amount, transaction.signature,
+                                 transaction.fee)
+        if valid:
+            self._remember(key)
+        return valid
+
+
+    def verify_many(self, transactions):
+        """
+        Vérifie un lot de transactions
+        Les transactions déjà vérifiées sont ignorées, les autres sont vérifiées
+        en parallèle (pool de processus) si le lot est assez grand
+
+        :param transactions: liste de <Transaction>
+        :return <list>: liste de booléens (un par transaction, dans le même ordre)
+        """
+        results = [False] * len(transactions)
+        todo = []
+        for i, transaction in enumerate(transactions):
+            key = self.cache_key(transaction)
+            if key in self.verified:
+                self.verified.move_to_end(key)
+                metrics.verify_cache_hits.inc()
+                results[i] = True
+            else:
+                todo.append((i, key, transaction))
+
+        if len(todo) < self.parallel_threshold:
+            checked = [_verify_timed(t.sender, t.receiver, t.amount, t.signature, t.fee) for _, _, t in todo]
+        else:
+            items = [(t.sender, t.receiver, t.amount, t.signature, t.fee) for _, _, t in todo]
+            checked = self._verify_parallel(items)
+
+        for (i, key, _), valid in zip(todo, checked):
+            results[i] = valid
+            if valid:
+                self._remember(key)
+        return results
+
+
+    def _verify_parallel(self, items):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.processes)
+        # découpe le lot en morceaux (un par processus, plusieurs fois pour équilibrer la charge)
+        workers = self.processes or os.cpu_count() or 1
+        size = max(1, len(items) // (workers * 4))
+        chunks = [items[i:i + size] for i in range(0, len(items), size)]
+        results = []
+        for checked in self.pool.map(_verify_chunk, chunks):
+            results.extend(checked)
+        return results
+
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+
+# Service partagé par le noeud (Wallet.verify_transaction)
+verifier = SignatureVerifier()
@@ -1,17 +1,37 @@
-from Crypto.PublicKey import RSA
-from Crypto.Signature import PKCS1_v1_5
+from Crypto.PublicKey import RSA, ECC
+from Crypto.Signature import PKCS1_v1_5, eddsa
 from Crypto.Hash import SHA256
 import Crypto.Random
 import binascii
 
+from verification import verifier, signed_payload, RSA_SCHEME, ED25519_SCHEME, SCHEMES
+
 # Portefeuille (Classe Wallet)
 class Wallet:
 
-    def __init__(self):
+    def __init__(self, scheme=RSA_SCHEME):
+        """
+        :param scheme: type des clés créées (RSA_SCHEME ou ED25519_SCHEME, voir verification.py)
+        """
+        if scheme not in SCHEMES:
+            raise ValueError('Type de clé inconnu : {}'.format(scheme))
+        self.scheme = scheme
         self.private_key = None
         self.public_key = None
 
 
+    @property
+    def private_key(self):
+        return self._private_key
+
+
+    @private_key.setter
+    def private_key(self, value):
+        # la clé privée n'est parsée qu'une fois (à la première signature) puis gardée
+        self._private_key = value
+        self._signer = None
+
+
     def hasKeys(self):
         return self.private_key != None
 
@@ -21,6 +41,10 @@ class Wallet:
         Genere la paire de clés (privée/public)
 
         """
+        if self.scheme == ED25519_SCHEME:
+            privateK = ECC.generate(curve='ed25519')
+            return (binascii.hexlify(privateK.export_key(format='DER')).decode('ascii'),
+                    binascii.hexlify(privateK.public_key().export_key(format='DER')).decode('ascii'))
         privateK = RSA.generate(1024, Crypto.Random.new().read)
         publicK = privateK.publickey()
         return (binascii.hexlify(privateK.exportKey(format='DER')).decode('ascii'), binascii.hexlify(publicK.exportKey(format='DER')).decode('ascii'))
@@ -35,36 +59,61 @@ class Wallet:
         self.private_key = private_key
         self.public_key = public_key
 
-   
 
-    def sign_transaction(self, sender, receiver, amount):
+    def get_signer(self):
+        """
+        Retourne le signataire de la clé privée (parsée une seule fois)
+        Le type de clé est lu dans la clé elle-même (une clé importée peut être RSA ou Ed25519)
+        """
+        if self._signer is None:
+            key = binascii.unhexlify(self.private_key)
+            try:
+                self._signer = (RSA_SCHEME, PKCS1_v1_5.new(RSA.importKey(key)))
+            except ValueError:
+                self._signer = (ED25519_SCHEME, eddsa.new(ECC.import_key(key), 'rfc8032'))
+        return self._signer
+
+
+    def sign_transaction(self, sender, receiver, amount, fee=0):
         """
         Créé la signature de la transaction
-        Utilise l'envoyeur, le receveur et le montant pour créer un SHA256
-        Signer ensuite par la clé privée
+        Utilise l'envoyeur, le receveur, le montant (et les frais s'il y en a) :
+            - RSA : SHA256 du contenu, signé par la clé privée
+            - Ed25519 : contenu signé directement par la clé privée
 
 
         """
-        signer = PKCS1_v1_5.new(RSA.importKey(binascii.unhexlify(self.private_key)))
-        h = SHA256.new((str(sender) + str(receiver) + str(amount)).encode('utf8'))
-        signature = signer.sign(h)
+        scheme, signer = self.get_signer()
+        payload = signed_payload(sender, receiver, amount, fee)
+        if scheme == ED25519_SCHEME:
+            signature = signer.sign(payload)
+        else:
+            signature = signer.sign(SHA256.new(payload))
 
         #converti binaire en hexadecimal
         return binascii.hexlify(signature).decode('ascii')
 
 
+    @staticmethod
     def verify_transaction(transaction):
         """
         Verification de la transaction
         Hash des informations de la transaction afin d'obtenir la signature et
-        comparaison de la signature avec celle créée. 
+        comparaison de la signature avec celle créée.
+        Passe par le service de vérification (clés parsées et signatures déjà vérifiées en cache)
 
         :param <Transaction>: transaction à vérifier
         :return <boolean>: Vrai si la transaction est verifié, Faux sinon
         """
+        return verifier.verify(transaction)
 
-        public_key = RSA.importKey(binascii.unhexlify(transaction.sender))
-        verifier = PKCS1_v1_5.new(public_key)
-        h = SHA256.new((str(transaction.sender) + str(transaction.receiver) + str(transaction.amount)).encode('utf8'))
 
-        return verifier.verify(h, binascii.unhexlify(transaction.signature))
+    @staticmethod
+    def verify_transactions(transactions):
+        """
+        Verification d'un lot de transactions (en parallèle si le lot est grand)
+
+        :param transactions: liste de <Transaction>
+        :return <boolean>: Vrai si toutes les transactions sont verifiées, Faux sinon
+        """
+        return all(verifier.verify_many(transactions))